@@ -0,0 +1,63 @@
+"""Benchmarks for pypercube's hot paths.
+
+Run a single benchmark from the repository root, eg::
+
+    python -m benchmarks.bench_decoding
+
+or the whole suite, which writes machine-readable results::
+
+    python -m benchmarks.run --output results.json
+"""
+import timeit
+
+
+def best_of(func, repeat=3):
+    """The fastest of `repeat` runs of `func`, in seconds."""
+    return min(timeit.repeat(func, repeat=repeat, number=1))
+
+
+def calibrate(func, min_time=0.2):
+    """How many calls of `func` take at least `min_time` seconds.
+
+    Like `timeit.Timer.autorange`, which Python 2 lacks: tries 1, 2, 5, 10,
+    20, 50... calls until they take long enough.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        for multiple in (1, 2, 5):
+            if timer.timeit(number * multiple) >= min_time:
+                return number * multiple
+        number *= 10
+
+
+def measure(name, func, ops=1, repeat=5, min_time=0.2, **params):
+    """Time `func` and describe the result for the suite's JSON output.
+
+    `func` is called enough times in a row for each run to take about
+    `min_time`, so fast benchmarks aren't lost in the timer's resolution.
+
+    :param name: What is being measured, eg "Metric.from_json".
+    :type name: str
+    :param func: Runs the benchmark once.
+    :type func: callable
+    :param ops: How many operations one call of `func` does, eg the number
+        of records decoded, to report the time per operation.
+    :type ops: int
+    :param repeat: How many runs to time; the fastest is kept, since the
+        slower ones only measure interference.
+    :type repeat: int
+    :param min_time: The least time, in seconds, each run should take.
+    :type min_time: float
+    :param params: Anything else that identifies the benchmark, eg
+        `records=10000`.
+    :returns: A dict whose "seconds" is the fastest run's time per call of
+        `func`, and "runs" every run's time per call.
+    """
+    number = calibrate(func, min_time)
+    runs = [run / number for run in
+            timeit.repeat(func, repeat=repeat, number=number)]
+    seconds = min(runs)
+    return {"name": name, "params": params, "seconds": seconds,
+            "runs": runs, "number": number, "ops": ops,
+            "us_per_op": seconds / ops * 1e6}
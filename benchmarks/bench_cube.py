@@ -0,0 +1,54 @@
+"""Cube.get_metric end to end against a `StubCube` on localhost.
+
+The stub keeps each rendered response, so after the first query the numbers
+cover the client: building the query, the HTTP round-trip over a pooled
+connection, and decoding the response.
+"""
+from datetime import datetime
+from datetime import timedelta
+
+from benchmarks import measure
+from pypercube.cube import Cube
+from pypercube.expression import EventExpression
+from pypercube.expression import Sum
+from pypercube.stub_server import StubCube
+from pypercube.stub_server import synthetic_events
+from pypercube.time_utils import STEP_1_MIN
+
+
+def suite(points=(60, 1440, 10080), queries=50, latency=0.0):
+    """Time `queries` metric queries of each of `points` one-minute steps.
+
+    :param latency: Seconds the stub waits before answering, to see how
+        concurrency hides a slow evaluator.
+    :type latency: float
+    """
+    results = []
+    metric = Sum(EventExpression('request'))
+    expressions = [Sum(EventExpression('request').eq('path', '/%d' % i))
+            for i in range(queries)]
+    start = datetime(2012, 7, 6)
+    for count in points:
+        stop = start + timedelta(minutes=count)
+        events = synthetic_events(count, start, timedelta(minutes=1))
+        with StubCube(events, latency=latency, keep_requests=0) as stub:
+            with Cube("127.0.0.1", port=stub.port) as c:
+                results.append(measure("Cube.get_metric",
+                    lambda: [c.get_metric(metric, start, stop, STEP_1_MIN)
+                        for _ in range(queries)], ops=queries,
+                    points=count, queries=queries))
+                results.append(measure("Cube.get_metrics",
+                    lambda: c.get_metrics(expressions, start, stop,
+                        STEP_1_MIN), ops=queries, points=count,
+                    queries=queries))
+    return results
+
+
+def main():
+    for result in suite():
+        print("{name:<20} {params} {us_per_op:.0f}us/query".format(
+            **result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Compare Event/Metric decoding against the old dateutil-only time parsing.
+"""
+from datetime import datetime
+from datetime import timedelta
+import json
+import os
+import shutil
+import tempfile
+
+from dateutil import parser as date_parser
+
+from benchmarks import best_of
+from benchmarks import measure
+from pypercube.archive import EventArchive
+from pypercube.event import Event
+from pypercube.metric import Metric
+from pypercube.time_utils import STEP_5_MIN
+
+
+def metric_records(count, distinct_times=288):
+    start = datetime(2012, 7, 6)
+    step = timedelta(milliseconds=STEP_5_MIN)
+    return [{"time": (start + step * (i % distinct_times)).isoformat() + "Z",
+        "value": i} for i in range(count)]
+
+
+def event_records(count):
+    start = datetime(2012, 7, 6)
+    return [{"time": (start + timedelta(milliseconds=i)).isoformat() + "Z",
+        "type": "request", "data": {"elapsed_ms": i % 1000, "path": "/"}}
+        for i in range(count)]
+
+
+def decode_metrics_dateutil(records):
+    return [Metric(date_parser.parse(r["time"], fuzzy=True), r["value"])
+            for r in records]
+
+
+def decode_events_dateutil(records):
+    return [Event(r["type"], date_parser.parse(r["time"], fuzzy=True),
+        r["data"]) for r in records]
+
+
+def decode(cls, records, time_cache=None):
+    return [cls.from_json(r, time_cache) for r in records]
+
+
+def suite(sizes=(10000, 100000, 1000000)):
+    """Metric.from_json and Event.from_json at each of `sizes` records."""
+    results = []
+    for count in sizes:
+        # Only one size of records is held in memory at a time.
+        results.append(_measure_decode(Metric, metric_records(count)))
+        records = event_records(count)
+        results.append(_measure_decode(Event, records))
+        results.extend(_measure_replay(records))
+    return results
+
+
+def _measure_decode(cls, records):
+    return measure("{cls}.from_json".format(cls=cls.__name__),
+            lambda: decode(cls, records, dict()), ops=len(records),
+            records=len(records))
+
+
+def _measure_replay(records):
+    """Reading Events back from a JSON dump and from an EventArchive."""
+    directory = tempfile.mkdtemp()
+    try:
+        dump = os.path.join(directory, "events.json")
+        with open(dump, "w") as f:
+            json.dump(records, f)
+        path = os.path.join(directory, "events.pcube")
+        EventArchive.write(path, decode(Event, records, dict()))
+
+        def replay_json():
+            with open(dump) as f:
+                return decode(Event, json.load(f), dict())
+
+        def replay_archive():
+            with EventArchive(path) as archive:
+                return list(archive)
+        return [
+            measure("replay JSON dump", replay_json, ops=len(records),
+                records=len(records)),
+            measure("replay EventArchive", replay_archive, ops=len(records),
+                records=len(records))]
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(count=100000):
+    metrics = metric_records(count)
+    events = event_records(count)
+    results = [
+        ("metrics, dateutil",
+            best_of(lambda: decode_metrics_dateutil(metrics), 1)),
+        ("metrics, fast path",
+            best_of(lambda: decode(Metric, metrics))),
+        ("metrics, fast path + cache",
+            best_of(lambda: decode(Metric, metrics, dict()))),
+        ("events, dateutil",
+            best_of(lambda: decode_events_dateutil(events), 1)),
+        ("events, fast path",
+            best_of(lambda: decode(Event, events))),
+    ]
+    for name, seconds in results:
+        print("{name:<28} {count} records in {seconds:.3f}s".format(
+            name=name, count=count, seconds=seconds))
+    print("metric speedup: {0:.1f}x".format(results[0][1] / results[2][1]))
+    print("event speedup: {0:.1f}x".format(results[3][1] / results[4][1]))
+
+
+if __name__ == "__main__":
+    main()
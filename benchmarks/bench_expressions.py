@@ -0,0 +1,62 @@
+"""Building, rendering and parsing EventExpressions and compound metrics."""
+from benchmarks import measure
+from pypercube.expression import EventExpression
+from pypercube.expression import Sum
+from pypercube import parser
+
+
+def build_chain(length):
+    e = EventExpression('request', 'elapsed_ms')
+    for i in range(length):
+        e = e.gt('elapsed_ms', i)
+    return e
+
+
+def chain_string(length):
+    return "%s" % build_chain(length)
+
+
+def build_compound(depth):
+    leaf = Sum(EventExpression('request'))
+    m = leaf
+    for i in range(depth):
+        m = m + leaf if i % 2 else m * leaf
+    return "%s" % m
+
+
+def parse_cold(text, times):
+    for _ in xrange(times):
+        parser.cache.clear()
+        parser.parse_metric(text)
+
+
+def parse_cached(text, times):
+    for _ in xrange(times):
+        parser.parse_metric(text)
+
+
+def suite(chain_lengths=(10, 100, 1000), depths=(10, 100, 500)):
+    results = []
+    for length in chain_lengths:
+        results.append(measure("EventExpression chain",
+            lambda: build_chain(length), ops=length, filters=length))
+        results.append(measure("EventExpression chain str",
+            lambda: chain_string(length), ops=length, filters=length))
+    for depth in depths:
+        results.append(measure("CompoundMetricExpression str",
+            lambda: build_compound(depth), ops=depth, depth=depth))
+    text = str(Sum(build_chain(10)) / Sum(EventExpression('request')))
+    results.append(measure("parse_metric", lambda: parse_cold(text, 1000),
+        ops=1000, cached=False))
+    results.append(measure("parse_metric", lambda: parse_cached(text, 1000),
+        ops=1000, cached=True))
+    return results
+
+
+def main():
+    for result in suite():
+        print("{name:<30} {params} {us_per_op:.2f}us/op".format(**result))
+
+
+if __name__ == "__main__":
+    main()
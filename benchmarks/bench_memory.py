@@ -0,0 +1,53 @@
+"""Bytes per record for Event and Metric, with and without __slots__.
+
+Only the record objects themselves are counted, not the datetimes, values or
+data dictionaries they point to, since those are the same in every layout.
+"""
+import sys
+
+from pypercube.event import Event
+from pypercube.metric import Metric
+from pypercube import time_utils
+
+
+class DictEvent(object):
+    """Event as it was before __slots__."""
+    def __init__(self, type, time, data):
+        self.type = type
+        self.time = time
+        self.data = data
+
+
+class DictMetric(object):
+    """Metric as it was before __slots__."""
+    def __init__(self, time, value):
+        self.time = time
+        self.value = value
+
+
+def record_size(record):
+    size = sys.getsizeof(record)
+    # namedtuples expose a computed __dict__, so only count real ones.
+    if not isinstance(record, tuple) and hasattr(record, '__dict__'):
+        size += sys.getsizeof(record.__dict__)
+    return size
+
+
+def main():
+    now = time_utils.now()
+    data = {"elapsed_ms": 83.488}
+    rows = [
+        ("Event, __dict__", DictEvent("request", now, data)),
+        ("Event, __slots__", Event("request", now, data)),
+        ("FrozenEvent", Event("request", now, data).freeze()),
+        ("Metric, __dict__", DictMetric(now, 1)),
+        ("Metric, __slots__", Metric(now, 1)),
+        ("FrozenMetric", Metric(now, 1).freeze()),
+    ]
+    for name, record in rows:
+        print("{name:<20} {size} bytes/record".format(name=name,
+            size=record_size(record)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Run the benchmark suite and write the results as JSON.
+
+    python -m benchmarks.run --output new.json
+    python -m benchmarks.run --quick --compare old.json
+
+With --compare, every benchmark is also checked against an earlier run, and
+the exit status is 1 if any of them got slower by more than --threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from benchmarks import bench_cube
+from benchmarks import bench_decoding
+from benchmarks import bench_expressions
+import pypercube
+
+QUICK = {
+        "decoding": {"sizes": (10000,)},
+        "expressions": {"chain_lengths": (10, 100), "depths": (10, 100)},
+        "cube": {"points": (60, 1440), "queries": 10},
+        }
+SUITES = {
+        "decoding": bench_decoding.suite,
+        "expressions": bench_expressions.suite,
+        "cube": bench_cube.suite,
+        }
+
+
+def run(suites=None, quick=False):
+    """Run some of the suites, or all of them.
+
+    :returns: A JSON-serializable dict of the environment and the result of
+        every benchmark.
+    """
+    results = []
+    for name in sorted(suites or SUITES):
+        for result in SUITES[name](**(QUICK[name] if quick else {})):
+            result["suite"] = name
+            results.append(result)
+    return {
+            "pypercube": pypercube.__version__,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "quick": quick,
+            "results": results,
+            }
+
+
+def _key(result):
+    return (result["name"], tuple(sorted(result["params"].items())))
+
+
+def compare(old, new, threshold=1.2):
+    """Pair up the benchmarks two runs share.
+
+    Each benchmark's time is its fastest run, per call, so noise on a busy
+    machine makes a run look slower less often than an average would.
+
+    :returns: A list of (name, params, old seconds, new seconds, ratio,
+        regressed) tuples, where ratio is new / old.
+    """
+    before = dict((_key(result), result) for result in old["results"])
+    rows = []
+    for result in new["results"]:
+        previous = before.get(_key(result))
+        if previous is None:
+            continue
+        ratio = result["seconds"] / previous["seconds"]
+        rows.append((result["name"], result["params"], previous["seconds"],
+            result["seconds"], ratio, ratio > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("suites", nargs="*", metavar="suite",
+            help="The suites to run, from {suites} (default: all of "
+            "them)".format(suites=", ".join(sorted(SUITES))))
+    parser.add_argument("--quick", action="store_true",
+            help="Run small sizes only")
+    parser.add_argument("--output", help="Write the results to this file "
+            "instead of stdout")
+    parser.add_argument("--compare", help="A previous --output to compare "
+            "against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+            help="The slowdown that counts as a regression (default 1.2)")
+    args = parser.parse_args(argv)
+    for name in args.suites:
+        if name not in SUITES:
+            parser.error("unknown suite {name!r}".format(name=name))
+
+    report = run(args.suites, args.quick)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            rows = compare(json.load(f), report, args.threshold)
+        for name, params, old, new, ratio, regressed in rows:
+            sys.stderr.write("{flag} {name:<30} {params} {old:.3g}s -> "
+                    "{new:.3g}s ({ratio:.2f}x)\n".format(
+                        flag="!" if regressed else " ", name=name,
+                        params=params, old=old, new=new, ratio=ratio))
+        if any(row[-1] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""A compact, memory-mapped file format for replaying Events.
+
+An archive stores its Events in time order as columns: a time column of
+microseconds since the epoch, a column of ids into a table of the distinct
+event types, a column of flags and the data dictionaries as compact JSON.
+One time in every `interval` is also kept in a sparse index, so reading the
+Events in `[start, stop)` seeks straight to them.
+
+>>> import os, tempfile
+>>> path = os.path.join(tempfile.mkdtemp(), "events.pcube")
+>>> EventArchive.write(path, [
+...     Event("request", "2012-07-06T20:33:00", {"path": "/"}),
+...     Event("login", "2012-07-06T20:32:00", {"user": "a"})])
+2
+>>> with EventArchive(path) as archive:
+...     [(e.type, e.data) for e in archive]
+[(u'login', {u'user': u'a'}), (u'request', {u'path': u'/'})]
+"""
+from bisect import bisect_left
+from datetime import datetime
+from datetime import timedelta
+import json
+import mmap
+import struct
+
+from dateutil.tz import tzutc
+
+from pypercube.event import Event
+
+MAGIC = "PCUBEEV1"
+# magic, interval, count, then where each section starts, in file order:
+# times, data offsets, types, flags, type table, index and data.
+_HEADER = struct.Struct("<8sIQQQQQQQQ")
+_EPOCH = datetime(1970, 1, 1)
+_UTC = tzutc()
+_COMPACT = (",", ":")
+
+# Flags
+TZ_AWARE = 1
+
+
+class InvalidArchiveError(Exception):
+    pass
+
+
+def _to_epoch_us(time):
+    aware = time.tzinfo is not None
+    if aware:
+        offset = time.utcoffset()
+        time = time.replace(tzinfo=None)
+        if offset:
+            time -= offset
+    delta = time - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + \
+            delta.microseconds, aware
+
+
+def _from_epoch_us(us, aware):
+    time = _EPOCH + timedelta(microseconds=us)
+    if aware:
+        time = time.replace(tzinfo=_UTC)
+    return time
+
+
+class EventArchive(object):
+    """A read-only, memory-mapped archive of Events.
+
+    The Events are built as they are iterated over, a block of `interval`
+    records at a time. Times that were timezone-aware are returned in UTC.
+    """
+    def __init__(self, path):
+        """Open an EventArchive written by `EventArchive.write`.
+
+        :param path: The archive's file.
+        :type path: str
+        :throws: `InvalidArchiveError` if `path` isn't an archive.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise InvalidArchiveError("{path} is empty".format(
+                    path=path))
+        if len(self._map) < _HEADER.size or \
+                self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise InvalidArchiveError(
+                    "{path} is not an event archive".format(path=path))
+        (_, self.interval, self._count, self._times, self._offsets,
+                self._types, self._flags, types_offset, index_offset,
+                self._data) = _HEADER.unpack_from(self._map)
+        self.types = json.loads(self._map[types_offset:index_offset])
+        blocks = (self._count + self.interval - 1) // self.interval
+        self._index = list(struct.unpack_from("<{n}q".format(n=blocks),
+            self._map, index_offset))
+
+    @classmethod
+    def write(cls, path, events, interval=1024):
+        """Write Events to a new archive, sorted by time.
+
+        :param path: The file to write. It is replaced if it exists.
+        :type path: str
+        :param events: The Events to archive, in any order.
+        :type events: iterable of `Event` or `FrozenEvent`
+        :param interval: How many records apart the sparse index's entries
+            are. Smaller intervals seek more precisely but read more of the
+            index on open.
+        :type interval: int
+        :returns: The number of Events written.
+        """
+        type_ids = dict()
+        rows = []
+        for event in events:
+            us, aware = _to_epoch_us(event.time)
+            type_id = type_ids.get(event.type)
+            if type_id is None:
+                type_id = type_ids[event.type] = len(type_ids)
+            rows.append((us, type_id, TZ_AWARE if aware else 0,
+                json.dumps(event.data, separators=_COMPACT) + ","))
+        if len(type_ids) > 0xffff:
+            raise ValueError("An archive holds at most 65536 event types")
+        # Stable, so events at the same time keep their order.
+        rows.sort(key=lambda row: row[0])
+        count = len(rows)
+        times = struct.pack("<{n}q".format(n=count),
+                *[row[0] for row in rows])
+        event_types = struct.pack("<{n}H".format(n=count),
+                *[row[1] for row in rows])
+        flags = struct.pack("<{n}B".format(n=count),
+                *[row[2] for row in rows])
+        offsets = [0]
+        for row in rows:
+            offsets.append(offsets[-1] + len(row[3]))
+        offsets = struct.pack("<{n}Q".format(n=count + 1), *offsets)
+        type_table = json.dumps(sorted(type_ids, key=type_ids.get),
+                separators=_COMPACT)
+        index = [row[0] for row in rows[::interval]]
+        index = struct.pack("<{n}q".format(n=len(index)), *index)
+
+        sections = (times, offsets, event_types, flags, type_table, index)
+        starts = []
+        position = _HEADER.size
+        for section in sections:
+            starts.append(position)
+            position += len(section)
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, interval, count, *(starts +
+                [position])))
+            for section in sections:
+                f.write(section)
+            for row in rows:
+                f.write(row[3])
+        return count
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return self.events()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    @property
+    def first_time(self):
+        """The time of the first Event, or None if there are none."""
+        if not self._count:
+            return None
+        return self._event_times(0, 1)[0]
+
+    @property
+    def last_time(self):
+        """The time of the last Event, or None if there are none."""
+        if not self._count:
+            return None
+        return self._event_times(self._count - 1, self._count)[0]
+
+    def events(self, start=None, stop=None, event_types=None):
+        """Yield the Events in `[start, stop)`, in time order.
+
+        :param start: The earliest time to include. Naive times are UTC.
+        :type start: datetime
+        :param stop: The time to stop before.
+        :type stop: datetime
+        :param event_types: Only yield Events of these types. The data of
+            other Events is never decoded.
+        :type event_types: list of str
+        """
+        lo, hi = self._bounds(start, stop)
+        wanted = None
+        if event_types is not None:
+            wanted = frozenset(i for i, t in enumerate(self.types)
+                    if t in event_types)
+        types = self.types
+        for block in xrange(lo, hi, self.interval):
+            end = min(block + self.interval, hi)
+            times = self._event_times(block, end)
+            type_ids = self._column(self._types, "H", 2, block, end)
+            if wanted is None:
+                datas = self._decode(block, end)
+                for i, time in enumerate(times):
+                    yield Event(types[type_ids[i]], time, datas[i])
+                continue
+            offsets = self._column(self._offsets, "Q", 8, block, end + 1)
+            for i, time in enumerate(times):
+                if type_ids[i] in wanted:
+                    data = json.loads(self._map[self._data + offsets[i]:
+                        self._data + offsets[i + 1] - 1])
+                    yield Event(types[type_ids[i]], time, data)
+
+    def times(self, start=None, stop=None):
+        """The times of the Events in `[start, stop)`, without their data."""
+        lo, hi = self._bounds(start, stop)
+        return self._event_times(lo, hi)
+
+    def _column(self, offset, fmt, size, lo, hi):
+        return struct.unpack_from("<{n}{fmt}".format(n=hi - lo, fmt=fmt),
+                self._map, offset + lo * size)
+
+    def _event_times(self, lo, hi):
+        flags = self._column(self._flags, "B", 1, lo, hi)
+        cache = dict()
+        times = []
+        for us, flag in zip(self._column(self._times, "q", 8, lo, hi),
+                flags):
+            key = (us, flag)
+            time = cache.get(key)
+            if time is None:
+                time = cache[key] = _from_epoch_us(us, flag & TZ_AWARE)
+            times.append(time)
+        return times
+
+    def _decode(self, lo, hi):
+        if lo == hi:
+            return []
+        first = self._column(self._offsets, "Q", 8, lo, lo + 1)[0]
+        last = self._column(self._offsets, "Q", 8, hi, hi + 1)[0]
+        # Each record ends with a comma, so a block is a JSON array body.
+        return json.loads("[" + self._map[self._data + first:
+            self._data + last - 1] + "]")
+
+    def _position(self, time):
+        """The position of the first Event at or after `time`."""
+        us = _to_epoch_us(time)[0]
+        block = max(0, bisect_left(self._index, us) - 1)
+        lo = block * self.interval
+        # The index entry after `block` is at or after `us`.
+        hi = min(lo + self.interval + 1, self._count)
+        times = self._column(self._times, "q", 8, lo, hi)
+        return lo + bisect_left(times, us)
+
+    def _bounds(self, start, stop):
+        lo = self._position(start) if start is not None else 0
+        hi = self._position(stop) if stop is not None else self._count
+        return lo, max(lo, hi)
@@ -0,0 +1,80 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+from pypercube.cube import Cube
+
+
+class AsyncCube(Cube):
+    """A Cube whose queries run concurrently on a pool of worker threads.
+
+    `get_event` and `get_metric` take the same arguments as on `Cube` but
+    return immediately with a `multiprocessing.pool.AsyncResult`; call its
+    `get()` method to wait for the Events or Metrics.
+
+    >>> with AsyncCube('cube.mydomain.com', workers=4) as c:
+    ...     c.workers, c.pool_maxsize
+    (4, 4)
+    """
+    def __init__(self, hostname, port=1081, api_version="1.0", workers=10,
+            **kwargs):
+        """Create an AsyncCube.
+
+        :param workers: The maximum number of queries in flight at once.
+        :type workers: int
+
+        Any other keyword arguments are passed through to `Cube`. The
+        connection pool is sized to `workers` unless `pool_maxsize` is given.
+        """
+        kwargs.setdefault('pool_maxsize', workers)
+        super(AsyncCube, self).__init__(hostname, port, api_version, **kwargs)
+        self.workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        """The `ThreadPool` running this Cube's queries."""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPool(self.workers)
+        return self._pool
+
+    def close(self):
+        """Wait for queued queries to finish, then close every connection."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+        super(AsyncCube, self).close()
+
+    def get_event(self, event_expression, start=None, stop=None, limit=None):
+        return self.pool.apply_async(super(AsyncCube, self).get_event,
+                (event_expression, start, stop, limit))
+
+    def get_metric(self, metric_expression, start=None, stop=None, step=None,
+            limit=None, as_series=False, chunk_size=None, workers=4):
+        return self.pool.apply_async(super(AsyncCube, self).get_metric,
+                (metric_expression, start, stop, step, limit, as_series,
+                    chunk_size, workers))
+
+    def gather_metrics(self, metric_expressions, start=None, stop=None,
+            step=None, limit=None, timeout=None):
+        """Fetch several metrics over the same window concurrently.
+
+        :param metric_expressions: The metrics to fetch.
+        :type metric_expressions: list of `MetricExpression` or
+            `CompoundMetricExpression`
+        :param timeout: Seconds to wait for each result.
+        :type timeout: float
+        :returns: A list of lists of Metrics, in the same order as
+            `metric_expressions`.
+        :throws: The first error raised by any of the queries.
+
+        At most `workers` queries are in flight at once, so a refresh costs
+        roughly one round-trip per `workers` metrics.
+        """
+        pending = [self.get_metric(expression, start, stop, step, limit)
+                for expression in metric_expressions]
+        return [result.get(timeout) for result in pending]
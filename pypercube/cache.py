@@ -0,0 +1,287 @@
+from collections import OrderedDict
+import json
+import shelve
+import sqlite3
+import threading
+import time
+
+from pypercube.time_utils import STEP_10_SEC
+from pypercube.time_utils import STEP_1_DAY
+from pypercube.time_utils import STEP_1_HOUR
+from pypercube.time_utils import STEP_1_MIN
+from pypercube.time_utils import STEP_5_MIN
+
+
+class MetricCache(object):
+    """A store for step-aligned Metric values.
+
+    Keys are (expression, step, bucket) tuples, where expression is the
+    string form of a metric expression and bucket is the start of the step in
+    milliseconds since the epoch. Values are the JSON form of a `Metric`.
+
+    Subclasses implement `get_many`, `set_many` and `clear`, and must be safe
+    to use from multiple threads.
+    """
+    def get_many(self, keys):
+        """Look up several keys.
+
+        :returns: A dict of the keys that were found and their values.
+        """
+        raise NotImplementedError
+
+    def set_many(self, items):
+        """Store several values.
+
+        :param items: Keys and their values.
+        :type items: dict
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove every value."""
+        raise NotImplementedError
+
+
+class LRUCache(MetricCache):
+    """An in-memory MetricCache that evicts the least recently used values.
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.set_many({("sum(request)", 60000, 0): {"value": 1}})
+    >>> cache.get_many([("sum(request)", 60000, 0), ("sum(request)", 60000,
+    ...     60000)])
+    {('sum(request)', 60000, 0): {'value': 1}}
+    """
+    def __init__(self, maxsize=100000, ttl=None):
+        """Create an LRUCache.
+
+        :param maxsize: The maximum number of values to keep.
+        :type maxsize: int
+        :param ttl: Seconds to keep each value, or None to keep values until
+            they are evicted.
+        :type ttl: float
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = dict()
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._data.pop(key, None)
+                if entry is None:
+                    continue
+                value, expires = entry
+                if expires is not None and expires <= now:
+                    continue
+                self._data[key] = entry
+                found[key] = value
+        return found
+
+    def set_many(self, items):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            for key, value in items.iteritems():
+                self._data.pop(key, None)
+                self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache(MetricCache):
+    """A MetricCache kept in a `shelve` file, so it survives restarts."""
+    def __init__(self, path, ttl=None):
+        """Create a DiskCache.
+
+        :param path: The file to keep the values in.
+        :type path: str
+        :param ttl: Seconds to keep each value, or None to keep it forever.
+        :type ttl: float
+        """
+        self.path = path
+        self.ttl = ttl
+        self._shelf = shelve.open(path, protocol=2)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _key(cls, key):
+        expression, step, bucket = key
+        return "{step}:{bucket}:{expression}".format(step=step,
+                bucket=bucket, expression=expression)
+
+    def get_many(self, keys):
+        found = dict()
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._shelf.get(self._key(key))
+                if entry is None:
+                    continue
+                value, expires = json.loads(entry)
+                if expires is not None and expires <= now:
+                    continue
+                found[key] = value
+        return found
+
+    def set_many(self, items):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            for key, value in items.iteritems():
+                self._shelf[self._key(key)] = json.dumps([value, expires])
+            self._shelf.sync()
+
+    def clear(self):
+        with self._lock:
+            self._shelf.clear()
+            self._shelf.sync()
+
+    def close(self):
+        with self._lock:
+            self._shelf.close()
+
+
+# Seconds of history SQLiteCache keeps for each step in
+# time_utils.STEP_CHOICES. None keeps it forever.
+DEFAULT_RETENTION = {
+        STEP_10_SEC: 2 * 86400,
+        STEP_1_MIN: 14 * 86400,
+        STEP_5_MIN: 60 * 86400,
+        STEP_1_HOUR: 400 * 86400,
+        STEP_1_DAY: None,
+        }
+
+
+class SQLiteCache(MetricCache):
+    """A MetricCache kept in a SQLite database, so it survives restarts.
+
+    The database is in write-ahead logging mode, so several processes, eg
+    the workers of a dashboard, can share one file and read while another
+    writes. A restarted worker starts with the history it had already
+    fetched.
+
+    Values are kept for as long as `retention` says for their step, counted
+    from the start of their step rather than from when they were stored, so
+    fine-grained history expires sooner than coarse history. Expired values
+    are never returned, and are deleted by `compact`, which also runs every
+    `compact_interval` seconds as values are stored.
+
+    >>> cache = SQLiteCache(":memory:")
+    >>> key = ("sum(request)", STEP_1_DAY, 0)
+    >>> cache.set_many({key: {"value": 1}})
+    >>> cache.get_many([key]) == {key: {"value": 1}}
+    True
+    """
+    def __init__(self, path, retention=None, compact_interval=3600):
+        """Create a SQLiteCache.
+
+        :param path: The database file, created if it doesn't exist.
+        :type path: str
+        :param retention: Seconds to keep the values of each step, or None
+            to keep them forever. Steps that aren't listed are kept forever.
+            Defaults to `DEFAULT_RETENTION`.
+        :type retention: dict
+        :param compact_interval: Seconds between automatic compactions, or
+            None to only compact when `compact` is called.
+        :type compact_interval: float
+        """
+        self.path = path
+        self.retention = DEFAULT_RETENTION if retention is None \
+                else retention
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL is still safe against corruption, and only the
+        # last transactions can be lost in a power failure.
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS metrics ("
+                "expression TEXT NOT NULL, step INTEGER NOT NULL, "
+                "bucket INTEGER NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (expression, step, bucket))")
+        self._compacted = time.time()
+
+    def _cutoff(self, step, now):
+        """The earliest bucket of `step` still kept, or None."""
+        retention = self.retention.get(step)
+        if retention is None:
+            return None
+        return int((now - retention) * 1000)
+
+    def get_many(self, keys):
+        # One range scan of the primary key per expression and step.
+        groups = dict()
+        for key in keys:
+            groups.setdefault(key[:2], set()).add(key[2])
+        found = dict()
+        now = time.time()
+        with self._lock:
+            for (expression, step), buckets in groups.iteritems():
+                first = min(buckets)
+                cutoff = self._cutoff(step, now)
+                if cutoff is not None:
+                    first = max(first, cutoff)
+                rows = self._db.execute("SELECT bucket, value FROM metrics "
+                        "WHERE expression = ? AND step = ? AND "
+                        "bucket BETWEEN ? AND ?",
+                        (expression, step, first, max(buckets)))
+                for bucket, value in rows:
+                    if bucket in buckets:
+                        found[(expression, step, bucket)] = json.loads(value)
+        return found
+
+    def set_many(self, items):
+        now = time.time()
+        rows = []
+        for (expression, step, bucket), value in items.iteritems():
+            cutoff = self._cutoff(step, now)
+            if cutoff is None or bucket >= cutoff:
+                rows.append((expression, step, bucket, json.dumps(value)))
+        with self._lock:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO metrics "
+                        "VALUES (?, ?, ?, ?)", rows)
+        if self.compact_interval is not None and \
+                now - self._compacted >= self.compact_interval:
+            self.compact()
+
+    def compact(self):
+        """Delete expired values and shrink the write-ahead log.
+
+        :returns: The number of values deleted.
+        """
+        now = time.time()
+        deleted = 0
+        with self._lock:
+            self._compacted = now
+            with self._db:
+                for step in self.retention:
+                    cutoff = self._cutoff(step, now)
+                    if cutoff is not None:
+                        deleted += self._db.execute("DELETE FROM metrics "
+                                "WHERE step = ? AND bucket < ?",
+                                (step, cutoff)).rowcount
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM metrics")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                    "SELECT COUNT(*) FROM metrics").fetchone()[0]
@@ -0,0 +1,172 @@
+import json
+import Queue
+import threading
+import time
+
+import requests
+
+# Queue markers for the background thread.
+_FLUSH = object()
+_STOP = object()
+
+
+class Collector(object):
+    """Send Events to a Cube collector in batches.
+
+    Events are buffered in memory and POSTed to the collector's event/put
+    endpoint by a background thread, either when `batch_size` Events are
+    waiting or `flush_interval` seconds after the first of them arrived.
+
+    >>> with Collector('cube.mydomain.com') as c:
+    ...     print(c.get_base_url())
+    http://cube.mydomain.com:1080/1.0
+    """
+    def __init__(self, hostname, port=1080, api_version="1.0",
+            batch_size=500, flush_interval=1.0, max_buffer=10000, block=True,
+            timeout=5.0):
+        """Create a Collector.
+
+        :param hostname: The hostname of the Cube collector.
+        :type hostname: str
+        :param port: The port of the Cube collector.
+        :type port: int
+        :param api_version: The version of the Cube API.
+        :type api_version: str
+        :param batch_size: The most Events to send in one request.
+        :type batch_size: int
+        :param flush_interval: The longest an Event waits to be sent, in
+            seconds.
+        :type flush_interval: float
+        :param max_buffer: The most Events to hold while waiting to be sent.
+        :type max_buffer: int
+        :param block: What `send` does when the buffer is full: wait for room
+            if True, otherwise drop the Event.
+        :type block: bool
+        :param timeout: Seconds to wait for the collector to respond.
+        :type timeout: float
+        """
+        self.hostname = hostname
+        self.port = port
+        self.api_version = api_version
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block = block
+        self.timeout = timeout
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._queue = Queue.Queue(max_buffer)
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._thread = threading.Thread(target=self._run,
+                name="pypercube-collector")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get_base_url(self):
+        return "http://{hostname}:{port}/{api}".format(
+                hostname=self.hostname,
+                port=self.port,
+                api=self.api_version)
+
+    def send(self, event, timeout=None):
+        """Queue an Event to be sent.
+
+        :param event: The Event to send.
+        :type event: `Event`
+        :param timeout: When blocking, the most seconds to wait for room in
+            the buffer before dropping the Event.
+        :type timeout: float
+        :returns: True if the Event was queued, False if it was dropped.
+        """
+        try:
+            self._queue.put(event.to_json(), self.block, timeout)
+        except Queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """Send every queued Event now and wait until they have been sent.
+
+        Once the Collector is closed there is nothing left to send, so this
+        returns straight away.
+        """
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """Send every queued Event and stop the background thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def stats(self):
+        """Counts of Events sent, dropped and failed, and batches sent."""
+        with self._lock:
+            return {"sent": self.sent, "dropped": self.dropped,
+                    "failed": self.failed, "batches": self.batches}
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                if deadline is None:
+                    item = self._queue.get()
+                else:
+                    item = self._queue.get(True,
+                            max(0, deadline - time.time()))
+            except Queue.Empty:
+                self._post(batch)
+                batch = []
+                deadline = None
+                continue
+
+            if item is _FLUSH or item is _STOP:
+                self._post(batch)
+                batch = []
+                deadline = None
+                self._queue.task_done()
+                if item is _STOP:
+                    return
+                continue
+
+            batch.append(item)
+            if deadline is None:
+                deadline = time.time() + self.flush_interval
+            if len(batch) >= self.batch_size:
+                self._post(batch)
+                batch = []
+                deadline = None
+            self._queue.task_done()
+
+    def _post(self, batch):
+        if not batch:
+            return
+        url = "{base_url}/event/put".format(base_url=self.get_base_url())
+        try:
+            response = self._session.post(url, data=json.dumps(batch),
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout)
+            ok = response.ok
+        except requests.RequestException:
+            ok = False
+        with self._lock:
+            if ok:
+                self.sent += len(batch)
+                self.batches += 1
+            else:
+                self.failed += len(batch)
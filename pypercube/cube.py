@@ -1,15 +1,131 @@
+from datetime import timedelta
+import itertools
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+import types
+
 import requests
+from requests.adapters import HTTPAdapter
 
 from pypercube.event import Event
+from pypercube.expression import canonical_string
 from pypercube.metric import Metric
+from pypercube.reduction import combine
+from pypercube.reduction import unique_leaves
+from pypercube.series import MetricSeries
+from pypercube.stats import QueryStats
+from pypercube.stream import iter_json_array
+from pypercube.table import MetricTable
 from pypercube.time_utils import STEP_CHOICES
+from pypercube.time_utils import chunk
+from pypercube.time_utils import floor_ms
+from pypercube.time_utils import from_epoch_ms
+from pypercube.time_utils import now
+from pypercube.time_utils import parse_time
+from pypercube.time_utils import to_epoch_ms
+from pypercube.time_utils import to_utc
 
 
 class Cube(object):
-    def __init__(self, hostname, port=1081, api_version="1.0"):
+    def __init__(self, hostname, port=1081, api_version="1.0",
+            pool_connections=1, pool_maxsize=10, pool_block=False,
+            keep_alive=True, timeout=None, cache=None, retry=None,
+            observers=None):
+        """Create a Cube client.
+
+        :param hostname: The hostname of the Cube evaluator.
+        :type hostname: str
+        :param port: The port of the Cube evaluator.
+        :type port: int
+        :param api_version: The version of the Cube API.
+        :type api_version: str
+        :param pool_connections: The number of host pools to cache.
+        :type pool_connections: int
+        :param pool_maxsize: The maximum number of connections kept open to
+            the evaluator. Raise this when many threads share one `Cube`.
+        :type pool_maxsize: int
+        :param pool_block: Block when every pooled connection is in use
+            instead of opening a throwaway connection.
+        :type pool_block: bool
+        :param keep_alive: Reuse connections between queries.
+        :type keep_alive: bool
+        :param timeout: Seconds to wait for the evaluator, either a single
+            number or a (connect, read) tuple. None waits forever.
+        :type timeout: float or tuple
+        :param cache: Where to keep the Metrics of completed steps, so that
+            repeated `get_metric` calls only fetch the steps they haven't seen
+            before (and the step still in progress).
+        :type cache: `pypercube.cache.MetricCache`
+        :param retry: How to retry and hedge queries that fail or are slow
+            to answer. By default every query is sent exactly once.
+        :type retry: `pypercube.retry.RetryPolicy`
+        :param observers: Callables to pass a `pypercube.stats.QueryStats` to
+            after every query, eg a `pypercube.stats.StatsAggregator`. More
+            can be added to `observers` later.
+        :type observers: list of callable
+
+        The connection pool is shared by every query this `Cube` makes and is
+        safe to use from multiple threads. Call `close` (or use the `Cube` as
+        a context manager) to release the pooled connections.
+        """
         self.hostname = hostname
         self.port = port
         self.api_version = api_version
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.cache = cache
+        self.retry = retry
+        self.observers = list(observers or [])
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    ### Connection management ###
+    @property
+    def session(self):
+        """The pooled `requests.Session` used for every query.
+
+        >>> with Cube('cube.mydomain.com', pool_maxsize=4) as c:
+        ...     c.session.get_adapter(c.get_base_url())._pool_maxsize
+        4
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize,
+                pool_block=self.pool_block)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        """Close every pooled connection.
+
+        The `Cube` may still be used afterwards; a new pool is created on the
+        next query.
+        """
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     ### Utility methods ###
     def get_base_url(self):
@@ -23,36 +139,511 @@ class Cube(object):
                 port=self.port,
                 api=self.api_version)
 
+    def _query(self, path, start=None, stop=None, step=None, limit=None):
+        return Query(self.get_base_url(), path, start, stop, step, limit,
+                session=self.session, timeout=self.timeout, retry=self.retry)
+
     ### Data access methods
-    def _handle_response(self, response, obj):
-        if response.ok and response.json is not None:
-            return [obj.from_json(record) for record in response.json]
-        elif not response.ok:
+    def _response_records(self, response):
+        """The decoded JSON records of a response, or None if there are none.
+
+        :throws: `InvalidQueryError` if Cube rejected the query.
+        """
+        if not response.ok:
             raise InvalidQueryError({
                 "status": response.status_code,
                 "url": response.url})
+        return _response_json(response)
+
+    def _handle_response(self, response, obj):
+        json = self._response_records(response)
+        if json is not None:
+            time_cache = dict()
+            return [obj.from_json(record, time_cache) for record in json]
         return response.content
 
+    def _execute(self, query, expression, decode, cache_hits=0):
+        """Send a query and decode its response, reporting to observers.
+
+        :param decode: Turns the response into the result of the query.
+        :type decode: callable
+        """
+        if not self.observers:
+            return decode(query.get(expression))
+        stats = QueryStats(query.path, "%s" % expression, query.params)
+        stats.cache_hits = cache_hits
+        started = time.time()
+        try:
+            response = query.get(expression)
+            stats.latency = time.time() - started
+            _measure_response(stats, response)
+            decoding = time.time()
+            result = decode(response)
+            stats.decode_time = time.time() - decoding
+            if not isinstance(result, basestring):
+                stats.records = len(result)
+            return result
+        except Exception as e:
+            stats.error = e
+            raise
+        finally:
+            self._notify(stats)
+
+    def _notify(self, stats):
+        for observer in self.observers:
+            observer(stats)
+
     def get_event(self, event_expression, start=None, stop=None, limit=None):
-        query = Query(self.get_base_url(), "event/get", start, stop, None,
-                limit)
-        r = query.get(event_expression)
-        return self._handle_response(r, Event)
+        query = self._query("event/get", start, stop, None, limit)
+        return self._execute(query, event_expression,
+                lambda r: self._handle_response(r, Event))
+
+    def iter_events(self, event_expression, start=None, stop=None,
+            limit=None, chunk_size=64 * 1024):
+        """Stream Events from Cube as they are downloaded.
+
+        Takes the same arguments as `get_event`, but decodes the response
+        one Event at a time rather than building the whole list, so memory
+        use stays flat no matter how many Events match.
+
+        :param chunk_size: The number of bytes to read from the socket at a
+            time.
+        :type chunk_size: int
+        :throws: `InvalidQueryError` if Cube rejects the query.
+        """
+        query = self._query("event/get", start, stop, None, limit)
+        stats = None
+        if self.observers:
+            stats = QueryStats(query.path, "%s" % event_expression,
+                    query.params)
+        started = time.time()
+        response = None
+        try:
+            response = query.stream(event_expression)
+            if stats is not None:
+                _measure_response(stats, response, body=False)
+            if not response.ok:
+                raise InvalidQueryError({
+                    "status": response.status_code,
+                    "url": response.url})
+            chunks = response.iter_content(chunk_size)
+            if stats is not None:
+                chunks = _count_bytes(chunks, stats)
+            for record in iter_json_array(chunks):
+                if stats is not None:
+                    stats.records += 1
+                yield Event.from_json(record)
+        except Exception as e:
+            if stats is not None:
+                stats.error = e
+            raise
+        finally:
+            if response is not None:
+                response.close()
+            if stats is not None:
+                stats.latency = time.time() - started
+                self._notify(stats)
 
     def get_metric(self, metric_expression, start=None, stop=None, step=None,
-            limit=None):
-        query = Query(self.get_base_url(), "metric/get", start, stop, step,
-                limit)
-        r = query.get(metric_expression)
-        return self._handle_response(r, Metric)
+            limit=None, as_series=False, chunk_size=None, workers=4):
+        """Fetch a metric from Cube.
+
+        :param as_series: Return a NumPy-backed `MetricSeries` instead of a
+            list of `Metric`s.
+        :type as_series: bool
+        :param chunk_size: Split long queries into step-aligned windows of at
+            most this length and fetch them concurrently. Requires `start`
+            and `step`; `stop` defaults to now.
+        :type chunk_size: timedelta
+        :param workers: The maximum number of windows fetched at once.
+        :type workers: int
+        """
+        if chunk_size is not None:
+            return self._get_metric_chunked(metric_expression, start, stop,
+                    step, limit, as_series, chunk_size, workers)
+        if self.cache is not None and start is not None and \
+                step is not None and not limit:
+            metrics = self._get_metric_cached(metric_expression, start, stop,
+                    step)
+            if as_series:
+                return MetricSeries.from_metrics(metrics, step)
+            return metrics
+        return self._fetch_metric(metric_expression, start, stop, step, limit,
+                as_series)
+
+    def _fetch_metric(self, metric_expression, start, stop, step, limit,
+            as_series, cache_hits=0):
+        query = self._query("metric/get", start, stop, step, limit)
+        if as_series:
+            decode = lambda r: MetricSeries.from_json(
+                    self._response_records(r) or [], step)
+        else:
+            decode = lambda r: self._handle_response(r, Metric)
+        return self._execute(query, metric_expression, decode, cache_hits)
+
+    def _get_metric_cached(self, metric_expression, start, stop, step):
+        """Fetch the steps of [start, stop) which aren't in the cache.
+
+        Only completed steps are cached; the step containing the current
+        time is always fetched.
+        """
+        if isinstance(start, types.StringTypes):
+            start = parse_time(start)
+        if isinstance(stop, types.StringTypes):
+            stop = parse_time(stop)
+        started = time.time()
+        current = to_epoch_ms(now())
+        first = to_epoch_ms(start)
+        first -= first % step
+        last = to_epoch_ms(stop) if stop is not None else current
+        expression = canonical_string(metric_expression)
+        buckets = range(first, last, step)
+        keys = [(expression, step, bucket) for bucket in buckets]
+        cached = self.cache.get_many(
+                [key for key in keys if key[2] + step <= current])
+
+        missing = [key[2] for key in keys if key not in cached]
+        if missing:
+            fetch_start = start if missing[0] == first \
+                    else from_epoch_ms(missing[0])
+            fetched = self._fetch_metric(metric_expression, fetch_start,
+                    from_epoch_ms(missing[-1] + step), step, None, False,
+                    len(cached))
+            found = dict()
+            for metric in fetched:
+                bucket = to_epoch_ms(metric.time)
+                bucket -= bucket % step
+                found[(expression, step, bucket)] = metric.to_json()
+            self.cache.set_many(dict((key, record) for key, record
+                in found.iteritems() if key[2] + step <= current))
+            cached.update(found)
+        elif self.observers:
+            stats = QueryStats("metric/get", expression,
+                    Query._build_params(start, stop, step))
+            stats.cache_hits = stats.records = len(cached)
+            stats.latency = time.time() - started
+            self._notify(stats)
+
+        time_cache = dict()
+        return [Metric.from_json(cached[key], time_cache) for key in keys
+                if key in cached]
+
+    def _get_metric_chunked(self, metric_expression, start, stop, step,
+            limit, as_series, chunk_size, workers):
+        if not hasattr(start, 'isoformat') or step is None:
+            raise ValueError("Chunked metric queries need a start datetime "
+                    "and a step")
+        if stop is None:
+            stop = now()
+        windows = chunk(start, stop, step, chunk_size)
+
+        def fetch(window):
+            return Cube.get_metric(self, metric_expression, window[0],
+                    window[1], step, limit, as_series)
+
+        if limit:
+            # Like an unchunked query, return the newest `limit` steps: walk
+            # the windows newest first, until there are enough points.
+            results = []
+            while windows and sum(len(r) for r in results) < limit:
+                batch = windows[-workers:]
+                del windows[-workers:]
+                results[:0] = _map(fetch, batch, workers)
+        else:
+            results = _map(fetch, windows, workers)
+
+        # Cube may return the point on a window boundary in both windows.
+        if as_series:
+            series = MetricSeries.concat(results, step)
+            return series[-limit:] if limit else series
+        metrics = []
+        last = None
+        for result in results:
+            for metric in result:
+                if last is None or metric.time > last:
+                    metrics.append(metric)
+                    last = metric.time
+        return metrics[-limit:] if limit else metrics
+
+    def evaluate_metrics(self, metric_expressions, start=None, stop=None,
+            step=None, limit=None, workers=4):
+        """Compute several metrics client-side from their distinct leaves.
+
+        :param metric_expressions: The metrics to compute.
+        :type metric_expressions: list of `MetricExpression` or
+            `CompoundMetricExpression`
+        :param workers: The maximum number of leaves fetched at once.
+        :type workers: int
+        :returns: A list of lists of Metrics, in the same order as
+            `metric_expressions`.
+
+        Every distinct `MetricExpression` used by any of the metrics is
+        fetched exactly once, concurrently, and the arithmetic of compound
+        metrics is done locally on the points with the same time. A point
+        where any leaf is missing or null, or which divides by zero, is None.
+
+        This issues the fewest possible queries for a dashboard whose panels
+        share sub-metrics, eg sum(request) in both
+        sum(request(elapsed_ms)) / sum(request) and sum(request) / 60.
+        Leaves are compared by their canonical form, so sum(request.eq(a,
+        1).eq(b, 2)) and sum(request.eq(b, 2).eq(a, 1)) are fetched once.
+        """
+        metric_expressions = [expression.canonicalize()
+                for expression in metric_expressions]
+        leaves = unique_leaves(metric_expressions)
+        fetched = self._fetch_metrics(leaves, start, stop, step, limit,
+                workers)
+        return combine(metric_expressions, dict(zip(leaves, fetched)))
+
+    def _fetch_metrics(self, metric_expressions, start, stop, step, limit,
+            workers):
+        """`get_metric` for each expression, on at most `workers` threads."""
+        def fetch(expression):
+            return Cube.get_metric(self, expression, start, stop, step, limit)
+
+        return _map(fetch, metric_expressions, workers)
+
+    def get_metrics(self, metric_expressions, start=None, stop=None,
+            step=None, limit=None, workers=None):
+        """Fetch many metrics over the same window into one `MetricTable`.
+
+        :param metric_expressions: The metrics to fetch. Equivalent
+            expressions are only fetched once, in their canonical form.
+        :type metric_expressions: list of `MetricExpression` or
+            `CompoundMetricExpression`
+        :param workers: The maximum number of queries in flight at once.
+            Defaults to `pool_maxsize`, so every query has a pooled
+            connection to use.
+        :type workers: int
+        :returns: A `MetricTable` with a column for each distinct
+            expression. An expression Cube rejects, or which can't be
+            fetched, is reported in the table's `errors` instead of failing
+            the whole batch.
+
+        The query parameters are built once for the whole batch, and
+        timestamps shared by the responses are parsed once.
+        """
+        # Expressions compare values like Python, so 1 == 1.0 == True; key
+        # them by their query strings instead, which tell those apart.
+        expressions = []
+        keys = []
+        queries = []
+        written = set()
+        seen = set()
+        for expression in metric_expressions:
+            text = "%s" % expression
+            if text in written:
+                continue
+            written.add(text)
+            canonical = expression.canonicalize()
+            key = "%s" % canonical
+            expressions.append(expression)
+            keys.append(key)
+            if key not in seen:
+                seen.add(key)
+                queries.append(canonical)
+
+        query = self._query("metric/get", start, stop, step, limit)
+        cached = self.cache is not None and start is not None and \
+                step is not None and not limit
+        time_cache = dict()
+
+        def decode(response):
+            return [Metric.from_json(record, time_cache)
+                    for record in self._response_records(response) or []]
+
+        def fetch(expression):
+            try:
+                if cached:
+                    return self._get_metric_cached(expression, start, stop,
+                            step)
+                return self._execute(query, expression, decode)
+            except (InvalidQueryError, requests.RequestException,
+                    ValueError) as e:
+                return e
+
+        if workers is None:
+            workers = self.pool_maxsize
+        results = dict(("%s" % canonical, result) for canonical, result
+                in zip(queries, _map(fetch, queries, workers)))
+        return MetricTable.from_metrics([(expression, results[key])
+            for expression, key in zip(expressions, keys)])
+
+    ### Following methods ###
+    def follow_metric(self, metric_expression, step, start=None, delay=1.0,
+            sleep=time.sleep):
+        """Yield each Metric as its step completes, forever.
+
+        :param metric_expression: The metric to follow.
+        :type metric_expression: `MetricExpression` or
+            `CompoundMetricExpression`
+        :param step: The step of the metric, one of `STEP_CHOICES`.
+        :type step: int
+        :param start: The first step to yield. Defaults to the step in
+            progress.
+        :type start: datetime
+        :param delay: Seconds to wait after a step ends before fetching it,
+            to give the evaluator time to catch up.
+        :type delay: float
+        :param sleep: Called with the number of seconds to wait between
+            polls.
+
+        Each poll fetches only the steps completed since the last one, then
+        sleeps until the next step is due.
+        """
+        if start is None:
+            start = now()
+        following = floor_ms(to_epoch_ms(start), step)
+        while True:
+            current = to_epoch_ms(now())
+            completed = current - current % step
+            if following < completed:
+                # Cube's own method, so an AsyncCube follows synchronously.
+                for metric in Cube.get_metric(self, metric_expression,
+                        from_epoch_ms(following), from_epoch_ms(completed),
+                        step):
+                    bucket = to_epoch_ms(metric.time)
+                    if following <= bucket < completed:
+                        yield metric
+                following = completed
+            sleep(max(0, completed + step - current) / 1000.0 + delay)
+
+    def follow_events(self, event_expression, start=None, limit=None,
+            min_interval=1.0, max_interval=60.0, sleep=time.sleep):
+        """Yield each new Event, oldest first, forever.
+
+        :param event_expression: The events to follow.
+        :type event_expression: `EventExpression`
+        :param start: Only yield Events at or after this time. Defaults to
+            now.
+        :type start: datetime
+        :param limit: The maximum number of Events to fetch per request.
+            Cube returns the newest Events first, so a poll that finds more
+            pages back until it reaches the Events already seen.
+        :type limit: int
+        :param min_interval: Seconds between polls while Events are arriving.
+        :type min_interval: float
+        :param max_interval: The longest wait between polls. The interval
+            doubles after each poll that finds nothing, up to this.
+        :type max_interval: float
+        :param sleep: Called with the number of seconds to wait between
+            polls.
+
+        Each poll only asks for Events since the newest one already seen.
+        Times are compared in UTC, naive ones being taken as UTC already.
+        """
+        if start is None:
+            start = now()
+        latest = start
+        seen = set()
+        interval = min_interval
+        while True:
+            events = self._poll_events(event_expression, latest, seen, limit)
+            if events:
+                for event in events:
+                    yield event
+                if to_utc(events[-1].time) > to_utc(latest):
+                    latest = events[-1].time
+                    seen = set()
+                # Events at exactly `latest` will be returned again.
+                seen.update("%s" % event for event in events
+                        if to_utc(event.time) == to_utc(latest))
+                interval = min_interval
+            else:
+                interval = min(interval * 2, max_interval)
+            sleep(interval)
+
+    def _poll_events(self, event_expression, latest, seen, limit):
+        """The Events after `latest`, or at it but not in `seen`, oldest
+        first.
+
+        Pages back from the newest Event, one `limit` at a time, until a
+        page finds nothing new.
+        """
+        since = to_utc(latest)
+        found = []
+        keys = set()
+        stop = None
+        while True:
+            page = Cube.get_event(self, event_expression, start=latest,
+                    stop=stop, limit=limit)
+            if not page:
+                break
+            fresh = 0
+            for event in page:
+                time_utc = to_utc(event.time)
+                key = "%s" % event
+                if key not in keys and (time_utc > since or
+                        (time_utc == since and key not in seen)):
+                    keys.add(key)
+                    found.append((time_utc, event))
+                    fresh += 1
+            oldest = min(page, key=lambda event: to_utc(event.time)).time
+            if fresh:
+                # Stop is exclusive: ask again for the oldest time, in case
+                # the page ended part way through the Events at it.
+                stop = oldest + timedelta(milliseconds=1)
+            elif to_utc(oldest) > since and stop is not None and \
+                    to_utc(stop) > to_utc(oldest):
+                # More Events at `oldest` than fit in a page; skip them.
+                stop = oldest
+            else:
+                break
+        found.sort(key=lambda item: item[0])
+        return [event for _, event in found]
+
+
+def _map(func, items, workers):
+    """`map` on at most `workers` threads, or serially for a single item."""
+    if len(items) < 2:
+        return [func(item) for item in items]
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+
+
+def _measure_response(stats, response, body=True):
+    """Record what can be told about a query from its response."""
+    elapsed = getattr(response, 'elapsed', None)
+    if elapsed is not None:
+        stats.ttfb = elapsed.total_seconds()
+    stats.retries = getattr(response, 'retries', 0)
+    if body:
+        stats.bytes = len(response.content or b"")
+
+
+def _count_bytes(chunks, stats):
+    for block in chunks:
+        stats.bytes += len(block)
+        yield block
+
+
+def _response_json(response):
+    """The decoded JSON body of a response, or None if it isn't JSON.
+
+    Older versions of requests expose `json` as a property, newer ones as a
+    method.
+    """
+    json = response.json
+    if callable(json):
+        try:
+            json = json()
+        except ValueError:
+            json = None
+    return json
 
 
 class Query(object):
     def __init__(self, base_url, path, start=None, stop=None, step=None,
-            limit=None):
+            limit=None, session=None, timeout=None, retry=None):
         self.base_url = base_url
         self.path = path
         self.params = Query._build_params(start, stop, step, limit)
+        self.session = session
+        self.timeout = timeout
+        self.retry = retry
 
     @classmethod
     def _format_time(cls, t):
@@ -80,13 +671,39 @@ class Query(object):
         return params
 
     def get(self, expression):
+        return self._request(expression)
+
+    def stream(self, expression):
+        """Like `get`, but leave the response body unread on the socket.
+
+        Read it with the response's `iter_content` and `close` it when done.
+        """
+        return self._request(expression, stream=True)
+
+    def _request(self, expression, stream=False):
         params = self.params.copy()
         params.update(expression=expression)
         path = "{base_url}/{path}".format(
                 base_url=self.base_url,
                 path=self.path,
                 )
-        return requests.get(path, params=params)
+        http = self.session if self.session is not None else requests
+
+        def send():
+            return http.get(path, params=params, timeout=self.timeout,
+                    stream=stream)
+
+        if self.retry is None:
+            return send()
+        sent = itertools.count()
+
+        def counted():
+            next(sent)
+            return send()
+
+        response = self.retry.call(counted)
+        response.retries = next(sent) - 1
+        return response
 
 
 class InvalidQueryError(Exception):
@@ -1,7 +1,8 @@
+from collections import namedtuple
 import json
 import types
 
-from dateutil import parser as date_parser
+from pypercube.time_utils import parse_time
 
 
 class Event(object):
@@ -11,6 +12,8 @@ class Event(object):
     TIME_FIELD_NAME = "time"
     DATA_FIELD_NAME = "data"
 
+    __slots__ = ('type', 'time', 'data')
+
     def __init__(self, type, time, data):
         """Create a Cube Event.
 
@@ -23,16 +26,19 @@ class Event(object):
         """
         self.type = type
         if isinstance(time, types.StringTypes):
-            time = date_parser.parse(time, fuzzy=True)
+            time = parse_time(time)
         self.time = time
         self.data = data
 
     @classmethod
-    def from_json(cls, json_obj):
+    def from_json(cls, json_obj, time_cache=None):
         """Build an Event from JSON.
 
         :param json_obj: JSON data representing a Cube Event
         :type json_obj: `String` or `json`
+        :param time_cache: Previously parsed timestamps, shared between the
+            records of one response. See `time_utils.parse_time`.
+        :type time_cache: dict
         :throws: `InvalidEventError` when any of time field is not present
         in json_obj.
         """
@@ -47,6 +53,8 @@ class Event(object):
 
         if cls.TIME_FIELD_NAME in json_obj:
             time = json_obj[cls.TIME_FIELD_NAME]
+            if isinstance(time, types.StringTypes):
+                time = parse_time(time, time_cache)
         else:
             raise InvalidEventError("{field} must be present!".format(
                 field=cls.TIME_FIELD_NAME))
@@ -75,6 +83,62 @@ class Event(object):
                 len(self.data) == len(other.data) and \
                 self.data == other.data
 
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        # __slots__ classes can't be pickled with protocols 0 and 1 otherwise
+        return (self.__class__, (self.type, self.time, self.data))
+
+    def freeze(self):
+        """An immutable, hashable copy of this Event.
+
+        The data dictionary is shared with this Event, not copied.
+        """
+        return FrozenEvent(self.type, self.time, self.data)
+
+
+class FrozenEvent(namedtuple("FrozenEvent", ["type", "time", "data"])):
+    """An immutable, hashable Cube Event.
+
+    Behaves like an `Event` but is a tuple, so it is as compact as possible
+    and can be used as a dict key or set member. Only the type and time are
+    hashed, as the data dictionary is not hashable.
+
+    >>> e = FrozenEvent.from_json('{"type": "request", '
+    ...     '"time": "2012-07-06T20:30:00", "data": {"path": "/"}}')
+    >>> e.data
+    {u'path': u'/'}
+    >>> e == Event("request", "2012-07-06T20:30:00", {"path": "/"}).freeze()
+    True
+    >>> len(set([e, e.thaw().freeze()]))
+    1
+    """
+    TYPE_FIELD_NAME = Event.TYPE_FIELD_NAME
+    TIME_FIELD_NAME = Event.TIME_FIELD_NAME
+    DATA_FIELD_NAME = Event.DATA_FIELD_NAME
+
+    __slots__ = ()
+
+    def __new__(cls, type, time, data):
+        if isinstance(time, types.StringTypes):
+            time = parse_time(time)
+        return super(FrozenEvent, cls).__new__(cls, type, time, data)
+
+    from_json = Event.__dict__['from_json']
+    to_json = Event.__dict__['to_json']
+    __str__ = Event.__dict__['__str__']
+
+    def __repr__(self):
+        return "<FrozenEvent: {value}>".format(value=self)
+
+    def __hash__(self):
+        return hash((self.type, self.time))
+
+    def thaw(self):
+        """A mutable `Event` copy of this FrozenEvent."""
+        return Event(self.type, self.time, self.data)
+
 
 class InvalidEventError(Exception):
     pass
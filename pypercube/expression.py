@@ -1,13 +1,27 @@
+import fractions
+import numbers
+import operator
 import types
+import weakref
 
 from pypercube import filters
 
+OPERATORS = {
+        "+": operator.add,
+        "-": operator.sub,
+        "*": operator.mul,
+        "/": operator.truediv,
+        }
+
 
 class CompoundMetricExpression(object):
     """CompoundMetricExpressions have two MetricExpressions and an operator.
 
     Used to do calculated metrics like sum(request(elapsed_ms)) / sum(request)
     """
+    # Computed lazily by canonicalize()
+    _canonical = None
+
     def __init__(self, metric1, operator=None, metric2=None):
         """Create a CompoundMetricExpression.
 
@@ -32,29 +46,127 @@ class CompoundMetricExpression(object):
         >>> print(m + m * m / m)
         (sum(request) + ((sum(request) * sum(request)) / sum(request)))
         """
-        if not operator and metric2:
+        if not operator and metric2 is not None:
             raise ValueError("You must have an operator if metric2 is"
                 "defined.")
-        self.metric1 = metric1
-        self.operator = operator
-        self.metric2 = metric2
+        self._metric1 = metric1
+        self._operator = operator
+        self._metric2 = metric2
+        expression = "%s" % metric1
+        if operator and metric2 is not None:
+            expression = "({left} {op} {right})".format(left=expression,
+                    op=operator, right=metric2)
+        self._expression = expression
+        self._hash = hash((metric1, operator, metric2))
+
+    metric1 = property(lambda self: self._metric1)
+    operator = property(lambda self: self._operator)
+    metric2 = property(lambda self: self._metric2)
 
     def __eq__(self, other):
         """Note that this tests for *equality* not *equivalence*, eg
         m + (m + m) != (m + m) + m, though the two expressions are equivalent.
+        Compare their `canonicalize()`d forms to test for equivalence.
         """
         return self.metric1 == other.metric1 and \
                 self.operator == other.operator and \
                 self.metric2 == other.metric2
 
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def leaves(self):
+        """The distinct MetricExpressions this expression is built from.
+
+        >>> e = EventExpression('request')
+        >>> m = Sum(e) / Sum(e.eq('path', '/')) + Sum(e)
+        >>> for leaf in m.leaves():
+        ...     print(leaf)
+        sum(request)
+        sum(request.eq(path, "/"))
+        """
+        leaves = []
+        seen = set()
+        for metric in (self.metric1, self.metric2):
+            if hasattr(metric, 'leaves'):
+                for leaf in metric.leaves():
+                    if leaf not in seen:
+                        seen.add(leaf)
+                        leaves.append(leaf)
+        return leaves
+
+    def canonicalize(self):
+        """An equivalent expression in a normal form.
+
+        Chains of + and -, and of * and /, are flattened and their operands
+        sorted, and the constants in each chain are folded into one. Every
+        leaf is canonicalized too, so equivalent metrics written differently
+        render to the same query string. The result may differ from this
+        expression by floating-point rounding.
+
+        Divisions are only regrouped where that can't change which points
+        divide by zero, and nothing is cancelled or multiplied out.
+
+        >>> a, b = Sum(EventExpression('a')), Sum(EventExpression('b'))
+        >>> print((b + (a - 2)) * 2 * 3)
+        (((sum(b) + (sum(a) - 2)) * 2) * 3)
+        >>> print(((b + (a - 2)) * 2 * 3).canonicalize())
+        (((sum(a) + sum(b)) - 2) * 6)
+        >>> (a + (b + a)).canonicalize() == ((a + a) + b).canonicalize()
+        True
+        """
+        if self._canonical is None:
+            # Canonicalize the operands first, deepest first, so this
+            # doesn't recurse once per level of a deep expression.
+            pending = [self]
+            order = []
+            while pending:
+                metric = pending.pop()
+                order.append(metric)
+                pending.extend(m for m in _operands(metric)
+                        if isinstance(m, CompoundMetricExpression) and
+                        m._canonical is None)
+            for metric in reversed(order[1:]):
+                metric.canonicalize()
+            canonical = _canonical(self)
+            if not isinstance(canonical, CompoundMetricExpression):
+                canonical = CompoundMetricExpression(canonical)
+            canonical._canonical = canonical
+            self._canonical = canonical
+        return self._canonical
+
+    def evaluate(self, values):
+        """Compute this expression from the values of its leaves.
+
+        :param values: The value of each of `leaves()` at one point in time.
+            A missing or None value makes the result None.
+        :type values: dict
+        :returns: The value of this expression, or None if it can't be
+            computed, eg when dividing by zero.
+
+        >>> e = EventExpression('request')
+        >>> m = (Sum(e) + Max(e)) / 2
+        >>> m.evaluate({Sum(e): 10, Max(e): 5})
+        7.5
+        >>> print(m.evaluate({Sum(e): 10}))
+        None
+        """
+        left = _evaluate(self.metric1, values)
+        if not self.operator:
+            return left
+        right = _evaluate(self.metric2, values)
+        if left is None or right is None:
+            return None
+        try:
+            return OPERATORS[self.operator](left, right)
+        except ZeroDivisionError:
+            return None
+
     def __str__(self):
-        response = "%s" % self.metric1
-        if self.operator and self.metric2:
-            response = "(" + response
-            response += " {op} {right})".format(
-                    op=self.operator,
-                    right=self.metric2)
-        return response
+        return self._expression
 
     def __add__(self, right):
         """
@@ -98,6 +210,9 @@ class CompoundMetricExpression(object):
 
 class MetricExpression(object):
     """A single MetricExpression."""
+    # Computed lazily by canonicalize()
+    _canonical = None
+
     def __init__(self, metric_type, event_expression):
         """Calculate a Cube Metric.
 
@@ -119,13 +234,18 @@ class MetricExpression(object):
         if len(event_expression.event_properties) > 1:
             raise ValueError("Events for Metrics may only select a single "
                     "event property")
-        self.metric_type = metric_type
-        self.event_expression = event_expression
+        self._metric_type = metric_type
+        self._event_expression = event_expression
+        self._expression = "{type}({value})".format(
+                type=metric_type,
+                value=event_expression)
+        self._hash = hash((metric_type, event_expression))
+
+    metric_type = property(lambda self: self._metric_type)
+    event_expression = property(lambda self: self._event_expression)
 
     def __str__(self):
-        return "{type}({value})".format(
-                type=self.metric_type,
-                value=self.event_expression)
+        return self._expression
 
     def __add__(self, right):
         return CompoundMetricExpression(self) + right
@@ -153,6 +273,187 @@ class MetricExpression(object):
         return self.metric_type == other.metric_type and \
                 self.event_expression == other.event_expression
 
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def canonicalize(self):
+        """This metric over its canonical EventExpression."""
+        if self._canonical is None:
+            event_expression = self.event_expression.canonicalize()
+            if event_expression is self.event_expression:
+                canonical = self
+            else:
+                canonical = MetricExpression(self.metric_type,
+                        event_expression)
+                canonical._canonical = canonical
+            self._canonical = canonical
+        return self._canonical
+
+    def leaves(self):
+        """A MetricExpression is its own only leaf."""
+        return [self]
+
+    def evaluate(self, values):
+        """Look up the value of this MetricExpression in `values`."""
+        return values.get(self)
+
+
+def _is_number(metric):
+    return isinstance(metric, numbers.Number) and \
+            not isinstance(metric, bool)
+
+
+def _canonical(metric):
+    """The canonical form of a metric, or a number for a constant."""
+    if _is_number(metric):
+        return metric
+    if isinstance(metric, MetricExpression):
+        return metric.canonicalize()
+    if metric._canonical is not None:
+        metric = metric._canonical
+        return metric if metric.operator else metric.metric1
+    if not metric.operator:
+        return _canonical(metric.metric1)
+    if metric.operator in ("+", "-"):
+        return _canonical_sum(metric)
+    return _canonical_product(metric)
+
+
+def _is_compound(metric, operators):
+    return isinstance(metric, CompoundMetricExpression) and \
+            metric.operator in operators
+
+
+def _join(left, operator, right):
+    """A node of a canonical form, which is its own canonical form."""
+    metric = CompoundMetricExpression(left, operator, right)
+    metric._canonical = metric
+    return metric
+
+
+def _sum_terms(metric, sign=1):
+    """The (operand, sign) pairs of a chain of + and -, left to right."""
+    terms = []
+    pending = [(metric, sign)]
+    while pending:
+        m, sign = pending.pop()
+        if _is_compound(m, ("+", "-")):
+            pending.append((m.metric2,
+                sign if m.operator == "+" else -sign))
+            pending.append((m.metric1, sign))
+        elif isinstance(m, CompoundMetricExpression) and not m.operator:
+            pending.append((m.metric1, sign))
+        else:
+            terms.append((m, sign))
+    return terms
+
+
+def _product_factors(metric, below=False):
+    """The (operand, below) pairs of a chain of * and /, left to right.
+
+    Operands below a division line are in the denominator. A division in
+    the denominator is an operand itself.
+    """
+    factors = []
+    pending = [(metric, below)]
+    while pending:
+        m, below = pending.pop()
+        if _is_compound(m, ("*",)) or (_is_compound(m, ("/",)) and not below):
+            pending.append((m.metric2, below or m.operator == "/"))
+            pending.append((m.metric1, below))
+        elif isinstance(m, CompoundMetricExpression) and not m.operator:
+            pending.append((m.metric1, below))
+        else:
+            factors.append((m, below))
+    return factors
+
+
+def _operands(metric):
+    """The sub-expressions `_canonical` canonicalizes a metric from."""
+    while isinstance(metric, CompoundMetricExpression) and \
+            not metric.operator:
+        metric = metric.metric1
+    if not isinstance(metric, CompoundMetricExpression):
+        return []
+    if metric.operator in ("+", "-"):
+        return [m for m, _ in _sum_terms(metric)]
+    return [m for m, _ in _product_factors(metric)]
+
+
+def _canonical_sum(metric):
+    positive, negative = [], []
+    constants = [0]
+    pending = _sum_terms(metric)[::-1]
+    while pending:
+        m, sign = pending.pop()
+        c = _canonical(m)
+        if _is_compound(c, ("+", "-")):
+            pending.extend(reversed(_sum_terms(c, sign)))
+        elif _is_number(c):
+            constants.append(c if sign > 0 else -c)
+        else:
+            (positive if sign > 0 else negative).append(c)
+
+    constant = sum(constants)
+    result = None
+    for term in sorted(positive, key=str):
+        result = term if result is None else _join(result, "+", term)
+    if constant or result is None:
+        if result is None:
+            result = constant
+        elif constant > 0:
+            result = _join(result, "+", constant)
+        else:
+            result = _join(result, "-", -constant)
+    for term in sorted(negative, key=str):
+        result = _join(result, "-", term)
+    return result
+
+
+def _canonical_product(metric):
+    numerator, denominator = [], []
+    constants = [[1], [1]]
+    pending = _product_factors(metric)[::-1]
+    while pending:
+        m, below = pending.pop()
+        c = _canonical(m)
+        if _is_compound(c, ("*",)) or (_is_compound(c, ("/",)) and not below):
+            pending.extend(reversed(_product_factors(c, below)))
+        elif _is_number(c) and not (below and c == 0):
+            constants[below].append(c)
+        else:
+            # Dividing by a division stays as it is: regrouping it could
+            # move a division by zero.
+            (denominator if below else numerator).append(c)
+
+    top = reduce(operator.mul, constants[0])
+    bottom = reduce(operator.mul, constants[1])
+    if isinstance(top, (int, long)) and isinstance(bottom, (int, long)):
+        divisor = fractions.gcd(top, bottom)
+        top, bottom = top // divisor, bottom // divisor
+    elif bottom != 1:
+        top, bottom = top / float(bottom), 1
+
+    result = None
+    for factor in sorted(numerator, key=str):
+        result = factor if result is None else _join(result, "*", factor)
+    if top != 1 or result is None:
+        result = top if result is None else _join(result, "*", top)
+    for factor in sorted(denominator, key=str):
+        result = _join(result, "/", factor)
+    if bottom != 1:
+        result = _join(result, "/", bottom)
+    return result
+
+
+def _evaluate(metric, values):
+    if hasattr(metric, 'evaluate'):
+        return metric.evaluate(values)
+    return metric
+
 
 class Sum(MetricExpression):
     """A "sum" metric."""
@@ -185,6 +486,12 @@ class Distinct(MetricExpression):
 
 
 class EventExpression(object):
+    # Compiled lazily by compile() and project()
+    _predicate = None
+    _properties = None
+    # Computed lazily by canonicalize()
+    _canonical = None
+
     def __init__(self, event_type, event_properties=None):
         """Create an Event expression.
 
@@ -203,18 +510,61 @@ class EventExpression(object):
         request(elapsed_ms).eq(path, "/").gt(elapsed_ms, 100).lt(elapsed_ms,
                 1000)
         """
-        self.event_type = event_type
         if event_properties:
             if isinstance(event_properties, types.StringTypes):
                 event_properties = [event_properties]
         else:
             event_properties = []
-        self.event_properties = event_properties
-        self.filters = []
+        self._event_type = event_type
+        self._event_properties = tuple(event_properties)
+        # Filtered expressions are a chain of links back to this one, each
+        # adding one filter and sharing everything before it.
+        self._parent = None
+        self._filter_link = None
+        self._filters = ()
+        self._expression = self._build_expression(event_type,
+                self._event_properties, ())
+        self._hash = hash((event_type, self._event_properties))
+
+    event_type = property(lambda self: self._event_type)
+
+    @property
+    def event_properties(self):
+        """The properties to fetch from the event, as a list."""
+        return list(self._event_properties)
+
+    @property
+    def filters(self):
+        """The filters of this expression, as a tuple."""
+        if self._filters is None:
+            added = []
+            link = self
+            while link._filters is None:
+                added.append(link._filter_link)
+                link = link._parent
+            added.reverse()
+            self._filters = link._filters + tuple(added)
+        return self._filters
 
     def copy(self):
-        c = EventExpression(self.event_type, self.event_properties[:])
-        c.filters = self.filters[:]
+        """EventExpressions are immutable, so this is the same expression."""
+        return self
+
+    def _filter(self, filter):
+        """A new EventExpression with `filter` appended to its filters.
+
+        This takes constant time: the new expression links back to this one
+        rather than copying its filters, and its filters and query string are
+        only assembled when first asked for.
+        """
+        c = self.__class__.__new__(self.__class__)
+        c._event_type = self._event_type
+        c._event_properties = self._event_properties
+        c._parent = self
+        c._filter_link = filter
+        c._filters = None
+        c._expression = None
+        c._hash = hash((self._hash, filter))
         return c
 
     def __eq__(self, other):
@@ -227,6 +577,8 @@ class EventExpression(object):
         >>> e1 == e2
         False
         """
+        if self is other:
+            return True
         return self.event_type == other.event_type and \
                 len(self.event_properties) == len(other.event_properties) and \
                 all((x == y) for (x, y) in \
@@ -235,6 +587,12 @@ class EventExpression(object):
                 len(self.filters) == len(other.filters) and \
                 all((x == y) for (x, y) in zip(self.filters, other.filters))
 
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
     def eq(self, event_property, value):
         """An equals filter chain.
 
@@ -243,9 +601,7 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).eq(path, "/")
         """
-        c = self.copy()
-        c.filters.append(filters.EQ(event_property, value))
-        return c
+        return self._filter(filters.EQ(event_property, value))
 
     def ne(self, event_property, value):
         """A not-equal filter chain.
@@ -255,9 +611,7 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).ne(path, "/")
         """
-        c = self.copy()
-        c.filters.append(filters.NE(event_property, value))
-        return c
+        return self._filter(filters.NE(event_property, value))
 
     def lt(self, event_property, value):
         """A less-than filter chain.
@@ -267,9 +621,7 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).lt(elapsed_ms, 500)
         """
-        c = self.copy()
-        c.filters.append(filters.LT(event_property, value))
-        return c
+        return self._filter(filters.LT(event_property, value))
 
     def le(self, event_property, value):
         """A less-than-or-equal-to filter chain.
@@ -279,9 +631,7 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).le(elapsed_ms, 500)
         """
-        c = self.copy()
-        c.filters.append(filters.LE(event_property, value))
-        return c
+        return self._filter(filters.LE(event_property, value))
 
     def gt(self, event_property, value):
         """A greater-than filter chain.
@@ -291,9 +641,7 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).gt(elapsed_ms, 500)
         """
-        c = self.copy()
-        c.filters.append(filters.GT(event_property, value))
-        return c
+        return self._filter(filters.GT(event_property, value))
 
     def ge(self, event_property, value):
         """A greater-than-or-equal-to filter chain.
@@ -303,9 +651,7 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).ge(elapsed_ms, 500)
         """
-        c = self.copy()
-        c.filters.append(filters.GE(event_property, value))
-        return c
+        return self._filter(filters.GE(event_property, value))
 
     def re(self, event_property, value):
         """A regular expression filter chain.
@@ -315,9 +661,7 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).re(path, "[^A-Za-z0-9+]")
         """
-        c = self.copy()
-        c.filters.append(filters.RE(event_property, value))
-        return c
+        return self._filter(filters.RE(event_property, value))
 
     def startswith(self, event_property, value):
         """A starts-with filter chain.
@@ -327,10 +671,8 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).re(path, "^/cube")
         """
-        c = self.copy()
-        c.filters.append(filters.RE(event_property, "^{value}".format(
+        return self._filter(filters.RE(event_property, "^{value}".format(
             value=value)))
-        return c
 
     def endswith(self, event_property, value):
         """An ends-with filter chain.
@@ -340,10 +682,8 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).re(path, ".*event/get$")
         """
-        c = self.copy()
-        c.filters.append(filters.RE(event_property, ".*{value}$".format(
+        return self._filter(filters.RE(event_property, ".*{value}$".format(
             value=value)))
-        return c
 
     def contains(self, event_property, value):
         """A string-contains filter chain.
@@ -353,10 +693,8 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).re(path, ".*event.*")
         """
-        c = self.copy()
-        c.filters.append(filters.RE(event_property, ".*{value}.*".format(
+        return self._filter(filters.RE(event_property, ".*{value}.*".format(
             value=value)))
-        return c
 
     def in_array(self, event_property, value):
         """An in-array filter chain.
@@ -369,15 +707,120 @@ class EventExpression(object):
         >>> print(filtered)
         request(elapsed_ms).in(path, ["/event", "/"])
         """
-        c = self.copy()
-        c.filters.append(filters.IN(event_property, value))
-        return c
+        return self._filter(filters.IN(event_property, value))
 
-    def get_expression(self):
-        event_type = self.event_type
-        event_property = self.event_properties
-        filters = self.filters
+    def canonicalize(self):
+        """An equivalent expression in a normal form.
 
+        Properties are sorted and deduplicated, and so are filters, after
+        each is put in a normal form (see `Filter.canonicalize`).
+
+        >>> e1 = EventExpression('request').gt('ms', 500).contains('path', 'a')
+        >>> e2 = EventExpression('request').re('path', 'a').gt('ms', 500.0)
+        >>> print(e1.canonicalize())
+        request.gt(ms, 500).re(path, "a")
+        >>> e1.canonicalize() == e2.canonicalize()
+        True
+        """
+        if self._canonical is None:
+            canonical_filters = dict((f.sort_key(), f)
+                    for f in (f.canonicalize() for f in self.filters))
+            canonical = EventExpression(self._event_type,
+                    sorted(set(self._event_properties)))
+            for key in sorted(canonical_filters):
+                canonical = canonical._filter(canonical_filters[key])
+            if canonical == self:
+                canonical = self
+            canonical._canonical = canonical
+            self._canonical = canonical
+        return self._canonical
+
+    def compile(self):
+        """Compile this expression into a predicate on an `Event`.
+
+        The Event matches if it has this expression's type and passes every
+        filter; see `Filter.compile`.
+
+        >>> from pypercube.event import Event
+        >>> match = EventExpression('request').eq('path', '/').compile()
+        >>> match(Event('request', '2012-07-06T20:33:16', {'path': '/'}))
+        True
+        >>> match(Event('request', '2012-07-06T20:33:16', {'path': '/a'}))
+        False
+        """
+        if self._predicate is None:
+            event_type = self._event_type
+            tests = [f.compile() for f in self.filters]
+
+            def predicate(event):
+                if event.type != event_type:
+                    return False
+                data = event.data if event.data is not None else {}
+                for test in tests:
+                    if not test(data):
+                        return False
+                return True
+            self._predicate = predicate
+        return self._predicate
+
+    def project(self, event):
+        """Trim an Event's data to this expression's properties, as Cube does.
+
+        Events are returned as they are if no properties are selected.
+        """
+        if not self._event_properties:
+            return event
+        if self._properties is None:
+            self._properties = [(name.split("."),
+                filters.property_getter(name))
+                for name in self._event_properties]
+        data = dict()
+        for path, get in self._properties:
+            value = get(event.data or {})
+            if value is filters.MISSING:
+                continue
+            target = data
+            for key in path[:-1]:
+                target = target.setdefault(key, dict())
+            target[path[-1]] = value
+        return event.__class__(event.type, event.time, data)
+
+    def filter(self, events, project=True):
+        """Yield the Events that match this expression.
+
+        :param events: The Events to filter, eg from `Cube.get_event` or
+            `Cube.iter_events` with a broader expression.
+        :type events: iterable of `Event`
+        :param project: Trim each Event's data to the selected properties.
+        :type project: bool
+
+        >>> from pypercube.event import Event
+        >>> events = [Event('request', '2012-07-06T20:33:16',
+        ...     {'path': '/', 'elapsed_ms': 10}), Event('request',
+        ...     '2012-07-06T20:33:17', {'path': '/a', 'elapsed_ms': 20})]
+        >>> e = EventExpression('request', 'elapsed_ms').ne('path', '/')
+        >>> [event.data for event in e.filter(events)]
+        [{'elapsed_ms': 20}]
+        """
+        match = self.compile()
+        for event in events:
+            if match(event):
+                yield self.project(event) if project else event
+
+    def get_expression(self):
+        if self._expression is None:
+            parts = []
+            link = self
+            while link._expression is None:
+                parts.append(str(link._filter_link))
+                link = link._parent
+            parts.append(link._expression)
+            parts.reverse()
+            self._expression = "".join(parts)
+        return self._expression
+
+    @classmethod
+    def _build_expression(cls, event_type, event_property, filters):
         expression = "{event_type}".format(event_type=event_type)
 
         if event_property:
@@ -397,3 +840,39 @@ class EventExpression(object):
 
     def __str__(self):
         return self.get_expression()
+
+
+_interned = weakref.WeakValueDictionary()
+
+
+def canonical_string(expression):
+    """The query string of an expression's canonical form.
+
+    Use it to key caches and deduplicate queries by what an expression
+    means rather than how it was written. A query that is already a string
+    is returned as it is.
+
+    >>> e = EventExpression('request')
+    >>> canonical_string(Sum(e) * 2 * 30) == canonical_string(Sum(e) * 60)
+    True
+    >>> canonical_string("sum(request)")
+    'sum(request)'
+    """
+    if isinstance(expression, types.StringTypes):
+        return expression
+    return "%s" % expression.canonicalize()
+
+
+def intern_expression(expression):
+    """The canonical instance of an expression.
+
+    Expressions that render to the same Cube query share one instance, so
+    they can be compared by identity and the duplicates freed.
+
+    >>> e1 = intern_expression(EventExpression('request').eq('path', '/'))
+    >>> e2 = intern_expression(EventExpression('request').eq('path', '/'))
+    >>> e1 is e2
+    True
+    """
+    key = (expression.__class__, "%s" % expression)
+    return _interned.setdefault(key, expression)
@@ -1,4 +1,10 @@
 import json
+import numbers
+import re
+import types
+
+# Stands in for a property an event doesn't have.
+MISSING = object()
 
 
 class Filter(object):
@@ -22,6 +28,72 @@ class Filter(object):
                 name=self.__class__.__name__,
                 value=self)
 
+    def compile(self):
+        """Compile this filter into a predicate on an event's data dict.
+
+        The predicate follows Cube's (ie MongoDB's) semantics: dotted
+        property names look inside nested objects, an event without the
+        property only matches "ne", and ordering comparisons only match
+        values of the same kind (numbers with numbers, strings with strings).
+        A boolean only equals a boolean, never 0 or 1. An array matches if
+        it or any one of its elements does, and "ne" only if "eq" doesn't.
+
+        >>> match = GT('elapsed_ms', 500).compile()
+        >>> match({'elapsed_ms': 501}), match({'elapsed_ms': '501'}), match({})
+        (True, False, False)
+        >>> match = RE('request.path', '^/api').compile()
+        >>> match({'request': {'path': '/api/1.0'}})
+        True
+        >>> EQ('tags', 'a').compile()({'tags': ['a', 'b']})
+        True
+        >>> NE('tags', 'a').compile()({'tags': ['a', 'b']})
+        False
+        """
+        get = property_getter(self.property_name)
+        if self.type == "ne":
+            equal = _any(_TESTS["eq"](self.value))
+            test = lambda value: not equal(value)
+        else:
+            test = _any(_TESTS[self.type](self.value))
+        match_missing = self.type == "ne"
+
+        def predicate(data):
+            value = get(data)
+            if value is MISSING:
+                return match_missing
+            return test(value)
+        return predicate
+
+    def canonicalize(self):
+        """An equivalent Filter in a normal form.
+
+        Integral floats become ints, "in" arrays are sorted and deduplicated,
+        and the ".*" that `contains` and `endswith` wrap around a regular
+        expression is dropped, since a regular expression may match anywhere
+        anyway.
+
+        >>> print(RE('path', '.*event.*').canonicalize())
+        .re(path, "event")
+        >>> print(IN('status', [500, 404.0, 500]).canonicalize())
+        .in(status, [404, 500])
+        """
+        value = self.value
+        if self.type == "re" and isinstance(value, types.StringTypes):
+            value = _canonical_re(value)
+        elif self.type == "in":
+            values = dict((_sort_key(v), v)
+                    for v in (_canonical_number(v) for v in value))
+            value = [values[key] for key in sorted(values)]
+        else:
+            value = _canonical_number(value)
+        if value == self.value and type(value) is type(self.value):
+            return self
+        return Filter(self.type, self.property_name, value)
+
+    def sort_key(self):
+        """Orders filters by property, then type, then value."""
+        return (self.property_name, self.type, _sort_key(self.value))
+
     def __str__(self):
         return ".{type}({property}, {value})".format(
                 type=self.type,
@@ -29,9 +101,154 @@ class Filter(object):
                 value=json.dumps(self.value))
 
     def __eq__(self, other):
+        # Compare values as Cube reads them: 1 is 1.0, but true isn't 1.
         return self.type == other.type and \
                 self.property_name == other.property_name and \
-                self.value == other.value
+                _value_key(self.value) == _value_key(other.value)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.type, self.property_name,
+            _value_key(self.value)))
+
+
+def property_getter(property_name):
+    """A function looking up a (possibly dotted) property in a data dict.
+
+    It returns `MISSING` when the property isn't there.
+    """
+    path = property_name.split(".")
+
+    def get(data):
+        for name in path:
+            if not isinstance(data, dict) or name not in data:
+                return MISSING
+            data = data[name]
+        return data
+    return get
+
+
+def _canonical_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _integral(value):
+    """A JSON value with every integral float, at any depth, an int."""
+    if isinstance(value, (list, tuple)):
+        return [_integral(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, _integral(item)) for key, item in value.iteritems())
+    return _canonical_number(value)
+
+
+def _value_key(value):
+    """The canonical JSON of a value, equal wherever Cube's reading is."""
+    return json.dumps(_integral(value), sort_keys=True)
+
+
+def _sort_key(value):
+    return json.dumps(value, sort_keys=True)
+
+
+def _canonical_re(pattern):
+    """Drop a leading or trailing ".*" from an unanchored pattern.
+
+    "^.*" and ".*$" are kept: "." doesn't match a newline, so they aren't
+    no-ops.
+    """
+    if pattern.startswith(".*") and pattern[2:3] not in ("?", "+", "*", "{"):
+        pattern = pattern[2:]
+    if pattern.endswith(".*"):
+        escapes = len(pattern[:-2]) - len(pattern[:-2].rstrip("\\"))
+        if escapes % 2 == 0:
+            pattern = pattern[:-2]
+    return pattern
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, numbers.Number):
+        return numbers.Number
+    if isinstance(value, types.StringTypes):
+        return types.StringTypes
+    return type(value)
+
+
+def _ordering(compare):
+    def test(expected):
+        kind = _kind(expected)
+        return lambda value: _kind(value) is kind and compare(value, expected)
+    return test
+
+
+def _equal(value, expected):
+    """JSON equality: 1 equals 1.0, but a boolean only equals a boolean."""
+    if isinstance(value, bool) or isinstance(expected, bool):
+        return type(value) is type(expected) and value == expected
+    if isinstance(value, list) and isinstance(expected, (list, tuple)):
+        return len(value) == len(expected) and \
+                all(_equal(v, e) for v, e in zip(value, expected))
+    if isinstance(value, dict) and isinstance(expected, dict):
+        return set(value) == set(expected) and \
+                all(_equal(value[key], expected[key]) for key in value)
+    return value == expected
+
+
+def _hash_key(value):
+    # Keeps True and 1 apart in a set.
+    return isinstance(value, bool), value
+
+
+def _any(test):
+    """Match an array if it, or any one of its elements, matches."""
+    def matches(value):
+        if test(value):
+            return True
+        return isinstance(value, list) and any(test(item) for item in value)
+    return matches
+
+
+def _eq(expected):
+    return lambda value: _equal(value, expected)
+
+
+def _in(expected):
+    expected = list(expected)
+    try:
+        keys = frozenset(_hash_key(item) for item in expected)
+    except TypeError:
+        keys = None
+
+    def test(value):
+        if keys is not None:
+            try:
+                return _hash_key(value) in keys
+            except TypeError:
+                pass
+        return any(_equal(value, item) for item in expected)
+    return test
+
+
+def _re(expected):
+    search = re.compile(expected).search
+    return lambda value: isinstance(value, types.StringTypes) and \
+            search(value) is not None
+
+
+_TESTS = {
+        "eq": _eq,
+        "lt": _ordering(lambda value, expected: value < expected),
+        "le": _ordering(lambda value, expected: value <= expected),
+        "gt": _ordering(lambda value, expected: value > expected),
+        "ge": _ordering(lambda value, expected: value >= expected),
+        "re": _re,
+        "in": _in,
+        }
 
 
 class EQ(Filter):
@@ -1,13 +1,16 @@
+from collections import namedtuple
 import json
 import types
 
-from dateutil import parser as date_parser
+from pypercube.time_utils import parse_time
 
 
 class Metric(object):
     TIME_FIELD_NAME = "time"
     VALUE_FIELD_NAME = "value"
 
+    __slots__ = ('time', 'value')
+
     def __init__(self, time, value):
         """Build a Cube Metric.
 
@@ -17,16 +20,19 @@ class Metric(object):
         :type data: object
         """
         if isinstance(time, types.StringTypes):
-            time = date_parser.parse(time, fuzzy=True)
+            time = parse_time(time)
         self.time = time
         self.value = value
 
     @classmethod
-    def from_json(cls, json_obj):
+    def from_json(cls, json_obj, time_cache=None):
         """Build a MetricResponse from JSON.
 
         :param json_obj: JSON data representing a Cube Metric.
         :type json_obj: `String` or `json`
+        :param time_cache: Previously parsed timestamps, shared between the
+            records of one response. See `time_utils.parse_time`.
+        :type time_cache: dict
         :throws: `InvalidMetricError` when any of {type,time,data} fields are
         not present in json_obj.
         """
@@ -38,6 +44,8 @@ class Metric(object):
 
         if cls.TIME_FIELD_NAME in json_obj:
             time = json_obj[cls.TIME_FIELD_NAME]
+            if isinstance(time, types.StringTypes):
+                time = parse_time(time, time_cache)
         else:
             raise InvalidMetricError("{field} must be present!".format(
                 field=cls.TIME_FIELD_NAME))
@@ -63,6 +71,54 @@ class Metric(object):
         return self.time == other.time and \
                 self.value == other.value
 
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        # __slots__ classes can't be pickled with protocols 0 and 1 otherwise
+        return (self.__class__, (self.time, self.value))
+
+    def freeze(self):
+        """An immutable, hashable copy of this Metric."""
+        return FrozenMetric(self.time, self.value)
+
+
+class FrozenMetric(namedtuple("FrozenMetric", ["time", "value"])):
+    """An immutable, hashable Cube Metric.
+
+    Behaves like a `Metric` but is a tuple, so it is as compact as possible
+    and can be used as a dict key or set member.
+
+    >>> m = FrozenMetric.from_json('{"time": "2012-07-06T20:30:00", '
+    ...     '"value": 1}')
+    >>> m.value
+    1
+    >>> m == Metric("2012-07-06T20:30:00", 1).freeze()
+    True
+    >>> len(set([m, m.thaw().freeze()]))
+    1
+    """
+    TIME_FIELD_NAME = Metric.TIME_FIELD_NAME
+    VALUE_FIELD_NAME = Metric.VALUE_FIELD_NAME
+
+    __slots__ = ()
+
+    def __new__(cls, time, value):
+        if isinstance(time, types.StringTypes):
+            time = parse_time(time)
+        return super(FrozenMetric, cls).__new__(cls, time, value)
+
+    from_json = Metric.__dict__['from_json']
+    to_json = Metric.__dict__['to_json']
+    __str__ = Metric.__dict__['__str__']
+
+    def __repr__(self):
+        return "<FrozenMetric: {value}>".format(value=self)
+
+    def thaw(self):
+        """A mutable `Metric` copy of this FrozenMetric."""
+        return Metric(self.time, self.value)
+
 
 class InvalidMetricError(Exception):
     pass
@@ -0,0 +1,249 @@
+"""Parse Cube query strings back into expressions.
+
+The strings pypercube renders round-trip exactly:
+
+>>> m = parse_metric('(sum(request(elapsed_ms).eq(path, "/")) / '
+...     'sum(request.eq(path, "/")))')
+>>> m.leaves()[0].event_expression.filters
+(<EQ: .eq(path, "/")>,)
+>>> print(m)
+(sum(request(elapsed_ms).eq(path, "/")) / sum(request.eq(path, "/")))
+
+Operators without parentheses follow the usual precedence, so
+"sum(a) + sum(b) * 2" parses as "(sum(a) + (sum(b) * 2))".
+"""
+from collections import OrderedDict
+import json
+import re
+import threading
+
+from pypercube import filters
+from pypercube.expression import CompoundMetricExpression
+from pypercube.expression import Distinct
+from pypercube.expression import EventExpression
+from pypercube.expression import Max
+from pypercube.expression import Median
+from pypercube.expression import MetricExpression
+from pypercube.expression import Min
+from pypercube.expression import Sum
+
+METRICS = {
+        "sum": Sum,
+        "min": Min,
+        "max": Max,
+        "median": Median,
+        "distinct": Distinct,
+        }
+FILTERS = {
+        "eq": filters.EQ,
+        "ne": filters.NE,
+        "lt": filters.LT,
+        "le": filters.LE,
+        "gt": filters.GT,
+        "ge": filters.GE,
+        "re": filters.RE,
+        "in": filters.IN,
+        }
+
+_NAME = re.compile(r"[A-Za-z_]\w*")
+_PROPERTY = re.compile(r"[^\s(),]+")
+_NUMBER = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_SPACE = re.compile(r"\s*")
+_DECODER = json.JSONDecoder()
+
+
+class ParseError(ValueError):
+    pass
+
+
+class _Parser(object):
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def error(self, expected):
+        raise ParseError("Expected {expected} at position {pos} of "
+                "{text!r}".format(expected=expected, pos=self.pos,
+                    text=self.text))
+
+    def peek(self):
+        self.pos = _SPACE.match(self.text, self.pos).end()
+        return self.text[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            self.error(repr(char))
+        self.pos += 1
+
+    def match(self, regex, expected):
+        self.peek()
+        match = regex.match(self.text, self.pos)
+        if match is None:
+            self.error(expected)
+        self.pos = match.end()
+        return match.group()
+
+    def end(self, result):
+        if self.peek():
+            self.error("the end")
+        return result
+
+    def metric(self):
+        """sum | term (("+" | "-") term)*"""
+        left = self.term()
+        while self.peek() in ("+", "-"):
+            op = self.text[self.pos]
+            self.pos += 1
+            left = _compound(left, op, self.term())
+        return left
+
+    def term(self):
+        """factor (("*" | "/") factor)*"""
+        left = self.factor()
+        while self.peek() in ("*", "/"):
+            op = self.text[self.pos]
+            self.pos += 1
+            left = _compound(left, op, self.factor())
+        return left
+
+    def factor(self):
+        """"(" metric ")" | number | type "(" event ")" """
+        char = self.peek()
+        if char == "(":
+            self.pos += 1
+            metric = self.metric()
+            self.expect(")")
+            return metric
+        if char == "-" or char == "." or char.isdigit():
+            number = self.match(_NUMBER, "a number")
+            if "." in number or "e" in number or "E" in number:
+                return float(number)
+            return int(number)
+        metric_type = self.match(_NAME, "a metric")
+        if metric_type not in METRICS:
+            self.pos -= len(metric_type)
+            self.error("one of {types}".format(types=sorted(METRICS)))
+        self.expect("(")
+        event = self.event()
+        self.expect(")")
+        return METRICS[metric_type](event)
+
+    def event(self):
+        """type ["(" property ("," property)* ")"] filter*"""
+        event_type = self.match(_NAME, "an event type")
+        properties = []
+        if self.peek() == "(":
+            self.pos += 1
+            properties.append(self.match(_PROPERTY, "a property"))
+            while self.peek() == ",":
+                self.pos += 1
+                properties.append(self.match(_PROPERTY, "a property"))
+            self.expect(")")
+        event = EventExpression(event_type, properties)
+        while self.peek() == ".":
+            self.pos += 1
+            filter_type = self.match(_NAME, "a filter")
+            if filter_type not in FILTERS:
+                self.pos -= len(filter_type)
+                self.error("one of {types}".format(types=sorted(FILTERS)))
+            self.expect("(")
+            property_name = self.match(_PROPERTY, "a property")
+            self.expect(",")
+            self.peek()
+            try:
+                value, self.pos = _DECODER.raw_decode(self.text, self.pos)
+            except ValueError:
+                self.error("a JSON value")
+            self.expect(")")
+            event = event._filter(FILTERS[filter_type](property_name,
+                value))
+        return event
+
+
+def _compound(left, op, right):
+    # Match the structure the Python operators build, so parsed and built
+    # expressions compare equal.
+    if isinstance(left, MetricExpression):
+        left = CompoundMetricExpression(left)
+    return CompoundMetricExpression(left, op, right)
+
+
+class _ParseCache(object):
+    """A bounded LRU cache of parsed expressions, which are immutable."""
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, parse):
+        with self._lock:
+            value = self._data.pop(key, None)
+            if value is not None:
+                self._data[key] = value
+                return value
+        value = parse()
+        with self._lock:
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+cache = _ParseCache()
+
+
+def parse_metric(text):
+    """Parse a Cube metric expression.
+
+    :returns: A `MetricExpression`, or a `CompoundMetricExpression` for
+        arithmetic or a bare number.
+    :throws: `ParseError` if `text` isn't a metric expression.
+
+    >>> request = EventExpression('request')
+    >>> parse_metric('(sum(request) * 2)') == Sum(request) * 2
+    True
+    """
+    def _parse():
+        parser = _Parser(text)
+        metric = parser.end(parser.metric())
+        if isinstance(metric, (int, long, float)):
+            metric = CompoundMetricExpression(metric)
+        return metric
+    return cache.get(("metric", text), _parse)
+
+
+def parse_event(text):
+    """Parse a Cube event expression.
+
+    :returns: An `EventExpression`.
+    :throws: `ParseError` if `text` isn't an event expression.
+
+    >>> print(parse_event('request(path, elapsed_ms).re(path, "^/api")'))
+    request(path, elapsed_ms).re(path, "^/api")
+    """
+    def _parse():
+        parser = _Parser(text)
+        return parser.end(parser.event())
+    return cache.get(("event", text), _parse)
+
+
+def parse(text):
+    """Parse a Cube metric or event expression.
+
+    Some strings are both: "sum(request)" is the sum of request events, or
+    the "request" property of "sum" events. Such strings are parsed as
+    metrics; use `parse_event` for the other reading.
+
+    >>> type(parse('sum(request)')).__name__
+    'Sum'
+    >>> parse('request(elapsed_ms)')
+    <EventExpression: request(elapsed_ms)>
+    """
+    try:
+        return parse_metric(text)
+    except ParseError:
+        return parse_event(text)
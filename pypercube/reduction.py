@@ -0,0 +1,272 @@
+"""Compute Cube metrics from Events without asking the evaluator.
+
+>>> from pypercube.event import Event
+>>> from pypercube.expression import EventExpression, Max, Sum
+>>> from pypercube.time_utils import STEP_1_MIN
+>>> events = [Event('request', '2012-07-06T20:33:%02d' % s,
+...     {'elapsed_ms': s}) for s in range(0, 60, 20)]
+>>> e = EventExpression('request', 'elapsed_ms')
+>>> compute_metric(events, Sum(e) / Max(e), STEP_1_MIN)
+[<Metric: {"value": 1.5, "time": "2012-07-06T20:33:00"}>]
+"""
+import json
+import numbers
+
+from pypercube.filters import MISSING
+from pypercube.filters import property_getter
+from pypercube.metric import Metric
+from pypercube.time_utils import STEP_CHOICES
+from pypercube.time_utils import from_epoch_ms
+from pypercube.time_utils import to_epoch_ms
+
+
+class Reducer(object):
+    """Accumulates the values in one step of a metric."""
+    # The value of a step with no events.
+    EMPTY = None
+
+    def add(self, value):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+
+class SumReducer(Reducer):
+    EMPTY = 0
+
+    def __init__(self):
+        self.total = 0
+
+    def add(self, value):
+        self.total += value
+
+    def result(self):
+        return self.total
+
+
+class MinReducer(Reducer):
+    def __init__(self):
+        self.min = None
+
+    def add(self, value):
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def result(self):
+        return self.min
+
+
+class MaxReducer(Reducer):
+    def __init__(self):
+        self.max = None
+
+    def add(self, value):
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def result(self):
+        return self.max
+
+
+class MedianReducer(Reducer):
+    """The exact median, found by selection rather than a full sort."""
+    def __init__(self):
+        self.values = []
+
+    def add(self, value):
+        self.values.append(value)
+
+    def result(self):
+        values = self.values
+        n = len(values)
+        if not n:
+            return None
+        i = n // 2
+        upper = _select(values, i)
+        if n % 2:
+            return upper
+        return (_select(values, i - 1) + upper) / 2.0
+
+
+class DistinctReducer(Reducer):
+    """The number of distinct values."""
+    EMPTY = 0
+
+    def __init__(self):
+        self.seen = set()
+
+    def add(self, value):
+        try:
+            self.seen.add(value)
+        except TypeError:
+            self.seen.add(json.dumps(value, sort_keys=True))
+
+    def result(self):
+        return len(self.seen)
+
+
+REDUCERS = {
+        "sum": SumReducer,
+        "min": MinReducer,
+        "max": MaxReducer,
+        "median": MedianReducer,
+        "distinct": DistinctReducer,
+        }
+
+
+def _select(values, k):
+    """The k-th smallest of values (0-based), reordering values in place."""
+    lo, hi = 0, len(values) - 1
+    while lo < hi:
+        pivot = values[(lo + hi) // 2]
+        i, j = lo, hi
+        while i <= j:
+            while values[i] < pivot:
+                i += 1
+            while values[j] > pivot:
+                j -= 1
+            if i <= j:
+                values[i], values[j] = values[j], values[i]
+                i += 1
+                j -= 1
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            break
+    return values[k]
+
+
+def unique_leaves(metric_expressions):
+    """The distinct MetricExpressions used by a list of metrics, in order.
+
+    Leaves are told apart by their query strings, like Cube does.
+    """
+    leaves = []
+    seen = set()
+    for expression in metric_expressions:
+        for leaf in expression.leaves():
+            key = "%s" % leaf
+            if key not in seen:
+                seen.add(key)
+                leaves.append(leaf)
+    return leaves
+
+
+def combine(metric_expressions, leaf_metrics):
+    """Evaluate metrics from the Metrics of their leaves.
+
+    :param metric_expressions: The metrics to evaluate.
+    :type metric_expressions: list of `MetricExpression` or
+        `CompoundMetricExpression`
+    :param leaf_metrics: The Metrics of every leaf of every metric.
+    :type leaf_metrics: dict of `MetricExpression` to list of `Metric`
+    :returns: A list of lists of Metrics, in the same order as
+        `metric_expressions`.
+
+    Points are matched up by time. A metric has a point wherever any of its
+    leaves does; see `CompoundMetricExpression.evaluate` for how missing
+    values are treated.
+    """
+    times = dict()
+    by_leaf = dict()
+    for leaf, metrics in leaf_metrics.iteritems():
+        points = by_leaf["%s" % leaf] = dict()
+        for metric in metrics:
+            ms = to_epoch_ms(metric.time)
+            times.setdefault(ms, metric.time)
+            points[ms] = metric.value
+    order = sorted(times)
+
+    results = []
+    for expression in metric_expressions:
+        leaves = [(leaf, by_leaf["%s" % leaf])
+                for leaf in expression.leaves()]
+        results.append([Metric(times[ms], expression.evaluate(dict(
+            (leaf, points.get(ms)) for leaf, points in leaves)))
+            for ms in order if any(ms in points for _, points in leaves)])
+    return results
+
+
+def compute_metrics(events, metric_expressions, step, start=None,
+        stop=None):
+    """Compute several metrics from one pass over some Events.
+
+    :param events: The Events to compute the metrics from. They may be in
+        any order and are only iterated once, so a stream such as
+        `Cube.iter_events` works.
+    :type events: iterable of `Event`
+    :param metric_expressions: The metrics to compute.
+    :type metric_expressions: list of `MetricExpression` or
+        `CompoundMetricExpression`
+    :param step: The step of the metrics, one of `STEP_CHOICES`.
+    :type step: int
+    :param start: Ignore Events before the step containing `start`, and
+        return a point for every step from there to `stop`.
+    :type start: datetime
+    :param stop: Ignore Events at or after `stop`.
+    :type stop: datetime
+    :returns: A list of lists of Metrics, in the same order as
+        `metric_expressions`.
+
+    Like Cube, an empty step is 0 for "sum" and "distinct" and None for
+    "min", "max" and "median". Without `start` and `stop`, only steps with
+    Events are returned.
+    """
+    if step not in (s[0] for s in STEP_CHOICES):
+        raise ValueError("{step} is not a valid step. See "
+                "time_utils.STEP_CHOICES".format(step=step))
+    leaves = unique_leaves(metric_expressions)
+    plans = []
+    for leaf in leaves:
+        if leaf.metric_type not in REDUCERS:
+            raise ValueError("Can't compute {type} metrics locally".format(
+                type=leaf.metric_type))
+        properties = leaf.event_expression.event_properties
+        plans.append((leaf.event_expression.compile(),
+            property_getter(properties[0]) if properties else None,
+            REDUCERS[leaf.metric_type], dict()))
+
+    lo = to_epoch_ms(start) if start is not None else None
+    if lo is not None:
+        lo -= lo % step
+    hi = to_epoch_ms(stop) if stop is not None else None
+    for event in events:
+        ms = to_epoch_ms(event.time)
+        if (lo is not None and ms < lo) or (hi is not None and ms >= hi):
+            continue
+        bucket = ms - ms % step
+        for match, get, reducer, buckets in plans:
+            if not match(event):
+                continue
+            if get is None:
+                value = 1
+            else:
+                value = get(event.data or {})
+                if value is MISSING or value is None or (
+                        reducer is not DistinctReducer and
+                        not isinstance(value, numbers.Number)):
+                    continue
+            accumulator = buckets.get(bucket)
+            if accumulator is None:
+                accumulator = buckets[bucket] = reducer()
+            accumulator.add(value)
+
+    leaf_metrics = dict()
+    for leaf, (match, get, reducer, buckets) in zip(leaves, plans):
+        if lo is not None and hi is not None:
+            order = range(lo, hi, step)
+        else:
+            order = sorted(buckets)
+        leaf_metrics[leaf] = [Metric(from_epoch_ms(bucket),
+            buckets[bucket].result() if bucket in buckets else reducer.EMPTY)
+            for bucket in order]
+    return combine(metric_expressions, leaf_metrics)
+
+
+def compute_metric(events, metric_expression, step, start=None, stop=None):
+    """Compute a metric from Events. See `compute_metrics`."""
+    return compute_metrics(events, [metric_expression], step, start,
+            stop)[0]
@@ -0,0 +1,166 @@
+from collections import deque
+import Queue
+import random
+import sys
+import threading
+import time
+
+import requests
+
+from pypercube.stats import percentile
+
+
+class RetryPolicy(object):
+    """How a `Cube` retries and hedges its queries.
+
+    Cube queries are idempotent GETs, so a query that fails with a
+    connection error, a timeout or one of `statuses` is simply sent again
+    after an exponentially growing, jittered delay.
+
+    With hedging on, a query that hasn't been answered after `hedge_after`
+    seconds is sent a second time, and whichever copy answers first wins.
+    With `hedge_quantile` set, the delay adapts to that quantile of recent
+    response times instead, eg 0.95 hedges the slowest 5% of queries.
+
+    >>> policy = RetryPolicy(retries=2, backoff=0.1, jitter=False)
+    >>> [policy.delay(attempt) for attempt in range(3)]
+    [0.1, 0.2, 0.4]
+    """
+    def __init__(self, retries=3, backoff=0.1, max_backoff=5.0, jitter=True,
+            statuses=(500, 502, 503, 504), hedge_after=None,
+            hedge_quantile=None, window=100, sleep=time.sleep):
+        """Create a RetryPolicy.
+
+        :param retries: The most times to resend a failed query.
+        :type retries: int
+        :param backoff: Seconds to wait before the first retry. The wait
+            doubles with each retry after that.
+        :type backoff: float
+        :param max_backoff: The longest to wait between retries, in seconds.
+        :type max_backoff: float
+        :param jitter: Wait a random time between 0 and the backoff, so
+            clients that failed together don't retry together.
+        :type jitter: bool
+        :param statuses: The HTTP statuses worth retrying.
+        :type statuses: tuple of int
+        :param hedge_after: Seconds to wait for an answer before sending a
+            second copy of the query, or None to never hedge.
+        :type hedge_after: float
+        :param hedge_quantile: Hedge after this quantile of the last
+            `window` response times. `hedge_after` is used until there are
+            enough of them.
+        :type hedge_quantile: float
+        :param window: How many recent response times to keep.
+        :type window: int
+        :param sleep: The function used to wait between retries.
+        :type sleep: callable
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.sleep = sleep
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number `attempt`, counting from 0."""
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        if self.jitter:
+            delay *= random.random()
+        return delay
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging a query, or None not to hedge."""
+        if self.hedge_quantile is not None:
+            with self._lock:
+                latencies = list(self._latencies)
+            if len(latencies) >= min(20, self._latencies.maxlen):
+                return percentile(latencies, self.hedge_quantile)
+        return self.hedge_after
+
+    def call(self, send):
+        """Send a query, retrying and hedging it according to this policy.
+
+        :param send: Sends the query once and returns its response.
+        :type send: callable
+        :returns: The first successful response, or the last response if
+            every attempt failed with a retryable status.
+        :throws: The last `requests.ConnectionError` or `requests.Timeout`
+            if every attempt failed with one.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self._hedged(send)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+            else:
+                if response.status_code not in self.statuses or \
+                        attempt >= self.retries:
+                    return response
+                response.close()
+            self.sleep(self.delay(attempt))
+            attempt += 1
+
+    def _timed(self, send):
+        started = time.time()
+        response = send()
+        with self._lock:
+            self._latencies.append(time.time() - started)
+        return response
+
+    def _hedged(self, send):
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._timed(send)
+
+        results = Queue.Queue()
+
+        def run():
+            try:
+                results.put((self._timed(send), None))
+            except Exception:
+                results.put((None, sys.exc_info()))
+
+        def start():
+            thread = threading.Thread(target=run, name="pypercube-hedge")
+            thread.daemon = True
+            thread.start()
+
+        start()
+        outstanding = 1
+        try:
+            response, error = results.get(True, delay)
+        except Queue.Empty:
+            start()
+            outstanding += 1
+            response, error = results.get()
+        outstanding -= 1
+        if (error is not None or response.status_code in self.statuses) \
+                and outstanding:
+            # The hedge may still succeed where the original failed.
+            _discard(response)
+            response, error = results.get()
+            outstanding -= 1
+        if outstanding:
+            drain = threading.Thread(target=_drain, args=(results,))
+            drain.daemon = True
+            drain.start()
+        if error is not None:
+            raise error[0], error[1], error[2]
+        return response
+
+
+def _discard(response):
+    if response is not None:
+        response.close()
+
+
+def _drain(results):
+    """Close the response of the losing copy of a hedged query."""
+    _discard(results.get()[0])
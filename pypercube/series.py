@@ -0,0 +1,256 @@
+import json
+import operator
+import types
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pypercube.metric import Metric
+from pypercube.time_utils import floor_many
+from pypercube.time_utils import from_epoch_ms
+from pypercube.time_utils import parse_time
+from pypercube.time_utils import to_epoch_ms
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("MetricSeries, and so get_metric(as_series=True), "
+                "requires numpy")
+
+
+class MetricSeries(object):
+    """A columnar series of Cube Metrics backed by NumPy arrays.
+
+    Times are kept as int64 milliseconds since the epoch and values as
+    float64, with NaN standing in for null values. Requires NumPy.
+
+    >>> s = MetricSeries.from_json('[{"time": "2012-07-06T20:30:00Z", '
+    ...     '"value": 1}, {"time": "2012-07-06T20:35:00Z", "value": null}]')
+    >>> len(s)
+    2
+    >>> s.values
+    array([ 1., nan])
+    >>> (s * 2 + 1).values
+    array([ 3., nan])
+    """
+    RESAMPLE_CHOICES = ("sum", "mean", "min", "max", "count")
+
+    def __init__(self, times, values, step=None):
+        """Create a MetricSeries.
+
+        :param times: The time of each point, in milliseconds since the
+            epoch, sorted ascending.
+        :type times: sequence of int
+        :param values: The value of each point, None or NaN if null.
+        :type values: sequence of float
+        :param step: The step of the series, one of
+            `time_utils.STEP_CHOICES`, if known.
+        :type step: int
+        """
+        _require_numpy()
+        self.times = numpy.asarray(times, dtype=numpy.int64)
+        self.values = numpy.asarray(
+                [numpy.nan if v is None else v for v in values]
+                if isinstance(values, (list, tuple)) else values,
+                dtype=numpy.float64)
+        if self.times.shape != self.values.shape:
+            raise ValueError("times and values must be the same length")
+        self.step = step
+
+    @classmethod
+    def from_metrics(cls, metrics, step=None):
+        """Build a MetricSeries from a list of `Metric`s."""
+        return cls([to_epoch_ms(m.time) for m in metrics],
+                [m.value for m in metrics], step)
+
+    @classmethod
+    def from_json(cls, json_obj, step=None):
+        """Build a MetricSeries from a Cube metric/get response.
+
+        :param json_obj: A JSON array of Cube Metrics.
+        :type json_obj: `String` or `json`
+        """
+        _require_numpy()
+        if isinstance(json_obj, types.StringTypes):
+            json_obj = json.loads(json_obj)
+        time_cache = dict()
+        times = numpy.empty(len(json_obj), dtype=numpy.int64)
+        values = numpy.empty(len(json_obj), dtype=numpy.float64)
+        for i, record in enumerate(json_obj):
+            times[i] = to_epoch_ms(parse_time(record[Metric.TIME_FIELD_NAME],
+                time_cache))
+            value = record.get(Metric.VALUE_FIELD_NAME)
+            values[i] = numpy.nan if value is None else value
+        return cls(times, values, step)
+
+    @classmethod
+    def concat(cls, series, step=None):
+        """Join consecutive MetricSeries into one.
+
+        Points repeated at the seams, ie not later than the last point of the
+        previous series, are dropped.
+        """
+        _require_numpy()
+        times = [s.times for s in series]
+        values = [s.values for s in series]
+        if not times:
+            return cls([], [], step)
+        times = numpy.concatenate(times)
+        values = numpy.concatenate(values)
+        keep = numpy.ones(len(times), dtype=bool)
+        keep[1:] = times[1:] > numpy.maximum.accumulate(times)[:-1]
+        return cls(times[keep], values[keep], step)
+
+    def to_metrics(self):
+        """This series as a list of `Metric`s, with None for null values."""
+        return [self._metric(i) for i in range(len(self))]
+
+    def _metric(self, i):
+        value = self.values[i]
+        return Metric(from_epoch_ms(self.times[i]),
+                None if numpy.isnan(value) else float(value))
+
+    @property
+    def datetimes(self):
+        """The time of each point as a naive UTC datetime."""
+        return [from_epoch_ms(t) for t in self.times]
+
+    def between(self, start=None, stop=None):
+        """The points with start <= time < stop.
+
+        :param start: The start of the window, or None for no lower bound.
+        :type start: datetime or int milliseconds since the epoch
+        :param stop: The end of the window, or None for no upper bound.
+        :type stop: datetime or int milliseconds since the epoch
+        """
+        lo, hi = 0, len(self)
+        if start is not None:
+            if hasattr(start, 'isoformat'):
+                start = to_epoch_ms(start)
+            lo = numpy.searchsorted(self.times, start, side='left')
+        if stop is not None:
+            if hasattr(stop, 'isoformat'):
+                stop = to_epoch_ms(stop)
+            hi = numpy.searchsorted(self.times, stop, side='left')
+        return self[lo:hi]
+
+    def resample(self, step, how="sum"):
+        """Combine the points into coarser buckets of `step` milliseconds.
+
+        :param step: The new step, eg `time_utils.STEP_1_HOUR`.
+        :type step: int
+        :param how: How to combine the values in a bucket, one of
+            `RESAMPLE_CHOICES`. Null values are ignored; a bucket with no
+            values is null (or 0 for "count").
+        :type how: str
+        """
+        if how not in self.RESAMPLE_CHOICES:
+            raise ValueError("{how} is not a valid choice. Valid choices are "
+                    "{choices}".format(how=how, choices=self.RESAMPLE_CHOICES))
+        if not len(self):
+            return MetricSeries([], [], step)
+        buckets = floor_many(self.times, step)
+        times, starts = numpy.unique(buckets, return_index=True)
+        valid = ~numpy.isnan(self.values)
+        counts = numpy.add.reduceat(valid.astype(numpy.float64), starts)
+        if how == "count":
+            return MetricSeries(times, counts, step)
+        if how in ("sum", "mean"):
+            values = numpy.add.reduceat(
+                    numpy.where(valid, self.values, 0.0), starts)
+            if how == "mean":
+                with numpy.errstate(invalid='ignore', divide='ignore'):
+                    values = values / counts
+        elif how == "min":
+            values = numpy.fmin.reduceat(self.values, starts)
+        else:
+            values = numpy.fmax.reduceat(self.values, starts)
+        values[counts == 0] = numpy.nan
+        return MetricSeries(times, values, step)
+
+    def _apply(self, other, op, reflected=False):
+        if isinstance(other, MetricSeries):
+            if numpy.array_equal(self.times, other.times):
+                times, left, right = self.times, self.values, other.values
+            else:
+                # Only the points present in both series can be combined.
+                times, li, ri = _intersect(self.times, other.times)
+                left, right = self.values[li], other.values[ri]
+        else:
+            times, left, right = self.times, self.values, other
+        if reflected:
+            left, right = right, left
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            values = op(left, right)
+        return MetricSeries(times, values, self.step)
+
+    def __add__(self, other):
+        return self._apply(other, operator.add)
+
+    def __radd__(self, other):
+        return self._apply(other, operator.add, True)
+
+    def __sub__(self, other):
+        return self._apply(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self._apply(other, operator.sub, True)
+
+    def __mul__(self, other):
+        return self._apply(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self._apply(other, operator.mul, True)
+
+    def __div__(self, other):
+        return self._apply(other, operator.truediv)
+
+    def __rdiv__(self, other):
+        return self._apply(other, operator.truediv, True)
+
+    def __truediv__(self, other):
+        return self.__div__(other)
+
+    def __rtruediv__(self, other):
+        return self.__rdiv__(other)
+
+    def __neg__(self):
+        return MetricSeries(self.times, -self.values, self.step)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._metric(i)
+
+    def __getitem__(self, key):
+        """Index a single `Metric`, or slice/mask out a new MetricSeries."""
+        if isinstance(key, (int, long, numpy.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("MetricSeries index out of range")
+            return self._metric(key)
+        return MetricSeries(self.times[key], self.values[key], self.step)
+
+    def __eq__(self, other):
+        return isinstance(other, MetricSeries) and \
+                numpy.array_equal(self.times, other.times) and \
+                numpy.allclose(self.values, other.values, rtol=0, atol=0,
+                        equal_nan=True)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<MetricSeries: {count} points>".format(count=len(self))
+
+
+def _intersect(left, right):
+    """The shared times of two sorted arrays, and their indices in each."""
+    times = numpy.intersect1d(left, right, assume_unique=True)
+    return (times, numpy.searchsorted(left, times),
+            numpy.searchsorted(right, times))
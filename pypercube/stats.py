@@ -0,0 +1,147 @@
+from collections import deque
+import math
+import threading
+
+
+def percentile(values, q):
+    """The `q` quantile of some values, by the nearest-rank method.
+
+    >>> percentile([4, 1, 3, 2], 0.5)
+    2
+    >>> percentile([], 0.5) is None
+    True
+    """
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    # Round away float noise, eg 0.95 * 100 == 95.00000000000001
+    return values[max(0, int(math.ceil(round(q * len(values), 9))) - 1)]
+
+
+class QueryStats(object):
+    """What one Cube query cost. `Cube` passes one to each observer.
+
+    Times are in seconds. `ttfb` is the time until the response headers
+    arrived and `latency` the time until the whole body had, or for a
+    streamed query until the stream was closed. `decode_time` is the time
+    spent decoding the JSON and building Events or Metrics. `retries` counts
+    every request sent after the first, including hedged requests, and
+    `cache_hits` the steps answered from the `Cube`'s cache. `error` is the
+    exception the query raised, if any.
+    """
+    __slots__ = ("path", "expression", "params", "ttfb", "latency", "bytes",
+            "records", "decode_time", "retries", "cache_hits", "error")
+
+    def __init__(self, path, expression, params=None):
+        self.path = path
+        self.expression = expression
+        self.params = params or dict()
+        self.ttfb = None
+        self.latency = None
+        self.bytes = 0
+        self.records = 0
+        self.decode_time = None
+        self.retries = 0
+        self.cache_hits = 0
+        self.error = None
+
+    def to_json(self):
+        json_obj = dict((name, getattr(self, name))
+                for name in self.__slots__)
+        if self.error is not None:
+            json_obj["error"] = repr(self.error)
+        return json_obj
+
+    def __repr__(self):
+        return "<QueryStats: {path} {expression} {latency}s>".format(
+                path=self.path, expression=self.expression,
+                latency=self.latency)
+
+
+class StatsAggregator(object):
+    """An observer that keeps per-expression statistics in memory.
+
+    Pass one to `Cube(observers=[...])`, then ask it which expressions cost
+    the most:
+
+    >>> stats = StatsAggregator()
+    >>> for latency in (0.1, 0.2, 0.9):
+    ...     s = QueryStats("metric/get", "sum(request)")
+    ...     s.latency = latency
+    ...     stats(s)
+    >>> stats.percentiles("sum(request)", quantiles=(0.5, 0.99))
+    [0.2, 0.9]
+    >>> [expression for expression, _ in stats.top(1)]
+    ['sum(request)']
+    """
+    FIELDS = ("latency", "ttfb", "decode_time", "bytes", "records")
+
+    def __init__(self, window=1000):
+        """Create a StatsAggregator.
+
+        :param window: Percentiles are computed over the last `window`
+            queries of each expression.
+        :type window: int
+        """
+        self.window = window
+        self._expressions = dict()
+        self._lock = threading.Lock()
+
+    def __call__(self, stats):
+        with self._lock:
+            entry = self._expressions.get(stats.expression)
+            if entry is None:
+                entry = self._expressions[stats.expression] = {
+                        "count": 0, "errors": 0, "retries": 0,
+                        "cache_hits": 0, "total_latency": 0.0, "bytes": 0,
+                        "records": 0, "samples": deque(maxlen=self.window)}
+            entry["count"] += 1
+            entry["errors"] += stats.error is not None
+            entry["retries"] += stats.retries
+            entry["cache_hits"] += stats.cache_hits
+            entry["total_latency"] += stats.latency or 0
+            entry["bytes"] += stats.bytes
+            entry["records"] += stats.records
+            entry["samples"].append(tuple(getattr(stats, field)
+                for field in self.FIELDS))
+
+    def expressions(self):
+        """Every expression seen so far."""
+        with self._lock:
+            return self._expressions.keys()
+
+    def percentiles(self, expression, field="latency",
+            quantiles=(0.5, 0.95, 0.99)):
+        """Percentiles of one of `FIELDS` over an expression's queries."""
+        i = self.FIELDS.index(field)
+        with self._lock:
+            values = [s[i] for s in self._expressions[expression]["samples"]]
+        return [percentile(values, q) for q in quantiles]
+
+    def summary(self, quantiles=(0.5, 0.95, 0.99)):
+        """Totals and latency percentiles for every expression.
+
+        :returns: A dict of expression to a dict of "count", "errors",
+            "retries", "cache_hits", "total_latency", "bytes", "records" and
+            "latency", the percentiles of latency in `quantiles`.
+        """
+        with self._lock:
+            entries = [(expression, dict(entry, samples=list(
+                entry["samples"]))) for expression, entry
+                in self._expressions.iteritems()]
+        summary = dict()
+        for expression, entry in entries:
+            latencies = [s[0] for s in entry.pop("samples")]
+            entry["latency"] = dict((q, percentile(latencies, q))
+                    for q in quantiles)
+            summary[expression] = entry
+        return summary
+
+    def top(self, n=10, by="total_latency"):
+        """The `n` expressions with the highest `by`, eg "bytes"."""
+        return sorted(self.summary().iteritems(),
+                key=lambda item: item[1][by], reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self._expressions.clear()
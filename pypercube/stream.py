@@ -0,0 +1,72 @@
+import codecs
+import json
+
+_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(chunks, encoding="utf-8"):
+    """Incrementally decode a JSON array, yielding each element in turn.
+
+    :param chunks: The raw JSON text, split into arbitrary pieces.
+    :type chunks: iterable of `str`
+    :param encoding: The encoding of the raw JSON text.
+    :type encoding: str
+    :throws: `ValueError` if the text is not a complete JSON array.
+
+    Only one element (plus one chunk) is held in memory at a time, so an
+    array of any size can be decoded from a socket as it is downloaded.
+
+    >>> list(iter_json_array(['[{"a": 1}, {"', 'b": 2}', ', 3]']))
+    [{u'a': 1}, {u'b': 2}, 3]
+    >>> list(iter_json_array(['  [  ]']))
+    []
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    chunks = iter(chunks)
+    buf = u""
+    pos = 0
+    exhausted = False
+    started = False
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+
+        if pos < len(buf):
+            char = buf[pos]
+            if not started:
+                if char != "[":
+                    raise ValueError("Expected a JSON array, got "
+                            "{char!r}".format(char=char))
+                started = True
+                pos += 1
+                continue
+            if char == "]":
+                return
+            if char == ",":
+                pos += 1
+                continue
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                end = None
+            # A value running to the very end of the buffer may be a number
+            # cut in half by a chunk boundary, so wait for more text.
+            if end is not None and (end < len(buf) or exhausted):
+                yield value
+                pos = end
+                continue
+
+        if exhausted:
+            raise ValueError("Unexpected end of JSON array")
+
+        buf = buf[pos:]
+        pos = 0
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            buf += text_decoder.decode(b"", final=True)
+            exhausted = True
+        else:
+            buf += text_decoder.decode(chunk)
@@ -0,0 +1,354 @@
+"""An in-process stand-in for a Cube evaluator and collector.
+
+A `StubCube` serves event/get and metric/get from Events held in memory,
+computing metrics with `pypercube.reduction`, and stores the Events POSTed
+to event/put. Its latency and error rate can be set, so `Cube` and
+`Collector` can be load-tested over real HTTP without a Cube server:
+
+>>> from datetime import datetime
+>>> from pypercube.cube import Cube
+>>> from pypercube.expression import EventExpression, Sum
+>>> from pypercube.time_utils import STEP_1_MIN
+>>> start = datetime(2012, 7, 6)
+>>> with StubCube(synthetic_events(120, start)) as stub:
+...     with Cube("127.0.0.1", port=stub.port) as c:
+...         metrics = c.get_metric(Sum(EventExpression("request")), start,
+...             start + timedelta(minutes=2), STEP_1_MIN)
+>>> [metric.value for metric in metrics]
+[60, 60]
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from bisect import bisect_left
+from collections import deque
+from datetime import timedelta
+import json
+from operator import itemgetter
+import random
+from SocketServer import ThreadingMixIn
+import threading
+import time
+import urlparse
+
+from pypercube.event import Event
+from pypercube.expression import canonical_string
+from pypercube.parser import parse_event
+from pypercube.parser import parse_metric
+from pypercube.parser import ParseError
+from pypercube.reduction import compute_metric
+from pypercube.time_utils import from_epoch_ms
+from pypercube.time_utils import now
+from pypercube.time_utils import parse_time
+from pypercube.time_utils import to_epoch_ms
+
+
+def synthetic_events(count, start=None, interval=timedelta(seconds=1),
+        event_type="request", payload=0):
+    """Events for a `StubCube` to serve, evenly spaced in time.
+
+    Each Event's data has an "elapsed_ms" that cycles from 0 to 999, a
+    "path" cycling through ten values and, if `payload` is non-zero, a
+    "payload" string of that many bytes to make responses bigger.
+
+    :param count: How many Events to make.
+    :type count: int
+    :param start: The time of the first Event. Defaults to `count`
+        intervals ago.
+    :type start: datetime
+    :param interval: The time between Events.
+    :type interval: timedelta
+    :param event_type: The type of every Event.
+    :type event_type: str
+    :param payload: The length of the "payload" property.
+    :type payload: int
+    """
+    if start is None:
+        start = now() - interval * count
+    padding = "x" * payload
+    events = []
+    for i in xrange(count):
+        data = {"elapsed_ms": i % 1000, "path": "/{n}".format(n=i % 10)}
+        if payload:
+            data["payload"] = padding
+        events.append(Event(event_type, start + interval * i, data))
+    return events
+
+
+def _format_time(ms):
+    """Format a time like Cube does, eg "2012-07-06T20:33:16.573Z"."""
+    return from_epoch_ms(ms).strftime("%Y-%m-%dT%H:%M:%S.") + \
+            "{ms:03d}Z".format(ms=ms % 1000)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send each response in one write; header-by-header writes stall on
+    # delayed ACKs.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        self.server.stub._handle(self, "GET", url.path, params)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        self.server.stub._handle(self, "POST", self.path, body)
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubCube(object):
+    """A Cube evaluator and collector on localhost, serving Events in memory.
+
+    The server runs on a background thread from `start` until `stop`, or
+    for the duration of a `with` block. The latest requests are recorded in
+    `requests` as (method, path, params) tuples, where params are the query
+    parameters of a GET or the decoded body of a POST, and every request is
+    counted in `request_count`.
+
+    Like Cube, event/get returns the newest Events first and metric/get
+    returns a point for every step in [start, stop). Queries Cube would
+    reject get a 400 response.
+    """
+    def __init__(self, events=(), host="127.0.0.1", port=0, latency=0.0,
+            jitter=0.0, error_rate=0.0, error_status=500, max_records=None,
+            api_version="1.0", seed=None, keep_requests=1000):
+        """Create a StubCube.
+
+        :param events: The Events to serve, eg from `synthetic_events`, a
+            recorded `EventArchive` or `Cube.iter_events`.
+        :type events: iterable of `Event`
+        :param host: The address to listen on.
+        :type host: str
+        :param port: The port to listen on. The default of 0 picks a free
+            port; read it from `port` once started.
+        :type port: int
+        :param latency: Seconds to wait before answering each request.
+        :type latency: float
+        :param jitter: Up to this many more seconds, chosen at random, to
+            wait before answering each request.
+        :type jitter: float
+        :param error_rate: The fraction of requests to fail with
+            `error_status`.
+        :type error_rate: float
+        :param error_status: The HTTP status of failed requests.
+        :type error_status: int
+        :param max_records: The most records to return from one query.
+        :type max_records: int
+        :param api_version: The version of the Cube API to serve.
+        :type api_version: str
+        :param seed: Seeds the random latencies and errors, to make a run
+            repeatable.
+        :type seed: int
+        :param keep_requests: How many of the latest requests to keep in
+            `requests`. None keeps them all and 0 none, eg for a long load
+            test.
+        :type keep_requests: int
+        """
+        self.host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_records = max_records
+        self.api_version = api_version
+        self.requests = deque(maxlen=keep_requests)
+        self.request_count = 0
+        self._port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Condition()
+        self._released = threading.Event()
+        self._released.set()
+        self._events = []
+        self._times = []
+        self._metrics = dict()
+        self._server = None
+        self.put(events)
+
+    ### Server lifecycle
+    def start(self):
+        """Start serving on a background thread."""
+        self._server = _Server((self.host, self._port), _Handler)
+        self._server.stub = self
+        # Poll often, so `stop` returns quickly.
+        thread = threading.Thread(target=self._server.serve_forever,
+                args=(0.01,), name="pypercube-stub")
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        self._released.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    ### Test controls
+    def hold(self):
+        """Make requests wait for `release` before they are answered."""
+        self._released.clear()
+
+    def release(self):
+        """Answer held requests, and stop holding new ones."""
+        self._released.set()
+
+    def wait_for_requests(self, count, timeout=None):
+        """Wait until at least `count` requests have arrived.
+
+        :returns: True if they did, False if `timeout` seconds passed first.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            while self.request_count < count:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                self._lock.wait(remaining)
+        return True
+
+    ### Data
+    def put(self, events):
+        """Add Events to those served."""
+        rows = [(to_epoch_ms(event.time), event) for event in events]
+        with self._lock:
+            rows = zip(self._times, self._events) + rows
+            # Stable and linear on the already sorted prefix.
+            rows.sort(key=itemgetter(0))
+            self._times = [ms for ms, _ in rows]
+            self._events = [event for _, event in rows]
+            self._metrics = dict()
+
+    def events(self):
+        """Every Event served, oldest first."""
+        with self._lock:
+            return list(self._events)
+
+    def _slice(self, start, stop):
+        with self._lock:
+            lo = bisect_left(self._times, to_epoch_ms(start)) \
+                    if start is not None else 0
+            hi = bisect_left(self._times, to_epoch_ms(stop)) \
+                    if stop is not None else len(self._times)
+            return self._events[lo:hi]
+
+    ### Requests
+    def _handle(self, handler, method, path, params):
+        if method == "POST":
+            try:
+                params = json.loads(params)
+            except ValueError:
+                pass
+        with self._lock:
+            self.requests.append((method, path, params))
+            self.request_count += 1
+            self._lock.notify_all()
+        self._released.wait()
+        delay = self.latency + self._random.random() * self.jitter
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return handler.respond(self.error_status,
+                    '{"error": "stub error"}')
+
+        prefix = "/{version}/".format(version=self.api_version)
+        route = path[len(prefix):] if path.startswith(prefix) else None
+        try:
+            if method == "GET" and route == "event/get":
+                body = self._get_events(params)
+            elif method == "GET" and route == "metric/get":
+                body = self._get_metric(params)
+            elif method == "POST" and route == "event/put":
+                body = self._put_events(params)
+            else:
+                return handler.respond(404, '{"error": "not found"}')
+        except (ParseError, ValueError, TypeError, KeyError), e:
+            return handler.respond(400, json.dumps({"error": str(e)}))
+        handler.respond(200, body)
+
+    def _limit(self, params):
+        limits = [int(params["limit"])] if "limit" in params else []
+        if self.max_records is not None:
+            limits.append(self.max_records)
+        return min(limits) if limits else None
+
+    def _get_events(self, params):
+        expression = parse_event(params["expression"])
+        start, stop = _window(params)
+        events = expression.filter(reversed(self._slice(start, stop)))
+        records = []
+        limit = self._limit(params)
+        for event in events:
+            if limit is not None and len(records) >= limit:
+                break
+            records.append({"time": _format_time(to_epoch_ms(event.time)),
+                "data": event.data})
+        return json.dumps(records)
+
+    def _get_metric(self, params):
+        expression = parse_metric(params["expression"])
+        step = long(params["step"])
+        start, stop = _window(params)
+        limit = self._limit(params)
+        if stop is None:
+            stop = now()
+        if start is None:
+            # Like Cube, without a start return the last `limit` steps.
+            start = stop - timedelta(milliseconds=step * (limit or 1440))
+        # Keep the rendered response, so repeated queries cost the server
+        # little and benchmarks measure the client.
+        key = (canonical_string(expression), step, to_epoch_ms(start),
+                to_epoch_ms(stop), limit)
+        with self._lock:
+            cache = self._metrics
+            body = cache.get(key)
+        if body is None:
+            metrics = compute_metric(self._slice(start, stop), expression,
+                    step, start, stop)
+            if limit is not None:
+                metrics = metrics[-limit:] if limit else []
+            body = json.dumps([{"time": _format_time(to_epoch_ms(m.time)),
+                "value": m.value} for m in metrics])
+            # If Events were put meanwhile, this cache has been replaced.
+            cache[key] = body
+        return body
+
+    def _put_events(self, records):
+        events = [Event.from_json(record) for record in records]
+        self.put(events)
+        return "{}"
+
+
+def _window(params):
+    start = parse_time(params["start"]) if "start" in params else None
+    stop = parse_time(params["stop"]) if "stop" in params else None
+    return start, stop
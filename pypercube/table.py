@@ -0,0 +1,109 @@
+from pypercube.metric import Metric
+from pypercube.time_utils import to_epoch_ms
+
+
+class MetricTable(object):
+    """The Metrics of several expressions, aligned on one time index.
+
+    Each expression is a column holding one value per time in `times`; a
+    time an expression has no point at is None in its column. Expressions
+    that could not be fetched are kept in `errors` instead, and reading
+    their column raises the error. Columns and errors are keyed by each
+    expression's query string, so expressions Python thinks equal but Cube
+    doesn't, such as .eq(ok, true) and .eq(ok, 1), keep separate columns.
+
+    >>> from datetime import datetime
+    >>> t = datetime(2012, 7, 6, 20, 33)
+    >>> table = MetricTable.from_metrics([
+    ...     ("sum(request)", [Metric(t, 3)]),
+    ...     ("max(request)", ValueError("bad"))])
+    >>> table.times, table["sum(request)"]
+    ([datetime.datetime(2012, 7, 6, 20, 33)], [3])
+    >>> table.errors
+    {'max(request)': ValueError('bad',)}
+    """
+    def __init__(self, expressions, times, columns, errors=None):
+        """Create a MetricTable.
+
+        :param expressions: Every expression, in column order.
+        :type expressions: list
+        :param times: The time of each row, sorted ascending.
+        :type times: list of datetime
+        :param columns: The values of each expression that was fetched, one
+            per time, by query string.
+        :type columns: dict
+        :param errors: The error raised by each expression that wasn't, by
+            query string.
+        :type errors: dict
+        """
+        self.expressions = list(expressions)
+        self.times = times
+        self.columns = columns
+        self.errors = errors or dict()
+
+    @classmethod
+    def from_metrics(cls, results):
+        """Build a MetricTable from each expression's Metrics or error.
+
+        :param results: (expression, result) pairs, where result is either
+            a list of `Metric`s or the exception raised fetching them.
+        :type results: list of tuple
+        """
+        times = dict()
+        by_expression = dict()
+        errors = dict()
+        for expression, result in results:
+            key = "%s" % expression
+            if isinstance(result, Exception):
+                errors[key] = result
+                continue
+            points = by_expression[key] = dict()
+            for metric in result:
+                ms = to_epoch_ms(metric.time)
+                times.setdefault(ms, metric.time)
+                points[ms] = metric.value
+        order = sorted(times)
+        columns = dict((key, [points.get(ms) for ms in order])
+                for key, points in by_expression.iteritems())
+        return cls([expression for expression, _ in results],
+                [times[ms] for ms in order], columns, errors)
+
+    @property
+    def ok(self):
+        """True if every expression was fetched."""
+        return not self.errors
+
+    def metrics(self, expression):
+        """The column of an expression as a list of `Metric`s."""
+        return [Metric(time, value)
+                for time, value in zip(self.times, self[expression])]
+
+    def rows(self):
+        """Yield (time, values) for each row, with a value per expression.
+
+        The values of expressions that failed are None.
+        """
+        columns = [self.columns.get("%s" % expression)
+                for expression in self.expressions]
+        for i, time in enumerate(self.times):
+            yield time, [column[i] if column is not None else None
+                    for column in columns]
+
+    def __getitem__(self, expression):
+        key = "%s" % expression
+        if key in self.errors:
+            raise self.errors[key]
+        return self.columns[key]
+
+    def __contains__(self, expression):
+        key = "%s" % expression
+        return key in self.columns or key in self.errors
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return "<MetricTable: {rows} rows of {columns} expressions, " \
+                "{errors} errors>".format(rows=len(self),
+                        columns=len(self.expressions),
+                        errors=len(self.errors))
@@ -1,5 +1,10 @@
 from datetime import datetime
 from datetime import timedelta
+import re
+
+from dateutil import parser as date_parser
+from dateutil.tz import tzoffset
+from dateutil.tz import tzutc
 
 STEP_10_SEC = long(1e4)
 STEP_1_MIN = long(6e4)
@@ -37,6 +42,49 @@ def start_of_month(timestamp=None):
     return datetime(year=timestamp.year, month=timestamp.month, day=1)
 
 
+_EPOCH = datetime(1970, 1, 1)
+_UTC = tzutc()
+
+
+def _total_ms(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000 + \
+            delta.microseconds // 1000
+
+
+def to_epoch_ms(time):
+    """Milliseconds since the Unix epoch. Naive datetimes are taken as UTC.
+
+    >>> to_epoch_ms(datetime(2012, 7, 6, 20, 33, 16, 573225))
+    1341606796573
+    """
+    if time.tzinfo is not None:
+        offset = time.utcoffset()
+        time = time.replace(tzinfo=None)
+        if offset:
+            time -= offset
+    return _total_ms(time - _EPOCH)
+
+
+def to_utc(time):
+    """An aware datetime in UTC. Naive datetimes are taken as UTC.
+
+    >>> to_utc(datetime(2012, 7, 6, 20, 33))
+    datetime.datetime(2012, 7, 6, 20, 33, tzinfo=tzutc())
+    """
+    if time.tzinfo is None:
+        return time.replace(tzinfo=_UTC)
+    return time.astimezone(_UTC)
+
+
+def from_epoch_ms(ms):
+    """A naive UTC datetime from milliseconds since the Unix epoch.
+
+    >>> from_epoch_ms(1341606796573)
+    datetime.datetime(2012, 7, 6, 20, 33, 16, 573000)
+    """
+    return _EPOCH + timedelta(milliseconds=int(ms))
+
+
 def floor(start, resolution):
     """Floor a datetime by a resolution.
 
@@ -61,3 +109,154 @@ def floor(start, resolution):
     raise ValueError("{resolution} is not a valid resolution. Valid choices "
             "are {choices}".format(
                 resolution=resolution, choices=STEP_CHOICES))
+
+
+def _check_step(resolution):
+    if not isinstance(resolution, (int, long)) or resolution <= 0:
+        raise ValueError("{resolution} is not a valid resolution. Use one of "
+                "{choices} or another positive number of milliseconds".format(
+                    resolution=resolution, choices=STEP_CHOICES))
+
+
+def floor_ms(ms, resolution):
+    """Floor milliseconds since the epoch by a resolution.
+
+    Any positive number of milliseconds is a valid resolution, eg
+    3 * STEP_5_MIN; steps are aligned to the epoch, just like Cube's.
+
+    >>> from_epoch_ms(floor_ms(1341606796573, STEP_1_HOUR))
+    datetime.datetime(2012, 7, 6, 20, 0)
+    >>> from_epoch_ms(floor_ms(1341606796573, 3 * STEP_5_MIN))
+    datetime.datetime(2012, 7, 6, 20, 30)
+    """
+    _check_step(resolution)
+    return ms - ms % resolution
+
+
+def floor_many(times, resolution):
+    """Floor many times, in milliseconds since the epoch, by a resolution.
+
+    :param times: The times to floor.
+    :type times: NumPy integer array, or an iterable of int
+    :param resolution: The resolution; see `floor_ms`.
+    :type resolution: int
+    :returns: A NumPy array if `times` is one, otherwise a list.
+
+    NumPy arrays are floored in a single vectorized operation, and lists with
+    plain integer arithmetic; neither builds any datetimes.
+
+    >>> floor_many([1341606796573, 1341606799999], STEP_10_SEC) == [
+    ...     1341606790000, 1341606790000]
+    True
+    """
+    _check_step(resolution)
+    if hasattr(times, 'dtype'):
+        return times - times % resolution
+    return [t - t % resolution for t in times]
+
+
+def chunk(start, stop, resolution, size):
+    """Split [start, stop) into consecutive step-aligned windows.
+
+    :param start: The start of the range.
+    :type start: datetime
+    :param stop: The end of the range.
+    :type stop: datetime
+    :param resolution: The step to align the windows to.
+    :type resolution: int
+    :param size: The length of each window. It is rounded up to a whole
+        number of steps.
+    :type size: timedelta
+    :returns: A list of (start, stop) tuples. Every boundary except `start`
+        and `stop` falls on a step. If either `start` or `stop` is
+        timezone-aware, the boundaries are aware datetimes in UTC.
+
+    >>> chunk(datetime(2012, 7, 6, 20, 33), datetime(2012, 7, 6, 20, 55),
+    ...     STEP_5_MIN, timedelta(minutes=10))  # doctest:+NORMALIZE_WHITESPACE
+    [(datetime.datetime(2012, 7, 6, 20, 33),
+      datetime.datetime(2012, 7, 6, 20, 40)),
+     (datetime.datetime(2012, 7, 6, 20, 40),
+      datetime.datetime(2012, 7, 6, 20, 50)),
+     (datetime.datetime(2012, 7, 6, 20, 50),
+      datetime.datetime(2012, 7, 6, 20, 55))]
+    """
+    step = timedelta(milliseconds=resolution)
+    steps = max(1, -(-_total_ms(size) // resolution))
+    size = step * steps
+    windows = []
+    if start.tzinfo is not None or stop.tzinfo is not None:
+        # Steps are aligned in UTC.
+        start, stop = to_utc(start), to_utc(stop)
+        boundary = floor(start, resolution).replace(tzinfo=_UTC)
+    else:
+        boundary = floor(start, resolution)
+    while start < stop:
+        boundary += size
+        end = min(boundary, stop)
+        windows.append((start, end))
+        start = end
+    return windows
+
+
+_ISO_8601 = re.compile(
+        r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d)"
+        r"(?::(\d\d)(?:\.(\d{1,6})\d*)?)?"
+        r"(Z|[+-]\d\d(?::?\d\d)?)?$")
+
+
+def _parse_iso_8601(value):
+    match = _ISO_8601.match(value)
+    if match is None:
+        return None
+    (year, month, day, hour, minute, second, fraction,
+            zone) = match.groups()
+    tz = None
+    if zone == "Z":
+        tz = _UTC
+    elif zone:
+        offset = int(zone[1:3]) * 3600 + int(zone[-2:] if len(zone) > 3
+                else 0) * 60
+        if zone[0] == "-":
+            offset = -offset
+        tz = _UTC if offset == 0 else tzoffset(None, offset)
+    return datetime(int(year), int(month), int(day), int(hour), int(minute),
+            int(second or 0), int(fraction.ljust(6, "0")) if fraction else 0,
+            tz)
+
+
+def parse_time(value, cache=None):
+    """Parse a timestamp string from Cube into a datetime.
+
+    :param value: The timestamp, normally ISO-8601 as emitted by Cube.
+    :type value: str
+    :param cache: An optional dict of previously parsed timestamps. Pass the
+        same dict while decoding a response to parse each distinct timestamp
+        only once.
+    :type cache: dict
+
+    ISO-8601 timestamps are parsed with a strict fast path; anything else
+    falls back to dateutil's fuzzy parser.
+
+    >>> parse_time("2012-07-06T20:33:16.573Z")
+    datetime.datetime(2012, 7, 6, 20, 33, 16, 573000, tzinfo=tzutc())
+    >>> parse_time("2012-07-06T20:33:16.573225")
+    datetime.datetime(2012, 7, 6, 20, 33, 16, 573225)
+    >>> parse_time("Fri, 06 Jul 2012 20:33:16")
+    datetime.datetime(2012, 7, 6, 20, 33, 16)
+    """
+    if cache is not None:
+        try:
+            return cache[value]
+        except KeyError:
+            pass
+
+    try:
+        time = _parse_iso_8601(value)
+    except ValueError:
+        time = None
+    if time is None:
+        time = date_parser.parse(value, fuzzy=True)
+
+    if cache is not None:
+        cache[value] = time
+    return time
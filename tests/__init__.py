@@ -12,6 +12,14 @@ class MockResponse(object):
         self.status_code = status_code
         self.content = content
         self.json = json
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
 
 
 def mock_get(response):
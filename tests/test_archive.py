@@ -0,0 +1,101 @@
+from datetime import datetime
+from datetime import timedelta
+import os
+import shutil
+import tempfile
+import unittest
+
+from dateutil.tz import tzoffset
+from dateutil.tz import tzutc
+
+from pypercube.archive import EventArchive
+from pypercube.archive import InvalidArchiveError
+from pypercube.event import Event
+
+
+class TestEventArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "events.pcube")
+        self.start = datetime(2012, 7, 6, 20, 33, 16, 573225)
+        self.events = [Event("request" if i % 3 else "login",
+            self.start + timedelta(seconds=i),
+            {"i": i, "path": "/%d" % (i % 7), "tags": ["a", None]})
+            for i in range(100)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, events, interval=8):
+        EventArchive.write(self.path, events, interval=interval)
+        return EventArchive(self.path)
+
+    def test_round_trip(self):
+        with self.write(reversed(self.events)) as archive:
+            self.assertEqual(len(archive), 100)
+            self.assertEqual(list(archive), self.events)
+            self.assertEqual(sorted(archive.types), ["login", "request"])
+            self.assertEqual(archive.first_time, self.start)
+            self.assertEqual(archive.last_time,
+                    self.start + timedelta(seconds=99))
+
+    def test_slice(self):
+        with self.write(self.events) as archive:
+            for lo, hi in [(0, 100), (0, 1), (7, 8), (8, 9), (5, 60),
+                    (99, 100), (50, 50), (60, 40)]:
+                start = self.start + timedelta(seconds=lo)
+                stop = self.start + timedelta(seconds=hi)
+                self.assertEqual(list(archive.events(start, stop)),
+                        self.events[lo:hi])
+                self.assertEqual(archive.times(start, stop),
+                        [e.time for e in self.events[lo:hi]])
+            self.assertEqual(list(archive.events(
+                start=self.start + timedelta(seconds=10.5))),
+                self.events[11:])
+            self.assertEqual(list(archive.events(
+                stop=self.start - timedelta(days=1))), [])
+            self.assertEqual(list(archive.events(
+                start=self.start + timedelta(days=1))), [])
+
+    def test_duplicate_times(self):
+        events = [Event("request", self.start + timedelta(seconds=i // 10),
+            {"i": i}) for i in range(100)]
+        with self.write(events, interval=4) as archive:
+            self.assertEqual(list(archive), events)
+            self.assertEqual(list(archive.events(
+                self.start + timedelta(seconds=3),
+                self.start + timedelta(seconds=5))), events[30:50])
+
+    def test_event_types(self):
+        with self.write(self.events) as archive:
+            self.assertEqual(list(archive.events(event_types=["login"])),
+                    [e for e in self.events if e.type == "login"])
+            self.assertEqual(list(archive.events(event_types=["nope"])),
+                    [])
+
+    def test_timezones(self):
+        events = [
+                Event("request", datetime(2012, 7, 6, 20, 0, tzinfo=tzoffset(
+                    None, 3600)), {}),
+                Event("request", datetime(2012, 7, 6, 19, 30), {}),
+                Event("request", datetime(2012, 7, 6, 18, 0,
+                    tzinfo=tzutc()), {})]
+        with self.write(events) as archive:
+            times = archive.times()
+        self.assertEqual(times, [events[2].time, events[0].time,
+            events[1].time])
+        self.assertEqual(times[1].tzinfo, tzutc())
+        self.assertEqual(times[2].tzinfo, None)
+
+    def test_empty(self):
+        with self.write([]) as archive:
+            self.assertEqual(len(archive), 0)
+            self.assertEqual(list(archive), [])
+            self.assertEqual(archive.first_time, None)
+
+    def test_invalid(self):
+        open(self.path, "wb").close()
+        self.assertRaises(InvalidArchiveError, EventArchive, self.path)
+        with open(self.path, "wb") as f:
+            f.write('[{"type": "request"}]' * 10)
+        self.assertRaises(InvalidArchiveError, EventArchive, self.path)
@@ -0,0 +1,110 @@
+from datetime import datetime
+from datetime import timedelta
+import itertools
+import json
+import time
+import unittest
+
+from pypercube.async_cube import AsyncCube
+from pypercube.cube import InvalidQueryError
+from pypercube.cube import Query
+from pypercube.event import Event
+from pypercube.expression import EventExpression
+from pypercube.expression import Max
+from pypercube.expression import Sum
+from pypercube.metric import Metric
+from pypercube.stub_server import StubCube
+from pypercube.stub_server import synthetic_events
+from pypercube import time_utils
+
+from tests import MockResponse
+from tests import mock_get
+
+
+def slow_get(delay):
+    """Create a Query.get that echoes the expression as a metric value."""
+    def _slow_get(self, expression):
+        time.sleep(delay)
+        content = json.dumps([{"time": "2012-07-06T20:33:00",
+            "value": "%s" % expression}])
+        return MockResponse(ok=True, status_code=200, content=content,
+                json=json.loads(content))
+    return _slow_get
+
+
+class TestAsyncCube(unittest.TestCase):
+    def setUp(self):
+        self.c = AsyncCube('testing.com', workers=5)
+        self._query_get = Query.get
+
+    def tearDown(self):
+        Query.get = self._query_get
+        self.c.close()
+
+    def test_init(self):
+        self.assertEqual(self.c.workers, 5)
+        self.assertEqual(self.c.pool_maxsize, 5)
+        c = AsyncCube('testing.com', workers=5, pool_maxsize=2)
+        self.assertEqual(c.pool_maxsize, 2)
+
+    def test_get_event(self):
+        timestamp = datetime.utcnow()
+        content = '[{"time":"' + timestamp.isoformat() + '"}]'
+        Query.get = mock_get(MockResponse(ok=True, status_code=200,
+            content=content, json=json.loads(content)))
+
+        result = self.c.get_event(EventExpression('test'), limit=1)
+        events = result.get(5)
+        self.assertEqual(len(events), 1)
+        self.assertTrue(isinstance(events[0], Event))
+        self.assertEqual(events[0].time, timestamp)
+
+    def test_get_metric_error(self):
+        Query.get = mock_get(MockResponse(ok=False, status_code=500))
+        result = self.c.get_metric(Sum(EventExpression('test')))
+        self.assertRaises(InvalidQueryError, result.get, 5)
+
+    def test_gather_metrics(self):
+        Query.get = slow_get(0.2)
+        e = EventExpression('test')
+        expressions = [Sum(e), Max(e), Sum(e) / Max(e), Max(e), Sum(e)]
+        started = time.time()
+        results = self.c.gather_metrics(expressions, timeout=5)
+        elapsed = time.time() - started
+        self.assertTrue(elapsed < 0.2 * len(expressions) / 2)
+        self.assertEqual(len(results), len(expressions))
+        for expression, metrics in zip(expressions, results):
+            self.assertEqual(metrics, [Metric("2012-07-06T20:33:00",
+                "%s" % expression)])
+
+    def test_close(self):
+        pool = self.c.pool
+        self.assertTrue(pool is self.c.pool)
+        self.c.close()
+        self.assertTrue(self.c._pool is None)
+        self.assertTrue(self.c._session is None)
+
+    def test_get_metric_chunked(self):
+        start = datetime(2012, 7, 6, 20)
+        with StubCube(synthetic_events(600, start)) as stub:
+            c = AsyncCube('127.0.0.1', port=stub.port, workers=2)
+            result = c.get_metric(Sum(EventExpression('request')), start,
+                    start + timedelta(minutes=10), time_utils.STEP_1_MIN,
+                    chunk_size=timedelta(minutes=3), workers=2)
+            self.assertEqual([m.value for m in result.get(5)], [60] * 10)
+            c.close()
+
+    def test_follow(self):
+        start = time_utils.floor(time_utils.now(), time_utils.STEP_1_MIN) - \
+                timedelta(minutes=5)
+        with StubCube(synthetic_events(600, start)) as stub:
+            c = AsyncCube('127.0.0.1', port=stub.port, workers=2)
+            events = c.follow_events(EventExpression('request'), start=start,
+                    limit=100)
+            self.assertEqual([e.data['elapsed_ms'] for e in
+                itertools.islice(events, 3)], [0, 1, 2])
+            metrics = c.follow_metric(Sum(EventExpression('request')),
+                    time_utils.STEP_1_MIN, start=start)
+            self.assertEqual([m.value for m in itertools.islice(metrics, 3)],
+                    [60, 60, 60])
+            c.close()
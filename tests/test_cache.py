@@ -0,0 +1,288 @@
+from datetime import datetime
+from datetime import timedelta
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pypercube.cache import DiskCache
+from pypercube.cache import LRUCache
+from pypercube.cache import SQLiteCache
+from pypercube.cube import Cube
+from pypercube.cube import Query
+from pypercube.expression import EventExpression
+from pypercube.expression import Sum
+from pypercube import time_utils
+
+from tests import MockResponse
+
+
+def counting_get(calls):
+    """Create a Query.get returning a metric per minute in [start, stop)."""
+    def _counting_get(self, expression):
+        calls.append(self.params)
+        start = time_utils.parse_time(self.params['start'])
+        stop = time_utils.parse_time(self.params['stop'])
+        start = time_utils.floor(start, time_utils.STEP_1_MIN)
+        records = []
+        while start < stop:
+            records.append({"time": start.isoformat() + "Z",
+                "value": start.minute})
+            start += timedelta(minutes=1)
+        return MockResponse(ok=True, status_code=200,
+                content=json.dumps(records), json=records)
+    return _counting_get
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = LRUCache()
+        self.assertEqual(cache.get_many([1, 2]), {})
+        cache.set_many({1: "a", 2: "b"})
+        self.assertEqual(cache.get_many([1, 2, 3]), {1: "a", 2: "b"})
+        cache.clear()
+        self.assertEqual(cache.get_many([1, 2]), {})
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set_many({1: "a"})
+        cache.set_many({2: "b"})
+        cache.get_many([1])
+        cache.set_many({3: "c"})
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_many([1, 2, 3]), {1: "a", 3: "c"})
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0.05)
+        cache.set_many({1: "a"})
+        self.assertEqual(cache.get_many([1]), {1: "a"})
+        time.sleep(0.06)
+        self.assertEqual(cache.get_many([1]), {})
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "metrics")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_persistence(self):
+        key = ("sum(request)", time_utils.STEP_1_MIN, 1341606780000)
+        cache = DiskCache(self.path)
+        cache.set_many({key: {"time": "2012-07-06T20:33:00", "value": 1}})
+        cache.close()
+        cache = DiskCache(self.path)
+        self.assertEqual(cache.get_many([key]),
+                {key: {"time": "2012-07-06T20:33:00", "value": 1}})
+        cache.clear()
+        self.assertEqual(cache.get_many([key]), {})
+        cache.close()
+
+    def test_ttl(self):
+        cache = DiskCache(self.path, ttl=0.05)
+        cache.set_many({("m", 1, 0): 1})
+        self.assertEqual(cache.get_many([("m", 1, 0)]), {("m", 1, 0): 1})
+        time.sleep(0.06)
+        self.assertEqual(cache.get_many([("m", 1, 0)]), {})
+        cache.close()
+
+
+class TestSQLiteCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "metrics.db")
+        self.now = int(time.time() * 1000)
+        self.now -= self.now % time_utils.STEP_1_MIN
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_persistence(self):
+        key = ("sum(request)", time_utils.STEP_1_MIN, self.now)
+        cache = SQLiteCache(self.path)
+        cache.set_many({key: {"time": "2012-07-06T20:33:00", "value": 1}})
+        cache.close()
+        cache = SQLiteCache(self.path)
+        self.assertEqual(cache.get_many([key]),
+                {key: {"time": "2012-07-06T20:33:00", "value": 1}})
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual(cache.get_many([key]), {})
+        cache.close()
+
+    def test_shared_between_connections(self):
+        key = ("sum(request)", time_utils.STEP_1_MIN, self.now)
+        writer = SQLiteCache(self.path)
+        reader = SQLiteCache(self.path)
+        writer.set_many({key: 1})
+        self.assertEqual(reader.get_many([key]), {key: 1})
+        writer.close()
+        reader.close()
+
+    def test_get_many(self):
+        cache = SQLiteCache(self.path)
+        step = time_utils.STEP_1_MIN
+        cache.set_many(dict((("m", step, self.now - i * step), i)
+            for i in range(10)))
+        cache.set_many({("other", step, self.now): -1,
+            ("m", time_utils.STEP_5_MIN, self.now): -1})
+        keys = [("m", step, self.now - i * step) for i in (0, 3, 9, 11)]
+        self.assertEqual(cache.get_many(keys),
+                {keys[0]: 0, keys[1]: 3, keys[2]: 9})
+        cache.close()
+
+    def test_retention(self):
+        step = time_utils.STEP_10_SEC
+        cache = SQLiteCache(self.path, retention={step: 60},
+                compact_interval=None)
+        old = ("m", step, self.now - 120000)
+        new = ("m", step, self.now)
+        kept = ("m", time_utils.STEP_1_MIN, self.now - 10 ** 12)
+        cache.set_many({old: 1, new: 2, kept: 3})
+        self.assertEqual(cache.get_many([old, new, kept]),
+                {new: 2, kept: 3})
+
+        cache.retention = {step: 0}
+        self.assertEqual(cache.get_many([new]), {})
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.compact(), 1)
+        self.assertEqual(len(cache), 1)
+        cache.close()
+
+    def test_default_retention(self):
+        cache = SQLiteCache(self.path, compact_interval=None)
+        year = 365 * 86400000
+        keys = [("m", step, self.now - year)
+                for step, _ in time_utils.STEP_CHOICES]
+        cache.set_many(dict((key, 1) for key in keys))
+        self.assertEqual(sorted(cache.get_many(keys)), keys[-2:])
+        cache.close()
+
+    def test_warm_start(self):
+        calls = []
+        query_get = Query.get
+        Query.get = counting_get(calls)
+        try:
+            metric = Sum(EventExpression('request'))
+            start = datetime(2012, 7, 6, 20, 0)
+            stop = datetime(2012, 7, 6, 21, 0)
+            for _ in range(2):
+                cache = SQLiteCache(self.path, retention={})
+                c = Cube('testing.com', cache=cache)
+                metrics = c.get_metric(metric, start, stop,
+                        time_utils.STEP_1_MIN)
+                cache.close()
+                self.assertEqual(len(metrics), 60)
+            self.assertEqual(len(calls), 1)
+        finally:
+            Query.get = query_get
+
+
+class TestCubeCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self._query_get = Query.get
+        Query.get = counting_get(self.calls)
+        self.cache = LRUCache()
+        self.c = Cube('testing.com', cache=self.cache)
+        self.metric = Sum(EventExpression('request'))
+        self.start = datetime(2012, 7, 6, 20, 0)
+        self.stop = datetime(2012, 7, 6, 21, 0)
+
+    def tearDown(self):
+        Query.get = self._query_get
+
+    def test_historical(self):
+        first = self.c.get_metric(self.metric, self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        self.assertEqual(len(first), 60)
+        self.assertEqual(len(self.cache), 60)
+        second = self.c.get_metric(self.metric, self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_only_fetches_missing(self):
+        self.c.get_metric(self.metric, self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        metrics = self.c.get_metric(self.metric, self.start,
+                self.stop + timedelta(minutes=10), time_utils.STEP_1_MIN)
+        self.assertEqual(len(metrics), 70)
+        self.assertEqual(metrics[-1].time.replace(tzinfo=None),
+                datetime(2012, 7, 6, 21, 9))
+        self.assertEqual(metrics[-1].value, 9)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.calls[1]['start'], "2012-07-06T21:00:00")
+        self.assertEqual(self.calls[1]['stop'], "2012-07-06T21:10:00")
+
+    def test_open_step_is_refetched(self):
+        stop = time_utils.now()
+        start = stop - timedelta(minutes=5)
+        first = self.c.get_metric(self.metric, start, stop,
+                time_utils.STEP_1_MIN)
+        second = self.c.get_metric(self.metric, start, stop,
+                time_utils.STEP_1_MIN)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(first), len(second))
+        self.assertEqual(time_utils.parse_time(self.calls[1]['start']),
+                time_utils.floor(stop, time_utils.STEP_1_MIN))
+
+    def test_string_times(self):
+        first = self.c.get_metric(self.metric, "2012-07-06T20:00:00Z",
+                "2012-07-06T21:00:00Z", time_utils.STEP_1_MIN)
+        second = self.c.get_metric(self.metric, self.start,
+                "2012-07-06T21:00:00", time_utils.STEP_1_MIN)
+        self.assertEqual(len(first), 60)
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_string_expression(self):
+        self.c.get_metric("sum(request)", self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        metrics = self.c.get_metric(self.metric, self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        self.assertEqual(len(metrics), 60)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_bypass(self):
+        self.c.get_metric(self.metric, self.start, self.stop,
+                time_utils.STEP_1_MIN, limit=10)
+        self.c.get_metric(self.metric, self.start, self.stop,
+                time_utils.STEP_1_MIN, limit=10)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_distinct_expressions(self):
+        self.c.get_metric(self.metric, self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        self.c.get_metric(Sum(EventExpression('other')), self.start,
+                self.stop, time_utils.STEP_1_MIN)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(self.cache), 120)
+
+    def test_equivalent_expressions_share_entries(self):
+        e1 = EventExpression('request').eq('a', 1).gt('b', 2)
+        e2 = EventExpression('request').gt('b', 2.0).eq('a', 1)
+        self.c.get_metric(Sum(e1), self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        self.c.get_metric(Sum(e2), self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(self.cache), 60)
+
+    def test_cache_hits_are_observed(self):
+        observed = []
+        self.c.observers.append(observed.append)
+        self.c.get_metric(self.metric, self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        self.c.get_metric(self.metric, self.start,
+                self.stop + timedelta(minutes=10), time_utils.STEP_1_MIN)
+        self.c.get_metric(self.metric, self.start, self.stop,
+                time_utils.STEP_1_MIN)
+        self.assertEqual([s.cache_hits for s in observed], [0, 60, 60])
+        self.assertEqual([s.records for s in observed], [60, 10, 60])
+        self.assertEqual(observed[2].bytes, 0)
@@ -0,0 +1,105 @@
+from datetime import datetime
+import time
+import unittest
+
+from pypercube.collector import Collector
+from pypercube.cube import Cube
+from pypercube.event import Event
+from pypercube.expression import EventExpression
+from pypercube.stub_server import StubCube
+
+
+class TestCollector(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubCube().start()
+        self.events = [Event('request', datetime(2012, 7, 6, 20, 33, i),
+            {'n': i}) for i in range(10)]
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def collector(self, **kwargs):
+        return Collector('127.0.0.1', self.stub.port, **kwargs)
+
+    def test_batch_size(self):
+        with self.collector(batch_size=4, flush_interval=60) as c:
+            for event in self.events:
+                self.assertTrue(c.send(event))
+            c.flush()
+            self.assertEqual(c.stats, {"sent": 10, "dropped": 0,
+                "failed": 0, "batches": 3})
+        self.assertEqual([len(r[2]) for r in self.stub.requests],
+                [4, 4, 2])
+        self.assertEqual(self.stub.requests[0][:2], ("POST",
+            "/1.0/event/put"))
+        self.assertEqual(self.stub.events(), self.events)
+
+    def test_flush_interval(self):
+        c = self.collector(batch_size=100, flush_interval=0.05)
+        c.send(self.events[0])
+        self.assertTrue(self.stub.wait_for_requests(1, 5))
+        self.assertEqual(len(self.stub.requests), 1)
+        c.close()
+
+    def test_close_sends_remaining(self):
+        c = self.collector(batch_size=100, flush_interval=60)
+        for event in self.events:
+            c.send(event)
+        c.close()
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(len(self.stub.requests[0][2]), 10)
+        # The thread has stopped, so this mustn't wait for it.
+        c.flush()
+
+    def test_drop_when_full(self):
+        self.stub.hold()
+        c = self.collector(batch_size=1, flush_interval=60, max_buffer=2,
+                block=False)
+        c.send(self.events[0])
+        # Wait for the first event to be in flight
+        self.assertTrue(self.stub.wait_for_requests(1, 5))
+        self.assertTrue(c.send(self.events[1]))
+        self.assertTrue(c.send(self.events[2]))
+        self.assertFalse(c.send(self.events[3]))
+        self.assertEqual(c.stats["dropped"], 1)
+        self.stub.release()
+        c.close()
+        self.assertEqual(c.stats["sent"], 3)
+
+    def test_block_timeout(self):
+        self.stub.hold()
+        c = self.collector(batch_size=1, flush_interval=60, max_buffer=1)
+        c.send(self.events[0])
+        self.assertTrue(self.stub.wait_for_requests(1, 5))
+        c.send(self.events[1])
+        started = time.time()
+        self.assertFalse(c.send(self.events[2], timeout=0.05))
+        self.assertTrue(time.time() - started >= 0.05)
+        self.stub.release()
+        c.close()
+        self.assertEqual(c.stats["dropped"], 1)
+
+    def test_failed(self):
+        self.stub.error_rate = 1.0
+        with self.collector(batch_size=5) as c:
+            for event in self.events:
+                c.send(event)
+            c.flush()
+        self.assertEqual(c.stats["failed"], 10)
+        self.assertEqual(c.stats["sent"], 0)
+
+    def test_unreachable(self):
+        port = self.stub.port
+        self.stub.stop()
+        with Collector('127.0.0.1', port, timeout=1) as c:
+            c.send(self.events[0])
+        self.assertEqual(c.stats["failed"], 1)
+
+    def test_sent_events_are_queryable(self):
+        with self.collector(batch_size=4) as c:
+            for event in self.events:
+                c.send(event)
+        with Cube('127.0.0.1', port=self.stub.port) as cube:
+            events = cube.get_event(EventExpression('request', 'n'),
+                    start=datetime(2012, 7, 6))
+        self.assertEqual([e.data['n'] for e in events], range(9, -1, -1))
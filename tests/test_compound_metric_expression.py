@@ -83,3 +83,104 @@ class TestCompoundMetricExpressions(unittest.TestCase):
                 "(sum(request(elapsed_ms).eq(path, \"/\")) - "\
                 "min(request(elapsed_ms).eq(path, \"/\").gt("\
                     "elapsed_ms, 500)))")
+
+    def test_hash(self):
+        m1 = self.sum / self.max + self.min
+        m2 = Sum(EventExpression('test', 'ing')) / \
+                Max(EventExpression('test', 'ing')) + self.min
+        self.assertEqual(m1, m2)
+        self.assertEqual(hash(m1), hash(m2))
+        self.assertEqual(len(set([m1, m2, self.sum + self.min])), 2)
+        self.assertFalse(m1 != m2)
+
+    def test_leaves(self):
+        self.assertEqual(self.sum.leaves(), [self.sum])
+        m = (self.sum + self.min) / (self.sum * 2) - Sum(self.e)
+        self.assertEqual(m.leaves(), [self.sum, self.min])
+
+    def test_evaluate(self):
+        values = {self.sum: 10, self.min: 2, self.max: 5}
+        self.assertEqual(self.sum.evaluate(values), 10)
+        self.assertEqual((self.sum + self.min * self.max).evaluate(values),
+                20)
+        self.assertEqual((self.sum / self.max * 3).evaluate(values), 6)
+        self.assertEqual((self.min / self.max).evaluate(values), 0.4)
+        self.assertEqual((self.sum - self.max - 1).evaluate(values), 4)
+        self.assertEqual((self.sum + self.min).evaluate({self.sum: 1}), None)
+        self.assertEqual((self.sum / self.min).evaluate({self.sum: 1,
+            self.min: 0}), None)
+        self.assertEqual((self.sum / self.min).evaluate({self.sum: 1,
+            self.min: None}), None)
+
+    def test_canonicalize_commutative(self):
+        m = self.sum
+        self.assertEqual("%s" % (m + (m + self.max)).canonicalize(),
+                "%s" % ((self.max + m) + m).canonicalize())
+        self.assertEqual("%s" % (self.min * self.max).canonicalize(),
+                "%s" % (self.max * self.min).canonicalize())
+        self.assertNotEqual("%s" % (self.min - self.max).canonicalize(),
+                "%s" % (self.max - self.min).canonicalize())
+        self.assertNotEqual("%s" % (self.min / self.max).canonicalize(),
+                "%s" % (self.max / self.min).canonicalize())
+
+    def test_canonicalize_flattens(self):
+        a, b, c = self.sum, self.max, self.min
+        self.assertEqual("%s" % (a - (b - c)).canonicalize(),
+                "((min(test(ing)) + sum(test(ing))) - max(test(ing)))")
+        self.assertEqual("%s" % ((a / b) / c).canonicalize(),
+                "%s" % (a / (c * b)).canonicalize())
+        self.assertEqual("%s" % ((a / b) * c).canonicalize(),
+                "((min(test(ing)) * sum(test(ing))) / max(test(ing)))")
+        # Dividing by a division isn't regrouped.
+        self.assertEqual("%s" % (a / (b / c)).canonicalize(),
+                "(sum(test(ing)) / (max(test(ing)) / min(test(ing))))")
+
+    def test_canonicalize_folds_constants(self):
+        m = self.sum
+        self.assertEqual("%s" % (m * 2 * 3).canonicalize(),
+                "(sum(test(ing)) * 6)")
+        self.assertEqual("%s" % (m * 2 / 4).canonicalize(),
+                "(sum(test(ing)) / 2)")
+        self.assertEqual("%s" % (m * 1.5 / 3).canonicalize(),
+                "(sum(test(ing)) * 0.5)")
+        self.assertEqual("%s" % (m + 2 - 2).canonicalize(), "sum(test(ing))")
+        self.assertEqual("%s" % (m - 1 - 2).canonicalize(),
+                "(sum(test(ing)) - 3)")
+        self.assertEqual("%s" % (m / 1).canonicalize(), "sum(test(ing))")
+        # Multiplying by zero isn't folded: a missing value is still None.
+        self.assertEqual("%s" % (m * 0).canonicalize(),
+                "(sum(test(ing)) * 0)")
+
+    def test_canonicalize_leaves(self):
+        e1 = EventExpression('request').eq('a', 1).eq('b', 2)
+        e2 = EventExpression('request').eq('b', 2).eq('a', 1)
+        self.assertEqual("%s" % (Sum(e1) / Max(e1)).canonicalize(),
+                "%s" % (Sum(e2) / Max(e2)).canonicalize())
+        self.assertEqual(Sum(e1).canonicalize(), Sum(e2).canonicalize())
+
+    def test_canonicalize_keeps_value(self):
+        a, b, c = self.sum, self.max, self.min
+        values = {a: 3, b: 5, c: 7}
+        for m in (a - (b - c) * 2, (a / b) / c * 4, a * (b + 1) - c / 2,
+                (a + b) / (c - 7), a / (b / (c - 7))):
+            self.assertEqual(m.canonicalize().evaluate(values),
+                    m.evaluate(values))
+            self.assertEqual(m.canonicalize().evaluate({a: 1}), None)
+
+    def test_canonicalize_idempotent(self):
+        m = (self.sum + self.max * 2 * 3) / self.min
+        canonical = m.canonicalize()
+        self.assertTrue(canonical.canonicalize() is canonical)
+        self.assertTrue(m.canonicalize() is canonical)
+
+    def test_canonicalize_deep(self):
+        left, right, nested = self.sum, self.sum, self.sum
+        for i in range(300):
+            left = left + self.max if i % 2 else left * self.min
+            right = self.max + right if i % 2 else self.min * right
+            nested = self.max / nested
+        for m in (left, right, nested):
+            canonical = m.canonicalize()
+            self.assertTrue(canonical.canonicalize() is canonical)
+        self.assertEqual("%s" % left.canonicalize(),
+                "%s" % right.canonicalize())
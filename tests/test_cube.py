@@ -1,13 +1,19 @@
 from datetime import datetime
+from datetime import timedelta
 import json
+import threading
 import unittest
 
 from pypercube.cube import Cube
+from pypercube.cube import InvalidQueryError
 from pypercube.cube import Query
 from pypercube.event import Event
 from pypercube.expression import EventExpression
+from pypercube.expression import Max
 from pypercube.expression import Sum
 from pypercube.metric import Metric
+from pypercube.retry import RetryPolicy
+from pypercube.time_utils import parse_time
 from pypercube.time_utils import yesterday
 from pypercube.time_utils import STEP_1_MIN
 
@@ -18,6 +24,13 @@ from tests import mock_get
 class TestCube(unittest.TestCase):
     def setUp(self):
         self.c = Cube('testing.com')
+        self._query_get = Query.get
+        self._query_stream = Query.stream
+
+    def tearDown(self):
+        Query.get = self._query_get
+        Query.stream = self._query_stream
+        self.c.close()
 
     def test_init(self):
         self.assertEqual(self.c.hostname, 'testing.com')
@@ -27,6 +40,41 @@ class TestCube(unittest.TestCase):
     def test_url(self):
         self.assertEqual(self.c.get_base_url(), "http://testing.com:1081/1.0")
 
+    def test_session_pool(self):
+        c = Cube('testing.com', pool_connections=2, pool_maxsize=20,
+                pool_block=True)
+        session = c.session
+        self.assertTrue(session is c.session)
+        adapter = session.get_adapter(c.get_base_url())
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(adapter._pool_maxsize, 20)
+        self.assertEqual(adapter._pool_block, True)
+        self.assertNotEqual(session.headers.get('Connection'), 'close')
+
+    def test_no_keep_alive(self):
+        c = Cube('testing.com', keep_alive=False)
+        self.assertEqual(c.session.headers['Connection'], 'close')
+
+    def test_close(self):
+        session = self.c.session
+        self.c.close()
+        self.assertTrue(self.c._session is None)
+        self.assertFalse(session is self.c.session)
+
+    def test_context_manager(self):
+        with Cube('testing.com') as c:
+            session = c.session
+        self.assertTrue(c._session is None)
+        self.assertTrue(session is not None)
+
+    def test_queries_share_session(self):
+        c = Cube('testing.com', timeout=(1, 5))
+        q1 = c._query("event/get")
+        q2 = c._query("metric/get", step=STEP_1_MIN)
+        self.assertTrue(q1.session is c.session)
+        self.assertTrue(q2.session is c.session)
+        self.assertEqual(q1.timeout, (1, 5))
+
     def test_no_matching_events(self):
         mock_response = MockResponse(ok=True, status_code='200',
                 content="[]", json=[])
@@ -50,6 +98,77 @@ class TestCube(unittest.TestCase):
         self.assertTrue(isinstance(response[0], Event))
         self.assertEqual(response[0].time, timestamp)
 
+    def test_iter_events(self):
+        timestamps = [datetime(2012, 7, 6, 20, 33, i) for i in range(50)]
+        content = json.dumps([{"time": t.isoformat(), "type": "test",
+            "data": {"n": i}} for i, t in enumerate(timestamps)])
+        mock_response = MockResponse(ok=True, status_code=200,
+                content=content)
+        Query.stream = mock_get(mock_response)
+
+        events = self.c.iter_events(EventExpression('test'), chunk_size=7)
+        first = next(events)
+        self.assertTrue(isinstance(first, Event))
+        self.assertEqual(first.time, timestamps[0])
+        self.assertFalse(mock_response.closed)
+        rest = list(events)
+        self.assertEqual(len(rest), 49)
+        self.assertEqual([e.data['n'] for e in rest], range(1, 50))
+        self.assertTrue(mock_response.closed)
+
+    def test_iter_events_error(self):
+        mock_response = MockResponse(ok=False, status_code=400, content="")
+        Query.stream = mock_get(mock_response)
+        events = self.c.iter_events(EventExpression('test'))
+        self.assertRaises(InvalidQueryError, list, events)
+        self.assertTrue(mock_response.closed)
+
+    def test_observers(self):
+        observed = []
+        c = Cube('testing.com', observers=[observed.append])
+        content = json.dumps([{"time": "2012-07-06T20:33:00Z",
+            "value": i} for i in range(3)])
+        Query.get = mock_get(MockResponse(ok=True, status_code=200,
+            content=content, json=json.loads(content)))
+        metric = Sum(EventExpression('request'))
+        c.get_metric(metric, step=STEP_1_MIN)
+        c.get_metric(metric, step=STEP_1_MIN, as_series=True)
+        self.assertEqual(len(observed), 2)
+        stats = observed[0]
+        self.assertEqual(stats.path, "metric/get")
+        self.assertEqual(stats.expression, "sum(request)")
+        self.assertEqual(stats.params, {"step": "60000"})
+        self.assertEqual(stats.bytes, len(content))
+        self.assertEqual(stats.records, 3)
+        self.assertEqual(stats.retries, 0)
+        self.assertTrue(stats.latency >= 0 and stats.decode_time >= 0)
+        self.assertEqual(stats.error, None)
+        self.assertEqual(observed[1].records, 3)
+
+    def test_observers_see_errors(self):
+        observed = []
+        c = Cube('testing.com', observers=[observed.append])
+        Query.get = mock_get(MockResponse(ok=False, status_code=400,
+            content=""))
+        self.assertRaises(InvalidQueryError, c.get_event,
+                EventExpression('test'))
+        self.assertTrue(isinstance(observed[0].error, InvalidQueryError))
+        self.assertEqual(observed[0].path, "event/get")
+
+    def test_observe_iter_events(self):
+        observed = []
+        c = Cube('testing.com', observers=[observed.append])
+        content = json.dumps([{"time": "2012-07-06T20:33:00Z",
+            "type": "test"}] * 5)
+        Query.stream = mock_get(MockResponse(ok=True, status_code=200,
+            content=content))
+        events = c.iter_events(EventExpression('test'), chunk_size=10)
+        next(events)
+        self.assertEqual(observed, [])
+        list(events)
+        self.assertEqual(observed[0].records, 5)
+        self.assertEqual(observed[0].bytes, len(content))
+
     def test_no_matching_metrics(self):
         mock_response = MockResponse(ok=True, status_code='200',
                 content="[]", json=[])
@@ -78,6 +197,233 @@ class TestCube(unittest.TestCase):
         self.assertEqual(response[0].value, 100)
 
 
+def minutely_get(calls):
+    """Create a Query.get that returns one metric per minute, inclusive of
+    both start and stop, and records the params of each call."""
+    lock = threading.Lock()
+
+    def _minutely_get(self, expression):
+        with lock:
+            calls.append(self.params)
+        start = parse_time(self.params['start'])
+        stop = parse_time(self.params['stop'])
+        records = []
+        while start <= stop:
+            records.append({"time": start.isoformat(),
+                "value": start.minute})
+            start += timedelta(minutes=1)
+        return MockResponse(ok=True, status_code=200,
+                content=json.dumps(records), json=records)
+    return _minutely_get
+
+
+class TestChunkedMetrics(unittest.TestCase):
+    def setUp(self):
+        self.c = Cube('testing.com')
+        self._query_get = Query.get
+        self.calls = []
+        Query.get = minutely_get(self.calls)
+        self.metric = Sum(EventExpression('test'))
+        self.start = datetime(2012, 7, 6, 20, 0)
+        self.stop = datetime(2012, 7, 6, 21, 0)
+
+    def tearDown(self):
+        Query.get = self._query_get
+
+    def test_chunked(self):
+        unchunked = self.c.get_metric(self.metric, self.start, self.stop,
+                STEP_1_MIN)
+        del self.calls[:]
+        chunked = self.c.get_metric(self.metric, self.start, self.stop,
+                STEP_1_MIN, chunk_size=timedelta(minutes=10), workers=3)
+        self.assertEqual(len(self.calls), 6)
+        self.assertEqual(sorted(c['start'] for c in self.calls),
+                ["2012-07-06T20:%02d:00" % m for m in range(0, 60, 10)])
+        self.assertEqual(len(chunked), 61)
+        self.assertEqual(chunked, unchunked)
+
+    def test_chunked_limit(self):
+        # Like an unchunked query, the newest steps are returned, and only
+        # the windows holding them are fetched.
+        metrics = self.c.get_metric(self.metric, self.start, self.stop,
+                STEP_1_MIN, limit=15, chunk_size=timedelta(minutes=10),
+                workers=1)
+        self.assertEqual(len(metrics), 15)
+        self.assertEqual(metrics[0].time, datetime(2012, 7, 6, 20, 46))
+        self.assertEqual(metrics[-1].time, datetime(2012, 7, 6, 21, 0))
+        self.assertEqual([c['start'] for c in self.calls],
+                ["2012-07-06T20:50:00", "2012-07-06T20:40:00"])
+
+    def test_chunked_aware(self):
+        start = parse_time("2012-07-06T22:00:00+02:00")
+        stop = parse_time("2012-07-06T21:00:00Z")
+        metrics = self.c.get_metric(self.metric, start, stop, STEP_1_MIN,
+                chunk_size=timedelta(minutes=25))
+        self.assertEqual(len(metrics), 61)
+        self.assertEqual(sorted(c['start'] for c in self.calls), [
+            "2012-07-06T20:00:00+00:00", "2012-07-06T20:25:00+00:00",
+            "2012-07-06T20:50:00+00:00"])
+
+    def test_chunked_series(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest("numpy is not installed")
+        series = self.c.get_metric(self.metric, self.start, self.stop,
+                STEP_1_MIN, as_series=True,
+                chunk_size=timedelta(minutes=25))
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(len(series), 61)
+        self.assertTrue((numpy.diff(series.times) == STEP_1_MIN).all())
+
+    def test_chunked_needs_window(self):
+        self.assertRaises(ValueError, self.c.get_metric, self.metric,
+                step=STEP_1_MIN, chunk_size=timedelta(minutes=10))
+        self.assertRaises(ValueError, self.c.get_metric, self.metric,
+                self.start, chunk_size=timedelta(minutes=10))
+
+
+class TestEvaluateMetrics(unittest.TestCase):
+    def setUp(self):
+        self.c = Cube('testing.com')
+        self._query_get = Query.get
+        self.expressions = []
+        test = self
+
+        def _fake_get(self, expression):
+            test.expressions.append("%s" % expression)
+            value = {"sum(request)": 10, "max(request)": 4,
+                    "sum(error)": 0, "sum(request.eq(ok, true))": 10,
+                    "sum(request.eq(ok, 1))": 99}["%s" % expression]
+            records = [{"time": "2012-07-06T20:%02d:00Z" % m, "value": value}
+                    for m in range(3)]
+            if expression == Max(EventExpression('request')):
+                records[1]["value"] = None
+                del records[2]
+            return MockResponse(ok=True, status_code=200,
+                    content=json.dumps(records), json=records)
+        Query.get = _fake_get
+
+    def tearDown(self):
+        Query.get = self._query_get
+
+    def test_evaluate_metrics(self):
+        request = EventExpression('request')
+        error = EventExpression('error')
+        expressions = [Sum(request) / Max(request), Sum(request) * 2,
+                Sum(error) / Sum(request), Sum(request) / Sum(error)]
+        results = self.c.evaluate_metrics(expressions,
+                start=datetime(2012, 7, 6, 20), step=STEP_1_MIN)
+        self.assertEqual(sorted(self.expressions), ["max(request)",
+            "sum(error)", "sum(request)"])
+        self.assertEqual([[m.value for m in r] for r in results], [
+            [2.5, None, None],
+            [20, 20, 20],
+            [0, 0, 0],
+            [None, None, None]])
+        self.assertEqual(results[0][1].time.minute, 1)
+
+    def test_evaluate_bool_and_number(self):
+        request = EventExpression('request')
+        results = self.c.evaluate_metrics([Sum(request.eq('ok', True)),
+            Sum(request.eq('ok', 1))])
+        self.assertEqual(sorted(self.expressions), [
+            "sum(request.eq(ok, 1))", "sum(request.eq(ok, true))"])
+        self.assertEqual([r[0].value for r in results], [10, 99])
+
+    def test_evaluate_single(self):
+        results = self.c.evaluate_metrics([Sum(EventExpression('request'))])
+        self.assertEqual(self.expressions, ["sum(request)"])
+        self.assertEqual([m.value for m in results[0]], [10, 10, 10])
+
+
+class TestGetMetrics(unittest.TestCase):
+    def setUp(self):
+        self.c = Cube('testing.com', pool_maxsize=3)
+        self._query_get = Query.get
+        self.calls = []
+        test = self
+
+        def _fake_get(self, expression):
+            test.calls.append(("%s" % expression, self.params))
+            if expression == Max(EventExpression('error')):
+                response = MockResponse(ok=False, status_code=400)
+                response.url = self.base_url
+                return response
+            minutes = range(3) if expression == Sum(EventExpression(
+                'request')) else range(1, 4)
+            value = {"sum(request.eq(a, true))": 10,
+                    "sum(request.eq(a, 1))": 99}.get("%s" % expression)
+            records = [{"time": "2012-07-06T20:%02d:00Z" % m,
+                "value": m if value is None else value} for m in minutes]
+            return MockResponse(ok=True, status_code=200,
+                    content=json.dumps(records), json=records)
+        Query.get = _fake_get
+
+    def tearDown(self):
+        Query.get = self._query_get
+
+    def test_get_metrics(self):
+        request = Sum(EventExpression('request'))
+        error = Sum(EventExpression('error'))
+        table = self.c.get_metrics([request, error, request],
+                start=datetime(2012, 7, 6, 20), step=STEP_1_MIN)
+        self.assertEqual(sorted(c[0] for c in self.calls),
+                ["sum(error)", "sum(request)"])
+        self.assertTrue(self.calls[0][1] is self.calls[1][1])
+        self.assertTrue(table.ok)
+        self.assertEqual(table.expressions, [request, error])
+        self.assertEqual([t.minute for t in table.times], [0, 1, 2, 3])
+        self.assertEqual(table[request], [0, 1, 2, None])
+        self.assertEqual(table[error], [None, 1, 2, 3])
+        self.assertEqual(list(table.rows())[0][1], [0, None])
+
+    def test_errors(self):
+        request = Sum(EventExpression('request'))
+        bad = Max(EventExpression('error'))
+        table = self.c.get_metrics([bad, request])
+        self.assertFalse(table.ok)
+        self.assertEqual(table.errors.keys(), ["max(error)"])
+        self.assertTrue(isinstance(table.errors["max(error)"],
+            InvalidQueryError))
+        self.assertRaises(InvalidQueryError, table.__getitem__, bad)
+        self.assertEqual(table[request], [0, 1, 2])
+        self.assertEqual([values for _, values in table.rows()],
+                [[None, 0], [None, 1], [None, 2]])
+
+    def test_equivalent_expressions_are_fetched_once(self):
+        e1 = EventExpression('request').eq('a', 1).eq('b', 2)
+        e2 = EventExpression('request').eq('b', 2).eq('a', 1)
+        table = self.c.get_metrics([Sum(e1), Sum(e2)])
+        self.assertEqual([c[0] for c in self.calls],
+                ['sum(request.eq(a, 1).eq(b, 2))'])
+        self.assertEqual(table.expressions, [Sum(e1), Sum(e2)])
+        self.assertEqual(table[Sum(e1)], table[Sum(e2)])
+
+    def test_equal_values_of_different_types(self):
+        e1 = Sum(EventExpression('request').eq('a', True))
+        e2 = Sum(EventExpression('request').eq('a', 1))
+        table = self.c.get_metrics([e1, e2, e1])
+        self.assertEqual(sorted(c[0] for c in self.calls),
+                ['sum(request.eq(a, 1))', 'sum(request.eq(a, true))'])
+        self.assertEqual(table.expressions, [e1, e2])
+        self.assertEqual(table[e1], [10, 10, 10])
+        self.assertEqual(table[e2], [99, 99, 99])
+        self.assertEqual(list(table.rows())[0][1], [10, 99])
+
+    def test_invalid_step(self):
+        self.assertRaises(ValueError, self.c.get_metrics,
+                [Sum(EventExpression('request'))], step=1234)
+
+    def test_many(self):
+        expressions = [Sum(EventExpression('request').eq('id', i))
+                for i in range(20)]
+        table = self.c.get_metrics(expressions)
+        self.assertEqual(len(self.calls), 20)
+        self.assertEqual(len(table.columns), 20)
+        self.assertEqual(table.metrics(expressions[0])[0].value, 1)
+
+
 class TestQuery(unittest.TestCase):
     def setUp(self):
         self.now = datetime(2012, 07, 06)
@@ -109,3 +455,40 @@ class TestQuery(unittest.TestCase):
         self.assertEqual(len(q.params), 3)
         self.assertEqual(q.base_url, base_url)
         self.assertEqual(q.path, path)
+        self.assertEqual(q.session, None)
+        self.assertEqual(q.timeout, None)
+
+    def test_get_uses_session(self):
+        class MockSession(object):
+            def get(self, url, params=None, timeout=None, stream=False):
+                self.call = (url, params, timeout, stream)
+                return MockResponse(ok=True, status_code=200, json=[])
+
+        session = MockSession()
+        q = Query('http://test_base.com/1.0', 'event/get', limit=5,
+                session=session, timeout=3)
+        q.get('test')
+        self.assertEqual(session.call, ('http://test_base.com/1.0/event/get',
+            {'limit': 5, 'expression': 'test'}, 3, False))
+        q.stream('test')
+        self.assertEqual(session.call[3], True)
+
+    def test_retry(self):
+        class FlakySession(object):
+            calls = 0
+
+            def get(self, url, params=None, timeout=None, stream=False):
+                self.calls += 1
+                return MockResponse(ok=self.calls > 1,
+                        status_code=503 if self.calls == 1 else 200)
+
+        session = FlakySession()
+        q = Query('http://test_base.com/1.0', 'event/get', session=session,
+                retry=RetryPolicy(retries=1, sleep=lambda seconds: None))
+        response = q.get('test')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.retries, 1)
+        self.assertEqual(session.calls, 2)
+
+        c = Cube('testing.com', retry=RetryPolicy())
+        self.assertTrue(c._query('event/get').retry is c.retry)
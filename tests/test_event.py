@@ -1,7 +1,10 @@
 import json
+import pickle
 import unittest
 
 from pypercube.event import Event
+from pypercube.event import FrozenEvent
+from pypercube.event import InvalidEventError
 from pypercube import time_utils
 
 
@@ -54,3 +57,35 @@ class TestEvent(unittest.TestCase):
         load_e1 = Event.from_json(json_str)
         self.assertEqual(load_e1, e1)
         self.assertEqual(load_e1, e2)
+
+    def test_slots(self):
+        e = Event('timing', time_utils.now(), {})
+        self.assertFalse(hasattr(e, '__dict__'))
+        self.assertRaises(AttributeError, setattr, e, 'foo', 1)
+
+    def test_pickle(self):
+        e = Event('timing', '2012-07-06T20:33:16.573Z', {'elapsed_ms': 83})
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(e, protocol))
+            self.assertTrue(isinstance(copy, Event))
+            self.assertEqual(copy, e)
+
+    def test_freeze(self):
+        now = time_utils.now()
+        e = Event('timing', now, {'elapsed_ms': 83.488})
+        frozen = e.freeze()
+        self.assertTrue(isinstance(frozen, FrozenEvent))
+        self.assertEqual(frozen.type, 'timing')
+        self.assertEqual(frozen.time, now)
+        self.assertEqual(frozen.data, {'elapsed_ms': 83.488})
+        self.assertEqual(frozen,
+                FrozenEvent('timing', now.isoformat(), {'elapsed_ms': 83.488}))
+        self.assertEqual(frozen.thaw(), e)
+        self.assertEqual(frozen.to_json(), e.to_json())
+        self.assertEqual(FrozenEvent.from_json(str(e)), frozen)
+        self.assertEqual(len(set([frozen, e.freeze()])), 1)
+        self.assertNotEqual(frozen,
+                Event('timing', now, {'elapsed_ms': 1}).freeze())
+        self.assertRaises(AttributeError, setattr, frozen, 'type', 'x')
+        self.assertRaises(InvalidEventError, FrozenEvent.from_json,
+                '{"type": "timing"}')
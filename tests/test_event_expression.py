@@ -1,7 +1,10 @@
 import unittest
 
 from pypercube.cube import Cube
+from pypercube.event import Event
 from pypercube.expression import EventExpression
+from pypercube.expression import Sum
+from pypercube.expression import intern_expression
 
 
 class TestEventExpressions(unittest.TestCase):
@@ -109,3 +112,130 @@ class TestEventExpressions(unittest.TestCase):
         self.assertEqual(len(e.filters), 3)
         self.assertEqual("%s" % e,
                 'test.eq(bar, "baz").lt(fizz, "bang").ge(foo, 4)')
+
+    def test_immutable(self):
+        e = EventExpression('request', ['path', 'elapsed_ms']).eq('path', '/')
+        self.assertRaises(AttributeError, setattr, e, 'event_type', 'x')
+        self.assertRaises(AttributeError, setattr, e, 'filters', [])
+        e.event_properties.append('user_id')
+        self.assertEqual(e.event_properties, ['path', 'elapsed_ms'])
+        self.assertTrue(e.copy() is e)
+
+    def test_chaining_leaves_original(self):
+        e1 = EventExpression('request').eq('path', '/')
+        e2 = e1.gt('elapsed_ms', 500)
+        self.assertEqual("%s" % e1, 'request.eq(path, "/")')
+        self.assertEqual("%s" % e2,
+                'request.eq(path, "/").gt(elapsed_ms, 500)')
+        self.assertEqual(len(e1.filters), 1)
+        self.assertEqual(len(e2.filters), 2)
+
+    def test_hash(self):
+        e1 = EventExpression('request', 'path').eq('path', '/').in_array(
+            'user', ['a', 'b'])
+        e2 = EventExpression('request', ['path']).eq('path', '/').in_array(
+            'user', ['a', 'b'])
+        self.assertEqual(hash(e1), hash(e2))
+        self.assertEqual({e1: 1}[e2], 1)
+        self.assertNotEqual(hash(e1), hash(e1.gt('elapsed_ms', 1)))
+        e3 = EventExpression('request').eq('user', {'id': 1}).in_array(
+            'path', [['a', 'b']])
+        self.assertEqual({e3: 1}[EventExpression('request').eq('user',
+            {'id': 1}).in_array('path', [['a', 'b']])], 1)
+        self.assertNotEqual(EventExpression('request').eq('ok', True),
+                EventExpression('request').eq('ok', 1))
+
+    def test_intern(self):
+        e1 = intern_expression(EventExpression('request').eq('path', '/'))
+        e2 = intern_expression(EventExpression('request').eq('path', '/'))
+        e3 = intern_expression(EventExpression('request').eq('path', '/a'))
+        self.assertTrue(e1 is e2)
+        self.assertFalse(e1 is e3)
+        m1 = intern_expression(Sum(e1) / Sum(e3))
+        m2 = intern_expression(Sum(e2) / Sum(e3))
+        self.assertTrue(m1 is m2)
+
+    def test_long_chain(self):
+        e = EventExpression('request', 'elapsed_ms')
+        expected = ["request(elapsed_ms)"]
+        for i in range(2000):
+            e = e.gt('elapsed_ms', i)
+            expected.append(".gt(elapsed_ms, %d)" % i)
+        self.assertEqual("%s" % e, "".join(expected))
+        self.assertEqual(len(e.filters), 2000)
+        self.assertEqual(e.filters[-1].value, 1999)
+
+    def test_shared_prefix(self):
+        base = EventExpression('request').eq('path', '/')
+        e1 = base.gt('elapsed_ms', 500)
+        e2 = base.lt('elapsed_ms', 100)
+        self.assertEqual(e1.filters[0], e2.filters[0])
+        self.assertEqual("%s" % e2,
+                'request.eq(path, "/").lt(elapsed_ms, 100)')
+        self.assertEqual("%s" % e1,
+                'request.eq(path, "/").gt(elapsed_ms, 500)')
+        self.assertEqual("%s" % base, 'request.eq(path, "/")')
+        self.assertEqual(len(base.filters), 1)
+        self.assertEqual(e1, EventExpression('request').eq('path', '/').gt(
+            'elapsed_ms', 500))
+        self.assertNotEqual(e1, e2)
+
+    def test_compile(self):
+        e = EventExpression('request').eq('path', '/').gt('elapsed_ms', 100)
+        match = e.compile()
+        self.assertTrue(match is e.compile())
+        self.assertTrue(match(Event('request', '2012-07-06T20:33:16',
+            {'path': '/', 'elapsed_ms': 101})))
+        self.assertFalse(match(Event('request', '2012-07-06T20:33:16',
+            {'path': '/', 'elapsed_ms': 100})))
+        self.assertFalse(match(Event('other', '2012-07-06T20:33:16',
+            {'path': '/', 'elapsed_ms': 101})))
+        self.assertFalse(match(Event('request', '2012-07-06T20:33:16',
+            None)))
+        self.assertTrue(EventExpression('request').compile()(
+            Event('request', '2012-07-06T20:33:16', None)))
+
+    def test_filter(self):
+        events = [Event('request', '2012-07-06T20:33:%02d' % i,
+            {'path': '/' if i % 2 else '/api', 'elapsed_ms': i * 10,
+                'user': {'id': i, 'name': 'u%d' % i}})
+            for i in range(10)]
+        e = EventExpression('request', ['elapsed_ms', 'user.id']).eq(
+            'path', '/api').ge('elapsed_ms', 40)
+        matched = list(e.filter(events))
+        self.assertEqual([m.data for m in matched], [
+            {'elapsed_ms': 40, 'user': {'id': 4}},
+            {'elapsed_ms': 60, 'user': {'id': 6}},
+            {'elapsed_ms': 80, 'user': {'id': 8}}])
+        self.assertEqual(matched[0].time, events[4].time)
+        self.assertEqual(events[4].data['user']['name'], 'u4')
+
+        unprojected = list(e.filter(events, project=False))
+        self.assertTrue(unprojected[0] is events[4])
+        everything = EventExpression('request')
+        self.assertTrue(list(everything.filter(events))[0] is events[0])
+
+    def test_canonicalize(self):
+        e1 = EventExpression('request', ['path', 'ms']).eq('a', 1).gt(
+                'ms', 100).contains('path', 'api')
+        e2 = EventExpression('request', ['ms', 'path', 'ms']).re('path',
+                'api').gt('ms', 100.0).eq('a', 1).eq('a', 1)
+        self.assertNotEqual(e1, e2)
+        self.assertEqual(e1.canonicalize(), e2.canonicalize())
+        self.assertEqual("%s" % e1.canonicalize(),
+                'request(ms, path).eq(a, 1).gt(ms, 100).re(path, "api")')
+        canonical = e1.canonicalize()
+        self.assertTrue(canonical.canonicalize() is canonical)
+        e3 = EventExpression('request').eq('a', 1)
+        self.assertTrue(e3.canonicalize() is e3)
+
+    def test_canonicalize_keeps_meaning(self):
+        e = EventExpression('request', 'ms').ne('a', 1).endswith('path',
+                'get').in_array('s', [2, 1])
+        events = [Event('request', '2012-07-06T20:33:16', data) for data in (
+            {'a': 2, 'path': '/get', 's': 1, 'ms': 1},
+            {'a': 1, 'path': '/get', 's': 1, 'ms': 2},
+            {'path': '/event/get', 's': 2, 'ms': 3},
+            {'a': 2, 'path': '/get/x', 's': 1, 'ms': 4})]
+        self.assertEqual(list(e.filter(events)),
+                list(e.canonicalize().filter(events)))
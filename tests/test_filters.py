@@ -66,3 +66,100 @@ class TestFilter(unittest.TestCase):
     def test_in(self):
         f = IN('name', ['a', 'b', 'c'])
         self.assertEqual("%s" % f, '.in(name, ["a", "b", "c"])')
+
+    def test_hash(self):
+        self.assertEqual(hash(EQ('name', 'test')), hash(EQ('name', 'test')))
+        self.assertEqual(hash(IN('name', ['a', 'b'])),
+                hash(IN('name', ('a', 'b'))))
+        self.assertEqual(len(set([EQ('name', 1), EQ('name', 1.0),
+            NE('name', 1)])), 2)
+        self.assertEqual(hash(IN('name', [[1, 2], {'a': [3]}])),
+                hash(IN('name', [(1, 2), {'a': (3,)}])))
+        self.assertEqual(hash(EQ('name', {'a': 1, 'b': 2})),
+                hash(EQ('name', {'b': 2, 'a': 1.0})))
+        self.assertNotEqual(EQ('ok', True), EQ('ok', 1))
+        self.assertNotEqual(hash(EQ('ok', True)), hash(EQ('ok', 1)))
+        self.assertNotEqual(IN('ok', [True]), IN('ok', [1.0]))
+        self.assertEqual(EQ('ok', [1]), EQ('ok', [1.0]))
+
+    def test_compile(self):
+        data = {'name': 'test', 'count': 5, 'nested': {'path': '/api/1.0'},
+                'tags': ['a', 'b'], 'flag': True}
+        self.assertTrue(EQ('name', 'test').compile()(data))
+        self.assertFalse(EQ('name', 'other').compile()(data))
+        self.assertTrue(NE('name', 'other').compile()(data))
+        self.assertTrue(LT('count', 6).compile()(data))
+        self.assertFalse(LT('count', 5).compile()(data))
+        self.assertTrue(LE('count', 5).compile()(data))
+        self.assertTrue(GT('count', 4.5).compile()(data))
+        self.assertTrue(GE('count', 5).compile()(data))
+        self.assertTrue(GT('name', 'abc').compile()(data))
+        self.assertTrue(RE('name', 'es').compile()(data))
+        self.assertFalse(RE('count', '5').compile()(data))
+        self.assertTrue(StartsWith('nested.path', '/api').compile()(data))
+        self.assertTrue(EndsWith('nested.path', '1.0').compile()(data))
+        self.assertFalse(EndsWith('nested.path', '/api').compile()(data))
+        self.assertTrue(IN('count', [1, 5]).compile()(data))
+        self.assertFalse(IN('name', 'tes').compile()(data))
+        self.assertTrue(IN('tags', ['a']).compile()(data))
+        self.assertTrue(EQ('tags', ['a', 'b']).compile()(data))
+        self.assertTrue(Filter('eq', 'flag', True).compile()(data))
+
+    def test_compile_arrays(self):
+        data = {'tags': ['api', 'web'], 'sizes': [1, 20]}
+        self.assertTrue(EQ('tags', 'web').compile()(data))
+        self.assertFalse(EQ('tags', 'db').compile()(data))
+        self.assertFalse(NE('tags', 'web').compile()(data))
+        self.assertTrue(NE('tags', 'db').compile()(data))
+        self.assertTrue(IN('tags', ['db', 'api']).compile()(data))
+        self.assertFalse(IN('tags', ['db']).compile()(data))
+        self.assertTrue(RE('tags', 'eb$').compile()(data))
+        self.assertTrue(StartsWith('tags', 'we').compile()(data))
+        self.assertTrue(GT('sizes', 10).compile()(data))
+        self.assertFalse(GT('sizes', 20).compile()(data))
+
+    def test_compile_bool(self):
+        self.assertFalse(EQ('x', True).compile()({'x': 1}))
+        self.assertFalse(EQ('x', 1).compile()({'x': True}))
+        self.assertTrue(EQ('x', 1).compile()({'x': 1.0}))
+        self.assertTrue(NE('x', False).compile()({'x': 0}))
+        self.assertFalse(IN('x', [1, 2]).compile()({'x': True}))
+        self.assertTrue(IN('x', [True]).compile()({'x': True}))
+        self.assertFalse(EQ('x', [1]).compile()({'x': [True]}))
+
+    def test_compile_kinds(self):
+        self.assertFalse(GT('count', '1').compile()({'count': 5}))
+        self.assertFalse(LT('name', 10).compile()({'name': 'test'}))
+        self.assertFalse(GT('flag', 0).compile()({'flag': True}))
+
+    def test_compile_missing(self):
+        for f in (EQ, LT, LE, GT, GE, RE):
+            self.assertFalse(f('missing', '1').compile()({}))
+            self.assertFalse(f('nested.missing', '1').compile()(
+                {'nested': 1}))
+        self.assertFalse(IN('missing', ['1']).compile()({}))
+        self.assertTrue(NE('missing', '1').compile()({}))
+
+    def test_canonicalize(self):
+        f = EQ('x', 1)
+        self.assertTrue(f.canonicalize() is f)
+        self.assertEqual("%s" % GT('x', 2.0).canonicalize(), '.gt(x, 2)')
+        self.assertEqual("%s" % GT('x', 2.5).canonicalize(), '.gt(x, 2.5)')
+        self.assertEqual("%s" % IN('x', ['b', 'a', 'b']).canonicalize(),
+                '.in(x, ["a", "b"])')
+
+    def test_canonicalize_re(self):
+        def canonical(pattern):
+            return RE('x', pattern).canonicalize().value
+
+        self.assertEqual(canonical(EndsWith('x', 'a').value), 'a$')
+        self.assertEqual(canonical(".*a.*"), 'a')
+        self.assertEqual(canonical(StartsWith('x', 'a').value), '^a')
+        # Anchored, lazy, escaped and possessive-looking patterns stay.
+        for pattern in ('^.*a', 'a.*$', '.*?a', '.*+', 'a\\.*', '.*{2}'):
+            self.assertEqual(canonical(pattern), pattern)
+        self.assertEqual(canonical('a\\\\.*'), 'a\\\\')
+        for pattern, value in (('.*event.*', 'my event log'),
+                ('.*get$', 'event/get'), ('.*get$', 'get/event')):
+            self.assertEqual(RE('x', pattern).compile()({'x': value}),
+                    RE('x', canonical(pattern)).compile()({'x': value}))
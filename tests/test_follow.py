@@ -0,0 +1,182 @@
+from datetime import datetime
+from datetime import timedelta
+import itertools
+import json
+import unittest
+
+from dateutil.tz import tzutc
+
+from pypercube import cube
+from pypercube.cube import Cube
+from pypercube.cube import Query
+from pypercube.event import Event
+from pypercube.expression import EventExpression
+from pypercube.expression import Sum
+from pypercube.stub_server import StubCube
+from pypercube.stub_server import synthetic_events
+from pypercube import time_utils
+
+from tests import MockResponse
+
+
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += timedelta(seconds=seconds)
+
+
+class TestFollow(unittest.TestCase):
+    def setUp(self):
+        self.c = Cube('testing.com')
+        self.calls = []
+        self.clock = FakeClock(datetime(2012, 7, 6, 20, 33, 16))
+        self.events = []
+        self._query_get = Query.get
+        self._now = cube.now
+        cube.now = self.clock
+        Query.get = self.fake_get()
+
+    def tearDown(self):
+        Query.get = self._query_get
+        cube.now = self._now
+
+    def fake_get(self):
+        """A Query.get serving per-minute metrics and self.events."""
+        test = self
+
+        def _fake_get(self, expression):
+            test.calls.append(self.params)
+            start = time_utils.parse_time(self.params['start'])
+            if self.path == "event/get":
+                stop = time_utils.parse_time(self.params['stop']) \
+                        if 'stop' in self.params else None
+                records = [e.to_json() for e in reversed(test.events)
+                        if start <= e.time <= test.clock.now and
+                        (stop is None or e.time < stop)]
+                records = records[:self.params.get('limit')]
+            else:
+                stop = time_utils.parse_time(self.params['stop'])
+                records = []
+                while start < stop:
+                    records.append({"time": start.isoformat(),
+                        "value": start.minute})
+                    start += timedelta(minutes=1)
+            return MockResponse(ok=True, status_code=200,
+                    content=json.dumps(records), json=records)
+        return _fake_get
+
+    def test_follow_metric(self):
+        metrics = self.c.follow_metric(Sum(EventExpression('request')),
+                time_utils.STEP_1_MIN, sleep=self.clock.sleep, delay=2)
+        first = list(itertools.islice(metrics, 3))
+        self.assertEqual([m.time for m in first], [
+            datetime(2012, 7, 6, 20, 33),
+            datetime(2012, 7, 6, 20, 34),
+            datetime(2012, 7, 6, 20, 35)])
+        # The first poll waits for the current step to finish, the rest wait
+        # one step.
+        self.assertEqual(self.clock.sleeps, [46, 60, 60])
+        self.assertEqual([c['start'] for c in self.calls], [
+            "2012-07-06T20:33:00",
+            "2012-07-06T20:34:00",
+            "2012-07-06T20:35:00"])
+
+    def test_follow_metric_aware_start(self):
+        metrics = self.c.follow_metric(Sum(EventExpression('request')),
+                time_utils.STEP_1_MIN, start=time_utils.parse_time(
+                    "2012-07-06T22:29:30+02:00"), sleep=self.clock.sleep)
+        first = list(itertools.islice(metrics, 2))
+        self.assertEqual(self.calls[0]['start'], "2012-07-06T20:29:00")
+        self.assertEqual([m.time for m in first], [
+            datetime(2012, 7, 6, 20, 29),
+            datetime(2012, 7, 6, 20, 30)])
+
+    def test_follow_metric_catches_up(self):
+        metrics = self.c.follow_metric(Sum(EventExpression('request')),
+                time_utils.STEP_1_MIN, start=datetime(2012, 7, 6, 20, 30),
+                sleep=self.clock.sleep)
+        first = list(itertools.islice(metrics, 3))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(first[-1].time, datetime(2012, 7, 6, 20, 32))
+
+    def test_follow_events(self):
+        start = self.clock.now
+        self.events = [Event('request', start + timedelta(seconds=i),
+            {'n': i}) for i in range(5)]
+        events = self.c.follow_events(EventExpression('request'),
+                sleep=self.clock.sleep, min_interval=1, max_interval=4)
+        seen = list(itertools.islice(events, 5))
+        self.assertEqual([e.data['n'] for e in seen], range(5))
+        self.assertEqual(self.clock.sleeps, [1, 1, 1, 1])
+
+        # Nothing new: back off
+        self.clock.now += timedelta(seconds=10)
+        self.events.append(Event('request', self.clock.now + timedelta(
+            seconds=12), {'n': 5}))
+        self.assertEqual(next(events).data['n'], 5)
+        self.assertEqual(self.clock.sleeps[4:], [1, 2, 4, 4, 4])
+        # Polls that find Events ask once more, for any older ones.
+        self.assertEqual(len(self.calls), 16)
+
+    def test_follow_events_same_time(self):
+        start = self.clock.now
+        self.events = [Event('request', start, {'n': 1})]
+        events = self.c.follow_events(EventExpression('request'),
+                sleep=self.clock.sleep)
+        self.assertEqual(next(events).data['n'], 1)
+        self.events.append(Event('request', start, {'n': 2}))
+        self.assertEqual(next(events).data['n'], 2)
+        self.assertEqual(self.calls[-1]['start'], start.isoformat())
+
+    def test_follow_events_pages(self):
+        start = self.clock.now
+        self.events = [Event('request', start + timedelta(seconds=i // 2),
+            {'n': i}) for i in range(10)]
+        self.clock.now += timedelta(seconds=10)
+        events = self.c.follow_events(EventExpression('request'),
+                start=start, limit=3, sleep=self.clock.sleep)
+        seen = list(itertools.islice(events, 10))
+        self.assertEqual(sorted(e.data['n'] for e in seen), range(10))
+        self.assertEqual([e.time for e in seen],
+                sorted(e.time for e in seen))
+        self.assertEqual(self.clock.sleeps, [])
+
+
+class TestFollowStub(unittest.TestCase):
+    def setUp(self):
+        self.start = time_utils.now().replace(microsecond=0) + \
+                timedelta(minutes=1)
+        self.stub = StubCube(synthetic_events(10, self.start)).start()
+        self.c = Cube('127.0.0.1', port=self.stub.port)
+        self.sleeps = []
+
+    def tearDown(self):
+        self.c.close()
+        self.stub.stop()
+
+    def test_follow_events_aware(self):
+        """Cube's times end in "Z"; the default start is naive."""
+        events = self.c.follow_events(EventExpression('request'),
+                sleep=self.sleeps.append)
+        seen = list(itertools.islice(events, 10))
+        self.assertEqual([e.data['elapsed_ms'] for e in seen], range(10))
+        self.assertEqual(seen[0].time.tzinfo, tzutc())
+
+    def test_follow_events_server_cap(self):
+        self.stub.max_records = 4
+        events = self.c.follow_events(EventExpression('request'),
+                start=self.start, limit=3, sleep=self.sleeps.append)
+        seen = list(itertools.islice(events, 10))
+        self.assertEqual([e.data['elapsed_ms'] for e in seen], range(10))
+        self.assertEqual(self.sleeps, [])
+        self.stub.put(synthetic_events(5, self.start + timedelta(
+            seconds=10)))
+        self.assertEqual([e.data['elapsed_ms'] for e in
+            itertools.islice(events, 5)], range(5))
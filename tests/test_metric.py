@@ -1,6 +1,9 @@
 import json
+import pickle
 import unittest
 
+from pypercube.metric import FrozenMetric
+from pypercube.metric import InvalidMetricError
 from pypercube.metric import Metric
 from pypercube import time_utils
 
@@ -48,3 +51,32 @@ class TestMetric(unittest.TestCase):
         load_m1 = Metric.from_json(json_str)
         self.assertEqual(load_m1, m1)
         self.assertEqual(load_m1, m2)
+
+    def test_slots(self):
+        m = Metric(time_utils.now(), 1)
+        self.assertFalse(hasattr(m, '__dict__'))
+        self.assertRaises(AttributeError, setattr, m, 'foo', 1)
+
+    def test_pickle(self):
+        m = Metric('2012-07-06T20:33:00.000Z', 12345)
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(m, protocol))
+            self.assertTrue(isinstance(copy, Metric))
+            self.assertEqual(copy, m)
+
+    def test_freeze(self):
+        now = time_utils.now()
+        m = Metric(now, 12345)
+        frozen = m.freeze()
+        self.assertTrue(isinstance(frozen, FrozenMetric))
+        self.assertEqual(frozen.time, now)
+        self.assertEqual(frozen.value, 12345)
+        self.assertEqual(frozen, FrozenMetric(now.isoformat(), 12345))
+        self.assertEqual(frozen.thaw(), m)
+        self.assertEqual(frozen.to_json(), m.to_json())
+        self.assertEqual(FrozenMetric.from_json(str(m)), frozen)
+        self.assertEqual(len(set([frozen, m.freeze()])), 1)
+        self.assertNotEqual(frozen, Metric(now, 1).freeze())
+        self.assertRaises(AttributeError, setattr, frozen, 'value', 1)
+        self.assertRaises(InvalidMetricError, FrozenMetric.from_json,
+                '{"value": 1}')
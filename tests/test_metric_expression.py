@@ -70,3 +70,10 @@ class TestMetricExpressions(unittest.TestCase):
                 "sum(request(elapsed_ms).eq(path, \"/\"))")
         self.assertEqual("%s" % Sum(e2),
                 "sum(request(elapsed_ms).eq(path, \"/\").gt(elapsed_ms, 500))")
+
+    def test_immutable(self):
+        m = Sum(self.e)
+        self.assertRaises(AttributeError, setattr, m, 'metric_type', 'min')
+        c = m + m
+        self.assertRaises(AttributeError, setattr, c, 'operator', '-')
+        self.assertEqual(hash(Sum(EventExpression('request'))), hash(m))
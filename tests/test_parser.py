@@ -0,0 +1,117 @@
+import unittest
+
+from pypercube.expression import CompoundMetricExpression
+from pypercube.expression import Distinct
+from pypercube.expression import EventExpression
+from pypercube.expression import Max
+from pypercube.expression import Median
+from pypercube.expression import Min
+from pypercube.expression import Sum
+from pypercube import parser
+from pypercube.parser import parse
+from pypercube.parser import parse_event
+from pypercube.parser import parse_metric
+from pypercube.parser import ParseError
+
+
+class TestParser(unittest.TestCase):
+    def setUp(self):
+        parser.cache.clear()
+        self.e = EventExpression('request', 'elapsed_ms')
+        self.f = EventExpression('request').eq('path', '/')
+
+    def test_event_round_trip(self):
+        for e in [
+                EventExpression('request'),
+                EventExpression('request', ['path', 'elapsed_ms']),
+                EventExpression('request', 'data.path').eq('status', 200),
+                EventExpression('request').ne('ok', False).lt('x', 1.5)
+                    .le('y', -2).gt('z', 'a').ge('w', None),
+                EventExpression('request').re('path', '^/api\\("')
+                    .in_array('status', [500, "503", 504.5]),
+                EventExpression('request').contains('path', 'a, b)'),
+                ]:
+            parsed = parse_event(str(e))
+            self.assertEqual(parsed, e)
+            self.assertEqual(str(parsed), str(e))
+
+    def test_metric_round_trip(self):
+        for m in [
+                Sum(self.e),
+                Min(self.f),
+                Max(self.e) - Median(self.f),
+                Distinct(self.f) * 2,
+                (Sum(self.e) + Min(self.e)) / (Max(self.e) - 1.5),
+                Sum(self.e) * 0,
+                Sum(self.e) - Max(self.f) * Min(self.e) / Sum(self.f),
+                ]:
+            parsed = parse_metric(str(m))
+            self.assertEqual(parsed, m)
+            self.assertEqual(str(parsed), str(m))
+
+    def test_filter_classes(self):
+        e = parse_event('request.in(status, [500, 503]).re(path, "^/")')
+        self.assertEqual([f.__class__.__name__ for f in e.filters],
+                ['IN', 'RE'])
+
+    def test_precedence(self):
+        self.assertEqual(
+                str(parse_metric('sum(a) + sum(b) * 2 - max(c) / 3')),
+                '((sum(a) + (sum(b) * 2)) - (max(c) / 3))')
+        self.assertEqual(str(parse_metric('(sum(a) + sum(b)) * 2')),
+                '((sum(a) + sum(b)) * 2)')
+
+    def test_whitespace(self):
+        self.assertEqual(
+                parse_metric(' ( sum ( request ( elapsed_ms ) '
+                    '.eq( path ,"/" ) )*2 ) '),
+                Sum(EventExpression('request', 'elapsed_ms')
+                    .eq('path', '/')) * 2)
+
+    def test_numbers(self):
+        self.assertEqual(str(parse_metric('(sum(a) * -2)')),
+                '(sum(a) * -2)')
+        self.assertEqual(str(parse_metric('(sum(a) / 0.5)')),
+                '(sum(a) / 0.5)')
+        self.assertEqual(str(parse_metric('(1e3 - sum(a))')),
+                '(1000.0 - sum(a))')
+        self.assertEqual(str(parse_metric('2')), '2')
+
+    def test_errors(self):
+        for text in ['', 'sum(', 'sum(a', 'sum(a) +', 'avg(a)',
+                'sum(a).eq(b, 1)', 'sum(a.foo(b, 1))', 'sum(a.eq(b 1))',
+                'sum(a.eq(b, nope))', 'sum(a) sum(b)', '(sum(a)']:
+            self.assertRaises(ParseError, parse_metric, text)
+        for text in ['', 'a(', 'a(b', 'a.eq(b, 1', 'a b', '1']:
+            self.assertRaises(ParseError, parse_event, text)
+        self.assertRaises(ValueError, parse, 'a.eq(b)')
+
+    def test_error_position(self):
+        try:
+            parse_metric('sum(a) + avg(b)')
+        except ParseError, e:
+            self.assertTrue("position 9" in str(e))
+        else:
+            self.fail()
+
+    def test_parse(self):
+        self.assertEqual(parse('sum(request)'),
+                Sum(EventExpression('request')))
+        self.assertEqual(parse('request(elapsed_ms)'),
+                EventExpression('request', 'elapsed_ms'))
+        self.assertEqual(parse_event('sum(request)'),
+                EventExpression('sum', 'request'))
+        self.assertTrue(isinstance(parse('(sum(a) * 2)'),
+            CompoundMetricExpression))
+
+    def test_cache(self):
+        text = '(sum(request) + max(request(elapsed_ms)))'
+        self.assertTrue(parse_metric(text) is parse_metric(text))
+        self.assertFalse(parse_event('sum(request)') is
+                parse_metric('sum(request)'))
+
+    def test_cache_bound(self):
+        cache = parser._ParseCache(maxsize=2)
+        for text in ['sum(a)', 'sum(b)', 'sum(c)']:
+            cache.get(text, lambda: parse_metric(text))
+        self.assertEqual(cache._data.keys(), ['sum(b)', 'sum(c)'])
@@ -0,0 +1,117 @@
+from datetime import datetime
+import unittest
+
+from pypercube.event import Event
+from pypercube.expression import Distinct
+from pypercube.expression import EventExpression
+from pypercube.expression import Max
+from pypercube.expression import Median
+from pypercube.expression import Min
+from pypercube.expression import Sum
+from pypercube.reduction import _select
+from pypercube.reduction import combine
+from pypercube.reduction import compute_metric
+from pypercube.reduction import compute_metrics
+from pypercube.time_utils import STEP_1_MIN
+from pypercube.metric import Metric
+
+
+class TestReduction(unittest.TestCase):
+    def setUp(self):
+        self.events = [
+                Event('request', datetime(2012, 7, 6, 20, 33, 10),
+                    {'elapsed_ms': 10, 'path': '/a', 'user': {'id': 1}}),
+                Event('request', datetime(2012, 7, 6, 20, 33, 40),
+                    {'elapsed_ms': 30, 'path': '/b', 'user': {'id': 2}}),
+                Event('request', datetime(2012, 7, 6, 20, 35, 5),
+                    {'elapsed_ms': 20, 'path': '/a', 'user': {'id': 1}}),
+                Event('other', datetime(2012, 7, 6, 20, 33, 10),
+                    {'elapsed_ms': 1000}),
+                ]
+        self.request = EventExpression('request', 'elapsed_ms')
+
+    def test_sum_count(self):
+        metrics = compute_metric(self.events, Sum(EventExpression('request')),
+                STEP_1_MIN)
+        self.assertEqual(metrics, [
+            Metric(datetime(2012, 7, 6, 20, 33), 2),
+            Metric(datetime(2012, 7, 6, 20, 35), 1)])
+
+    def test_reducers(self):
+        results = compute_metrics(self.events, [Sum(self.request),
+            Min(self.request), Max(self.request), Median(self.request)],
+            STEP_1_MIN)
+        self.assertEqual([[m.value for m in r] for r in results],
+                [[40, 20], [10, 20], [30, 20], [20.0, 20]])
+
+    def test_distinct(self):
+        metrics = compute_metric(self.events,
+                Distinct(EventExpression('request', 'path')), STEP_1_MIN)
+        self.assertEqual([m.value for m in metrics], [2, 1])
+        metrics = compute_metric(self.events,
+                Distinct(EventExpression('request', 'user')), STEP_1_MIN)
+        self.assertEqual([m.value for m in metrics], [2, 1])
+
+    def test_filters_and_nested_properties(self):
+        e = EventExpression('request', 'user.id').eq('path', '/a')
+        metrics = compute_metric(self.events, Sum(e), STEP_1_MIN)
+        self.assertEqual([m.value for m in metrics], [1, 1])
+
+    def test_missing_and_non_numeric_values_are_skipped(self):
+        events = self.events + [
+                Event('request', datetime(2012, 7, 6, 20, 33), {}),
+                Event('request', datetime(2012, 7, 6, 20, 33),
+                    {'elapsed_ms': 'slow'})]
+        metrics = compute_metric(events, Max(self.request), STEP_1_MIN)
+        self.assertEqual([m.value for m in metrics], [30, 20])
+
+    def test_window_fills_empty_steps(self):
+        start = datetime(2012, 7, 6, 20, 32, 30)
+        stop = datetime(2012, 7, 6, 20, 35)
+        sums, maxes = compute_metrics(self.events,
+                [Sum(self.request), Max(self.request)], STEP_1_MIN,
+                start, stop)
+        self.assertEqual([m.time for m in sums], [
+            datetime(2012, 7, 6, 20, 32), datetime(2012, 7, 6, 20, 33),
+            datetime(2012, 7, 6, 20, 34)])
+        self.assertEqual([m.value for m in sums], [0, 40, 0])
+        self.assertEqual([m.value for m in maxes], [None, 30, None])
+
+    def test_compound(self):
+        e = EventExpression('request')
+        metrics = compute_metric(self.events, Sum(self.request) / Sum(e),
+                STEP_1_MIN)
+        self.assertEqual([m.value for m in metrics], [20.0, 20.0])
+
+    def test_single_pass(self):
+        events = iter(self.events)
+        results = compute_metrics(events, [Sum(self.request),
+            Max(self.request)], STEP_1_MIN)
+        self.assertEqual([len(r) for r in results], [2, 2])
+
+    def test_invalid_step(self):
+        self.assertRaises(ValueError, compute_metric, self.events,
+                Sum(self.request), 1234)
+
+    def test_select(self):
+        for values in ([5, 1, 4, 2, 3], [2, 2, 2, 1], [7], [3, 1, 2, 1, 3]):
+            ordered = sorted(values)
+            for k in range(len(values)):
+                self.assertEqual(_select(list(values), k), ordered[k])
+
+    def test_median_even(self):
+        events = [Event('request', datetime(2012, 7, 6, 20, 33, s),
+            {'elapsed_ms': v}) for s, v in enumerate([4, 1, 3, 2])]
+        metrics = compute_metric(events, Median(self.request), STEP_1_MIN)
+        self.assertEqual(metrics[0].value, 2.5)
+
+    def test_combine(self):
+        a, b = Sum(EventExpression('a')), Sum(EventExpression('b'))
+        t1 = datetime(2012, 7, 6, 20, 33)
+        t2 = datetime(2012, 7, 6, 20, 34)
+        results = combine([a + b, a], {
+            a: [Metric(t1, 1), Metric(t2, 2)],
+            b: [Metric(t2, 3)]})
+        self.assertEqual(results, [
+            [Metric(t1, None), Metric(t2, 5)],
+            [Metric(t1, 1), Metric(t2, 2)]])
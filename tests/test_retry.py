@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+
+import requests
+
+from pypercube.retry import RetryPolicy
+
+from tests import MockResponse
+
+
+class FakeSend(object):
+    """Returns (or raises) each of `outcomes` in turn."""
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+            self.calls += 1
+        delay, result = outcome if isinstance(outcome, tuple) \
+                else (0, outcome)
+        if delay:
+            time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return MockResponse(ok=result < 400, status_code=result)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.policy = RetryPolicy(retries=3, backoff=0.5, max_backoff=3,
+                jitter=False, sleep=self.sleeps.append)
+
+    def test_delay(self):
+        self.assertEqual([self.policy.delay(a) for a in range(5)],
+                [0.5, 1, 2, 3, 3])
+        policy = RetryPolicy(backoff=1, jitter=True)
+        for attempt in range(5):
+            delay = policy.delay(attempt)
+            self.assertTrue(0 <= delay <= min(5, 2 ** attempt))
+
+    def test_success(self):
+        send = FakeSend(200)
+        self.assertEqual(self.policy.call(send).status_code, 200)
+        self.assertEqual(send.calls, 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_retries_server_errors(self):
+        send = FakeSend(503, 500, 200)
+        self.assertEqual(self.policy.call(send).status_code, 200)
+        self.assertEqual(send.calls, 3)
+        self.assertEqual(self.sleeps, [0.5, 1])
+
+    def test_gives_up(self):
+        send = FakeSend(502)
+        self.assertEqual(self.policy.call(send).status_code, 502)
+        self.assertEqual(send.calls, 4)
+        self.assertEqual(self.sleeps, [0.5, 1, 2])
+
+    def test_client_errors_are_not_retried(self):
+        send = FakeSend(400)
+        self.assertEqual(self.policy.call(send).status_code, 400)
+        self.assertEqual(send.calls, 1)
+
+    def test_retries_connection_errors(self):
+        send = FakeSend(requests.ConnectionError(), requests.Timeout(), 200)
+        self.assertEqual(self.policy.call(send).status_code, 200)
+        send = FakeSend(requests.Timeout())
+        self.assertRaises(requests.Timeout, self.policy.call, send)
+        self.assertEqual(send.calls, 4)
+
+    def test_hedge(self):
+        policy = RetryPolicy(retries=0, hedge_after=0.01)
+        send = FakeSend((0.5, 200), (0, 201))
+        started = time.time()
+        self.assertEqual(policy.call(send).status_code, 201)
+        self.assertTrue(time.time() - started < 0.4)
+        self.assertEqual(send.calls, 2)
+
+    def test_no_hedge_when_fast(self):
+        policy = RetryPolicy(retries=0, hedge_after=1)
+        send = FakeSend(200)
+        self.assertEqual(policy.call(send).status_code, 200)
+        self.assertEqual(send.calls, 1)
+
+    def test_hedge_outlives_failure(self):
+        policy = RetryPolicy(retries=0, hedge_after=0.01)
+        send = FakeSend((0.05, requests.ConnectionError()), (0.1, 200))
+        self.assertEqual(policy.call(send).status_code, 200)
+
+    def test_hedge_error_is_raised(self):
+        policy = RetryPolicy(retries=0, hedge_after=1)
+        send = FakeSend(requests.ConnectionError())
+        self.assertRaises(requests.ConnectionError, policy.call, send)
+
+    def test_hedge_quantile(self):
+        policy = RetryPolicy(hedge_after=7, hedge_quantile=0.95, window=50)
+        self.assertEqual(policy.hedge_delay(), 7)
+        policy._latencies.extend(i / 100.0 for i in range(1, 101))
+        self.assertEqual(policy.hedge_delay(), 0.98)
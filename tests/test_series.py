@@ -0,0 +1,171 @@
+from datetime import datetime
+import json
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pypercube.cube import Cube
+from pypercube.cube import Query
+from pypercube.expression import EventExpression
+from pypercube.expression import Sum
+from pypercube.metric import Metric
+from pypercube import series
+from pypercube.series import MetricSeries
+from pypercube import time_utils
+
+from tests import MockResponse
+from tests import mock_get
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestMetricSeries(unittest.TestCase):
+    def setUp(self):
+        self.start = datetime(2012, 7, 6, 20, 30)
+        self.start_ms = time_utils.to_epoch_ms(self.start)
+        self.step = time_utils.STEP_1_MIN
+        self.times = [self.start_ms + i * self.step for i in range(10)]
+        self.series = MetricSeries(self.times, [0, 1, 2, None, 4, 5, 6, 7, 8,
+            9], self.step)
+
+    def test_init(self):
+        self.assertEqual(self.series.times.dtype, numpy.int64)
+        self.assertEqual(self.series.values.dtype, numpy.float64)
+        self.assertTrue(numpy.isnan(self.series.values[3]))
+        self.assertEqual(self.series.step, self.step)
+        self.assertRaises(ValueError, MetricSeries, [1, 2], [1])
+
+    def test_from_json(self):
+        records = [{"time": "2012-07-06T20:30:00.000Z", "value": 10},
+                {"time": "2012-07-06T20:31:00.000Z", "value": None},
+                {"time": "2012-07-06T20:32:00.000Z"}]
+        for json_obj in (records, json.dumps(records)):
+            s = MetricSeries.from_json(json_obj, self.step)
+            self.assertEqual(list(s.times), self.times[:3])
+            self.assertEqual(s.values[0], 10)
+            self.assertTrue(numpy.isnan(s.values[1:]).all())
+
+    def test_concat(self):
+        joined = MetricSeries.concat([self.series[:4], self.series[3:7],
+            self.series[7:]], self.step)
+        self.assertEqual(joined, self.series)
+        self.assertEqual(len(MetricSeries.concat([])), 0)
+
+    def test_metrics_round_trip(self):
+        metrics = self.series.to_metrics()
+        self.assertEqual(len(metrics), 10)
+        self.assertEqual(metrics[0], Metric(self.start, 0))
+        self.assertEqual(metrics[3].value, None)
+        self.assertEqual(MetricSeries.from_metrics(metrics, self.step),
+                self.series)
+        self.assertEqual(list(self.series), metrics)
+        self.assertEqual(self.series.datetimes[1],
+                datetime(2012, 7, 6, 20, 31))
+
+    def test_indexing(self):
+        self.assertEqual(self.series[1],
+                Metric(datetime(2012, 7, 6, 20, 31), 1))
+        self.assertEqual(self.series[-1].value, 9)
+        self.assertRaises(IndexError, self.series.__getitem__, 10)
+        sliced = self.series[2:5]
+        self.assertTrue(isinstance(sliced, MetricSeries))
+        self.assertEqual(list(sliced.times), self.times[2:5])
+        masked = self.series[self.series.values > 6]
+        self.assertEqual(list(masked.values), [7, 8, 9])
+
+    def test_between(self):
+        window = self.series.between(datetime(2012, 7, 6, 20, 32),
+                datetime(2012, 7, 6, 20, 35))
+        self.assertEqual(list(window.times), self.times[2:5])
+        self.assertEqual(len(self.series.between(stop=self.times[2])), 2)
+        self.assertEqual(len(self.series.between(start=self.times[8])), 2)
+
+    def test_resample(self):
+        s = self.series.resample(time_utils.STEP_5_MIN)
+        self.assertEqual(list(s.times), [self.times[0], self.times[5]])
+        self.assertEqual(list(s.values), [7, 35])
+        self.assertEqual(s.step, time_utils.STEP_5_MIN)
+        self.assertEqual(list(self.series.resample(time_utils.STEP_5_MIN,
+            "count").values), [4, 5])
+        self.assertEqual(list(self.series.resample(time_utils.STEP_5_MIN,
+            "mean").values), [7 / 4.0, 7])
+        self.assertEqual(list(self.series.resample(time_utils.STEP_5_MIN,
+            "min").values), [0, 5])
+        self.assertEqual(list(self.series.resample(time_utils.STEP_5_MIN,
+            "max").values), [4, 9])
+        empty = MetricSeries([self.start_ms], [None]).resample(self.step)
+        self.assertTrue(numpy.isnan(empty.values[0]))
+        self.assertRaises(ValueError, self.series.resample, self.step,
+                "median")
+
+    def test_arithmetic(self):
+        doubled = self.series * 2
+        self.assertEqual(doubled.values[9], 18)
+        self.assertEqual((2 * self.series).values[9], 18)
+        self.assertEqual((self.series + self.series).values[9], 18)
+        self.assertEqual((self.series - 1).values[0], -1)
+        self.assertEqual((10 - self.series).values[0], 10)
+        self.assertEqual((self.series / 2).values[1], 0.5)
+        self.assertEqual((1 / self.series).values[2], 0.5)
+        self.assertEqual((-self.series).values[1], -1)
+        self.assertTrue(numpy.isnan(doubled.values[3]))
+        self.assertTrue(numpy.isinf((self.series / 0).values[1]))
+
+    def test_alignment(self):
+        shifted = self.series[5:] * 1
+        combined = self.series[:8] + shifted
+        self.assertEqual(list(combined.times), self.times[5:8])
+        self.assertEqual(list(combined.values), [10, 12, 14])
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestCubeSeries(unittest.TestCase):
+    def setUp(self):
+        self.c = Cube('testing.com')
+        self._query_get = Query.get
+
+    def tearDown(self):
+        Query.get = self._query_get
+
+    def test_get_metric_as_series(self):
+        content = '[{"time":"2012-07-06T20:30:00.000Z","value":100},'\
+                '{"time":"2012-07-06T20:31:00.000Z","value":null}]'
+        Query.get = mock_get(MockResponse(ok=True, status_code=200,
+            content=content, json=json.loads(content)))
+        series = self.c.get_metric(Sum(EventExpression('test')),
+                step=time_utils.STEP_1_MIN, as_series=True)
+        self.assertTrue(isinstance(series, MetricSeries))
+        self.assertEqual(len(series), 2)
+        self.assertEqual(series.step, time_utils.STEP_1_MIN)
+        self.assertEqual(series.values[0], 100)
+        self.assertTrue(numpy.isnan(series.values[1]))
+
+    def test_get_metric_as_series_empty(self):
+        Query.get = mock_get(MockResponse(ok=True, status_code=200,
+            content="[]", json=[]))
+        series = self.c.get_metric(Sum(EventExpression('test')),
+                as_series=True)
+        self.assertEqual(len(series), 0)
+
+
+class TestWithoutNumpy(unittest.TestCase):
+    def setUp(self):
+        self._numpy = series.numpy
+        series.numpy = None
+        self._query_get = Query.get
+
+    def tearDown(self):
+        series.numpy = self._numpy
+        Query.get = self._query_get
+
+    def test_as_series(self):
+        content = '[{"time":"2012-07-06T20:30:00.000Z","value":100}]'
+        Query.get = mock_get(MockResponse(ok=True, status_code=200,
+            content=content, json=json.loads(content)))
+        self.assertRaises(ImportError, Cube('testing.com').get_metric,
+                Sum(EventExpression('test')), step=time_utils.STEP_1_MIN,
+                as_series=True)
+        self.assertRaises(ImportError, MetricSeries.from_json, content)
+        self.assertRaises(ImportError, MetricSeries.concat, [])
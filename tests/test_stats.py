@@ -0,0 +1,70 @@
+import unittest
+
+from pypercube.stats import QueryStats
+from pypercube.stats import StatsAggregator
+from pypercube.stats import percentile
+
+
+def make_stats(expression, latency, bytes=100, error=None):
+    stats = QueryStats("metric/get", expression, {"step": "60000"})
+    stats.latency = latency
+    stats.bytes = bytes
+    stats.records = 10
+    stats.error = error
+    return stats
+
+
+class TestPercentile(unittest.TestCase):
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile(values, 1), 100)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile([None, 3], 0.5), 3)
+        self.assertEqual(percentile([], 0.5), None)
+
+
+class TestStatsAggregator(unittest.TestCase):
+    def setUp(self):
+        self.stats = StatsAggregator(window=50)
+        for i in range(100):
+            self.stats(make_stats("sum(request)", i / 100.0))
+        self.stats(make_stats("max(request)", 5.0, bytes=10000,
+            error=ValueError()))
+
+    def test_summary(self):
+        summary = self.stats.summary(quantiles=(0.5,))
+        self.assertEqual(sorted(summary), ["max(request)", "sum(request)"])
+        entry = summary["sum(request)"]
+        self.assertEqual(entry["count"], 100)
+        self.assertEqual(entry["errors"], 0)
+        self.assertEqual(entry["bytes"], 10000)
+        self.assertEqual(entry["records"], 1000)
+        self.assertAlmostEqual(entry["total_latency"], 49.5)
+        # Only the last 50 queries are kept for percentiles.
+        self.assertEqual(entry["latency"], {0.5: 0.74})
+        self.assertEqual(summary["max(request)"]["errors"], 1)
+
+    def test_percentiles(self):
+        self.assertEqual(self.stats.percentiles("sum(request)",
+            quantiles=(0.5, 1)), [0.74, 0.99])
+        self.assertEqual(self.stats.percentiles("sum(request)", "bytes",
+            (0.5,)), [100])
+
+    def test_top(self):
+        self.assertEqual([e for e, _ in self.stats.top(2)],
+                ["sum(request)", "max(request)"])
+        self.assertEqual([e for e, _ in self.stats.top(1, by="bytes")],
+                ["max(request)"])
+
+    def test_reset(self):
+        self.stats.reset()
+        self.assertEqual(self.stats.expressions(), [])
+
+    def test_to_json(self):
+        json_obj = make_stats("sum(request)", 1.5, error=ValueError("x"))\
+                .to_json()
+        self.assertEqual(json_obj["latency"], 1.5)
+        self.assertEqual(json_obj["error"], "ValueError('x',)")
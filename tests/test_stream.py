@@ -0,0 +1,55 @@
+import json
+import unittest
+
+from pypercube.stream import iter_json_array
+
+
+def split(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestIterJsonArray(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+                {"time": "2012-07-06T20:33:16.573Z", "type": "request",
+                    "data": {"path": "/", "elapsed_ms": 83.488}},
+                {"time": "2012-07-06T20:33:17.000Z", "type": "request",
+                    "data": {"path": u"/caf\xe9", "tags": ["a", "]", ","]}},
+                12345,
+                "a string, with [brackets]",
+                None,
+                [1, [2, 3]]]
+        self.text = json.dumps(self.records)
+
+    def test_whole(self):
+        self.assertEqual(list(iter_json_array([self.text])), self.records)
+
+    def test_any_chunk_size(self):
+        for size in range(1, 20):
+            self.assertEqual(list(iter_json_array(split(self.text, size))),
+                    self.records)
+
+    def test_multibyte_split(self):
+        text = json.dumps([u"caf\xe9"], ensure_ascii=False).encode('utf-8')
+        self.assertEqual(list(iter_json_array(split(text, 1))),
+                [u"caf\xe9"])
+
+    def test_trailing_number(self):
+        self.assertEqual(list(iter_json_array(["[1, 23", "45]"])),
+                [1, 2345])
+
+    def test_empty(self):
+        self.assertEqual(list(iter_json_array(["[]"])), [])
+        self.assertEqual(list(iter_json_array([" \n[", " ", "]"])), [])
+
+    def test_is_lazy(self):
+        def chunks():
+            yield '[{"n": 1},'
+            raise AssertionError("Read too far")
+        self.assertEqual(next(iter_json_array(chunks())), {"n": 1})
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, list, iter_json_array(['{"a": 1}']))
+        self.assertRaises(ValueError, list, iter_json_array(['[1, 2']))
+        self.assertRaises(ValueError, list, iter_json_array(['[{"a": ']))
+        self.assertRaises(ValueError, list, iter_json_array([]))
@@ -0,0 +1,131 @@
+from datetime import datetime
+from datetime import timedelta
+import json
+import time
+import unittest
+
+import requests
+
+from pypercube.cube import Cube
+from pypercube.cube import InvalidQueryError
+from pypercube.event import Event
+from pypercube.expression import EventExpression
+from pypercube.expression import Max
+from pypercube.expression import Sum
+from pypercube.retry import RetryPolicy
+from pypercube.stub_server import StubCube
+from pypercube.stub_server import synthetic_events
+from pypercube import time_utils
+
+
+class TestStubCube(unittest.TestCase):
+    def setUp(self):
+        self.start = datetime(2012, 7, 6, 20, 0)
+        self.stub = StubCube(synthetic_events(600, self.start)).start()
+        self.c = Cube('127.0.0.1', port=self.stub.port)
+        self.request = EventExpression('request', 'elapsed_ms')
+
+    def tearDown(self):
+        self.c.close()
+        self.stub.stop()
+
+    def test_get_event(self):
+        events = self.c.get_event(self.request.eq('path', '/3'),
+                start=self.start, stop=self.start + timedelta(minutes=1))
+        self.assertEqual([e.data for e in events],
+                [{'elapsed_ms': i} for i in (53, 43, 33, 23, 13, 3)])
+        self.assertEqual(events[0].time.replace(tzinfo=None),
+                datetime(2012, 7, 6, 20, 0, 53))
+        self.assertEqual(len(self.c.get_event(self.request,
+            start=self.start, limit=5)), 5)
+
+    def test_iter_events(self):
+        events = list(self.c.iter_events(self.request,
+            start=self.start + timedelta(minutes=9)))
+        self.assertEqual(len(events), 60)
+
+    def test_get_metric(self):
+        stop = self.start + timedelta(minutes=10)
+        metrics = self.c.get_metric(Sum(self.request), self.start, stop,
+                time_utils.STEP_1_MIN)
+        self.assertEqual(len(metrics), 10)
+        self.assertEqual(metrics[0].value, sum(range(60)))
+        compound = self.c.get_metric(
+                Max(self.request) - Sum(EventExpression('request')),
+                self.start, stop, time_utils.STEP_5_MIN)
+        self.assertEqual([m.value for m in compound],
+                [299 - 300, 599 - 300])
+        limited = self.c.get_metric(Sum(EventExpression('request')),
+                self.start, stop, time_utils.STEP_1_MIN, limit=3)
+        self.assertEqual([m.time.minute for m in limited], [7, 8, 9])
+
+    def test_get_metrics(self):
+        expressions = [Sum(EventExpression('request').eq('path', '/%d' % i))
+                for i in range(10)]
+        table = self.c.get_metrics(expressions, self.start,
+                self.start + timedelta(minutes=10), time_utils.STEP_1_MIN)
+        self.assertTrue(table.ok)
+        self.assertEqual(table.rows().next()[1], [6] * 10)
+
+    def test_put(self):
+        self.stub.put([Event('login', self.start, {'user': 'a'})])
+        self.assertEqual(len(self.c.get_event(EventExpression('login'),
+            start=self.start)), 1)
+        response = requests.post(
+                "http://127.0.0.1:{port}/1.0/event/put".format(
+                    port=self.stub.port),
+                data=json.dumps([{'type': 'login', 'time':
+                    '2012-07-06T20:01:00Z', 'data': {'user': 'b'}}]))
+        self.assertEqual(response.status_code, 200)
+        metrics = self.c.get_metric(Sum(EventExpression('login')),
+                self.start, self.start + timedelta(minutes=5),
+                time_utils.STEP_5_MIN)
+        self.assertEqual(metrics[0].value, 2)
+        self.assertEqual(self.stub.requests[-2][2][0]['data'],
+                {'user': 'b'})
+
+    def test_invalid_query(self):
+        self.assertRaises(InvalidQueryError, self.c.get_metric,
+                'sum(request', self.start, step=time_utils.STEP_1_MIN)
+        self.assertRaises(InvalidQueryError, self.c.get_event, 'request.',
+                start=self.start)
+
+    def test_errors(self):
+        self.stub.error_rate = 1.0
+        self.stub.error_status = 503
+        self.assertRaises(InvalidQueryError, self.c.get_event, self.request,
+                start=self.start)
+        self.assertEqual(len(self.stub.requests), 1)
+        self.stub.error_rate = 0.5
+        c = Cube('127.0.0.1', port=self.stub.port, retry=RetryPolicy(
+            retries=20, backoff=0))
+        self.assertEqual(len(c.get_event(self.request, start=self.start,
+            limit=1)), 1)
+        c.close()
+
+    def test_latency(self):
+        self.stub.latency = 0.05
+        started = time.time()
+        self.c.get_event(self.request, start=self.start, limit=1)
+        self.assertTrue(time.time() - started >= 0.05)
+
+    def test_max_records(self):
+        self.stub.max_records = 7
+        self.assertEqual(len(self.c.get_event(self.request,
+            start=self.start)), 7)
+
+    def test_keep_requests(self):
+        stub = StubCube(keep_requests=2).start()
+        c = Cube('127.0.0.1', port=stub.port)
+        for i in range(5):
+            c.get_event(self.request, start=self.start, limit=i + 1)
+        c.close()
+        stub.stop()
+        self.assertEqual(stub.request_count, 5)
+        self.assertEqual([r[2]['limit'] for r in stub.requests], ['4', '5'])
+
+    def test_synthetic_events(self):
+        events = synthetic_events(3, self.start, payload=10)
+        self.assertEqual([e.time.second for e in events], [0, 1, 2])
+        self.assertEqual(events[2].data, {'elapsed_ms': 2, 'path': '/2',
+            'payload': 'x' * 10})
@@ -0,0 +1,45 @@
+from datetime import datetime
+import unittest
+
+from pypercube.metric import Metric
+from pypercube.table import MetricTable
+
+
+class TestMetricTable(unittest.TestCase):
+    def setUp(self):
+        self.t0 = datetime(2012, 7, 6, 20, 33)
+        self.t1 = datetime(2012, 7, 6, 20, 34)
+        self.error = ValueError("bad")
+        self.table = MetricTable.from_metrics([
+            ("a", [Metric(self.t1, 2), Metric(self.t0, 1)]),
+            ("b", [Metric(self.t1, None)]),
+            ("c", self.error)])
+
+    def test_alignment(self):
+        self.assertEqual(self.table.times, [self.t0, self.t1])
+        self.assertEqual(self.table["a"], [1, 2])
+        self.assertEqual(self.table["b"], [None, None])
+        self.assertEqual(len(self.table), 2)
+
+    def test_errors(self):
+        self.assertFalse(self.table.ok)
+        self.assertEqual(self.table.errors, {"c": self.error})
+        self.assertRaises(ValueError, self.table.__getitem__, "c")
+        self.assertTrue("c" in self.table)
+        self.assertFalse("d" in self.table)
+
+    def test_rows(self):
+        self.assertEqual(list(self.table.rows()), [
+            (self.t0, [1, None, None]),
+            (self.t1, [2, None, None])])
+
+    def test_metrics(self):
+        self.assertEqual(self.table.metrics("a"),
+                [Metric(self.t0, 1), Metric(self.t1, 2)])
+
+    def test_empty(self):
+        table = MetricTable.from_metrics([])
+        self.assertTrue(table.ok)
+        self.assertEqual(list(table.rows()), [])
+        self.assertEqual(repr(table),
+                "<MetricTable: 0 rows of 0 expressions, 0 errors>")
@@ -1,6 +1,10 @@
 from datetime import datetime
+from datetime import timedelta
 import unittest
 
+from dateutil import parser as date_parser
+from dateutil.tz import tzutc
+
 from pypercube import time_utils
 
 
@@ -33,3 +37,134 @@ class TestMetric(unittest.TestCase):
                 datetime(2012, 7, 6))
         self.assertRaisesRegexp(ValueError, "is not a valid resolution",
                 time_utils.floor, self.now, 12345)
+
+    def test_parse_time(self):
+        self.assertEqual(time_utils.parse_time(self.now.isoformat()),
+                self.now)
+        self.assertEqual(time_utils.parse_time("2012-07-06T20:33:16"),
+                datetime(2012, 7, 6, 20, 33, 16))
+        self.assertEqual(time_utils.parse_time("2012-07-06 20:33"),
+                datetime(2012, 7, 6, 20, 33))
+        self.assertEqual(time_utils.parse_time("2012-07-06T20:33:16.5"),
+                datetime(2012, 7, 6, 20, 33, 16, 500000))
+        self.assertEqual(
+                time_utils.parse_time("2012-07-06T20:33:16.573225999"),
+                self.now)
+
+    def test_parse_time_zones(self):
+        utc = time_utils.parse_time("2012-07-06T20:33:16.573225Z")
+        self.assertEqual(utc.utcoffset(), timedelta(0))
+        self.assertEqual(utc.replace(tzinfo=None), self.now)
+        for value in ("2012-07-06T13:33:16.573225-07:00",
+                "2012-07-06T13:33:16.573225-0700",
+                "2012-07-06T22:33:16.573225+02",
+                "2012-07-06T20:33:16.573225+00:00"):
+            self.assertEqual(time_utils.parse_time(value), utc)
+
+    def test_parse_time_matches_dateutil(self):
+        for value in ("2012-07-06T20:33:16.573Z",
+                "2012-07-06T20:33:16-0700",
+                "2012-07-06T20:33:16.57322",
+                "2012-07-06T20:33"):
+            self.assertEqual(time_utils.parse_time(value),
+                    date_parser.parse(value, fuzzy=True))
+
+    def test_parse_time_fallback(self):
+        self.assertEqual(time_utils.parse_time("July 6th, 2012 at 8:33pm"),
+                datetime(2012, 7, 6, 20, 33))
+        self.assertRaises(ValueError, time_utils.parse_time,
+                "2012-02-30T00:00:00Z")
+
+    def test_parse_time_cache(self):
+        cache = dict()
+        t1 = time_utils.parse_time("2012-07-06T20:33:16Z", cache)
+        t2 = time_utils.parse_time("2012-07-06T20:33:16Z", cache)
+        self.assertTrue(t1 is t2)
+        self.assertEqual(cache, {"2012-07-06T20:33:16Z": t1})
+
+    def test_epoch_ms(self):
+        ms = time_utils.to_epoch_ms(self.now)
+        self.assertEqual(ms, 1341606796573)
+        self.assertEqual(time_utils.from_epoch_ms(ms),
+                self.now.replace(microsecond=573000))
+        self.assertEqual(time_utils.to_epoch_ms(datetime(1970, 1, 1)), 0)
+        self.assertEqual(time_utils.to_epoch_ms(
+            time_utils.parse_time("2012-07-06T13:33:16.573-07:00")), ms)
+
+    def test_floor_ms(self):
+        ms = time_utils.to_epoch_ms(self.now)
+        for step, _ in time_utils.STEP_CHOICES:
+            self.assertEqual(time_utils.floor_ms(ms, step),
+                    time_utils.to_epoch_ms(time_utils.floor(self.now, step)))
+        self.assertEqual(time_utils.floor_ms(ms, 15 * time_utils.STEP_1_MIN),
+                time_utils.to_epoch_ms(datetime(2012, 7, 6, 20, 30)))
+        self.assertEqual(time_utils.floor_ms(-1, time_utils.STEP_10_SEC),
+                -10000)
+        for resolution in (0, -60000, 1.5, None):
+            self.assertRaises(ValueError, time_utils.floor_ms, ms,
+                    resolution)
+
+    def test_floor_many(self):
+        times = [time_utils.to_epoch_ms(self.now) + i * 7919
+                for i in range(1000)]
+        for step in (time_utils.STEP_10_SEC, time_utils.STEP_1_DAY,
+                2 * time_utils.STEP_1_HOUR):
+            expected = [time_utils.floor_ms(t, step) for t in times]
+            self.assertEqual(time_utils.floor_many(times, step), expected)
+            self.assertEqual(time_utils.floor_many(iter(times), step),
+                    expected)
+        self.assertRaises(ValueError, time_utils.floor_many, times, 0)
+
+    def test_floor_many_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            return
+        times = numpy.array([1341606796573, 1341606799999, 1341606800000],
+                dtype=numpy.int64)
+        floored = time_utils.floor_many(times, time_utils.STEP_10_SEC)
+        self.assertEqual(floored.dtype, numpy.int64)
+        self.assertEqual(floored.tolist(),
+                [1341606790000, 1341606790000, 1341606800000])
+
+    def test_chunk(self):
+        start = datetime(2012, 7, 6, 20, 33, 16)
+        stop = datetime(2012, 7, 6, 23, 2)
+        windows = time_utils.chunk(start, stop, time_utils.STEP_5_MIN,
+                timedelta(hours=1))
+        self.assertEqual(windows, [
+            (start, datetime(2012, 7, 6, 21, 30)),
+            (datetime(2012, 7, 6, 21, 30), datetime(2012, 7, 6, 22, 30)),
+            (datetime(2012, 7, 6, 22, 30), stop)])
+
+        windows = time_utils.chunk(start, stop, time_utils.STEP_1_HOUR,
+                timedelta(minutes=1))
+        self.assertEqual([w[1] for w in windows], [datetime(2012, 7, 6, 21),
+            datetime(2012, 7, 6, 22), datetime(2012, 7, 6, 23), stop])
+
+        self.assertEqual(time_utils.chunk(stop, start,
+            time_utils.STEP_1_MIN, timedelta(hours=1)), [])
+
+    def test_chunk_aware(self):
+        start = time_utils.parse_time("2012-07-06T22:33:16+02:00")
+        stop = time_utils.parse_time("2012-07-06T21:02:00Z")
+        windows = time_utils.chunk(start, stop, time_utils.STEP_1_HOUR,
+                timedelta(minutes=1))
+        utc = tzutc()
+        self.assertEqual(windows, [
+            (start, datetime(2012, 7, 6, 21, tzinfo=utc)),
+            (datetime(2012, 7, 6, 21, tzinfo=utc), stop)])
+        self.assertEqual(windows[0][1].tzinfo, utc)
+
+        # A naive end is taken as UTC
+        windows = time_utils.chunk(start, datetime(2012, 7, 6, 21, 30),
+                time_utils.STEP_1_HOUR, timedelta(minutes=1))
+        self.assertEqual([w[1].isoformat() for w in windows],
+                ["2012-07-06T21:00:00+00:00", "2012-07-06T21:30:00+00:00"])
+
+    def test_to_utc(self):
+        aware = time_utils.to_utc(
+                time_utils.parse_time("2012-07-06T22:33:16+02:00"))
+        self.assertEqual(aware.isoformat(), "2012-07-06T20:33:16+00:00")
+        self.assertEqual(time_utils.to_utc(datetime(2012, 7, 6)).tzinfo,
+                tzutc())